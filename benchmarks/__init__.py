@@ -0,0 +1 @@
+"""Seeded performance benchmarks, see run_benchmarks.py"""
@@ -0,0 +1,172 @@
+"""Runs the benchmark scenarios, stores the results per commit and compares them to a baseline
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_benchmarks                      # all scenarios, compare to benchmarks/results/baseline.json
+    python -m benchmarks.run_benchmarks -s empty_arena six_nstep_plan
+    python -m benchmarks.run_benchmarks --save-baseline      # make this run the new baseline
+
+Results are written to benchmarks/results/<commit>.json. The exit code is 1 if a regression was found.
+"""
+import argparse
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.scenarios import SCENARIOS
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BASELINE_NAME = "baseline.json"
+
+
+def git_commit():
+    """ Hash of the checked-out commit (with suffix '-dirty' if tracked files are modified) or 'unknown'"""
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo_dir,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if status else "")
+
+
+def run_scenario(scenario, measure_memory=True):
+    """ Time every step of `scenario` for all its seeds. Peak memory is measured in a second pass, since tracing
+    allocations slows down the steps."""
+    latencies = []
+    for seed in scenario.seeds:
+        step = scenario.setup(seed)
+        gc.collect()
+        for _ in range(scenario.max_steps):
+            t0 = time.perf_counter()
+            more = step()
+            latencies.append(time.perf_counter() - t0)
+            if not more:
+                break
+
+    latencies = np.asarray(latencies)
+    result = dict(unit=scenario.unit, num_steps=int(latencies.size),
+                  steps_per_second=float(latencies.size / latencies.sum()),
+                  mean_ms=float(latencies.mean() * 1e3),
+                  p50_ms=float(np.percentile(latencies, 50) * 1e3),
+                  p99_ms=float(np.percentile(latencies, 99) * 1e3),
+                  max_ms=float(latencies.max() * 1e3))
+
+    if measure_memory:
+        gc.collect()
+        tracemalloc.start()
+        for seed in scenario.seeds:
+            step = scenario.setup(seed)
+            for _ in range(scenario.max_steps):
+                if not step():
+                    break
+        result['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    return result
+
+
+def run_benchmarks(names=None, measure_memory=True):
+    scenarios = [s for s in SCENARIOS if names is None or s.name in names]
+    unknown = set(names or []) - {s.name for s in scenarios}
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {sorted(unknown)}. Available: {[s.name for s in SCENARIOS]}")
+
+    results = {}
+    for scenario in scenarios:
+        t0 = time.perf_counter()
+        results[scenario.name] = run_scenario(scenario, measure_memory=measure_memory)
+        print(f"{scenario.name}: {results[scenario.name]['steps_per_second']:.1f} {scenario.unit}s/s "
+              f"({time.perf_counter() - t0:.1f} s)")
+    return results
+
+
+def find_regressions(results, baseline, threshold=0.1, latency_threshold=0.25, memory_threshold=0.2):
+    """ List of (scenario, metric, baseline value, current value) that got worse by more than the (relative)
+    thresholds: `threshold` for steps per second, `latency_threshold` for the (noisier) p99 latency and
+    `memory_threshold` for the peak memory."""
+    regressions = []
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if current['steps_per_second'] < (1. - threshold) * base['steps_per_second']:
+            regressions.append((name, 'steps_per_second', base['steps_per_second'], current['steps_per_second']))
+        if current['p99_ms'] > (1. + latency_threshold) * base['p99_ms']:
+            regressions.append((name, 'p99_ms', base['p99_ms'], current['p99_ms']))
+        if 'peak_memory_mb' in current and 'peak_memory_mb' in base and \
+                current['peak_memory_mb'] > (1. + memory_threshold) * base['peak_memory_mb']:
+            regressions.append((name, 'peak_memory_mb', base['peak_memory_mb'], current['peak_memory_mb']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the seeded benchmark scenarios")
+    parser.add_argument("-s", "--scenarios", nargs="+", default=None, help="names of the scenarios to run")
+    parser.add_argument("--baseline", default=None, help="results file to compare to "
+                                                         f"(default: {os.path.join(RESULTS_DIR, BASELINE_NAME)})")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as new baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative decrease of ticks/sec (calls/sec) that counts as regression")
+    parser.add_argument("--latency-threshold", type=float, default=0.25,
+                        help="relative increase of the p99 latency that counts as regression")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory measurement")
+    parser.add_argument("--output-dir", default=RESULTS_DIR)
+    args = parser.parse_args(argv)
+
+    from log import setup_colored_logs
+    # Logging inside the game loop would dominate the timings
+    setup_colored_logs(logging.WARNING)
+
+    commit = git_commit()
+    results = run_benchmarks(args.scenarios, measure_memory=not args.no_memory)
+    report = dict(commit=commit, date=datetime.datetime.now().isoformat(timespec='seconds'),
+                  python=sys.version.split()[0], platform=platform.platform(), processor=platform.processor(),
+                  results=results)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    fp = os.path.join(args.output_dir, f"{commit}.json")
+    with open(fp, "w") as f:
+        json.dump(report, f, indent=2)
+
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.3f}'.format):
+        print(pd.DataFrame.from_dict(results, orient='index'))
+    print(f"\nResults written to {fp}")
+
+    baseline_fp = os.path.join(args.output_dir, BASELINE_NAME) if args.baseline is None else args.baseline
+    regressions = []
+    if os.path.isfile(baseline_fp):
+        with open(baseline_fp) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline['results'], threshold=args.threshold,
+                                       latency_threshold=args.latency_threshold)
+        print(f"\n---- Comparison to baseline (commit {baseline['commit']}) ----")
+        if len(regressions) == 0:
+            print("No regressions")
+        for name, metric, base_value, value in regressions:
+            print(f"REGRESSION {name}.{metric}: {base_value:.3f} -> {value:.3f} ({value / base_value - 1.:+.1%})")
+    elif not args.save_baseline:
+        print(f"\nNo baseline found at {baseline_fp}, use --save-baseline to create one")
+
+    if args.save_baseline:
+        shutil.copyfile(fp, os.path.join(args.output_dir, BASELINE_NAME))
+        print("Saved as new baseline")
+
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""Seeded benchmark scenarios
+
+A scenario is set up once per seed and returns a step function. The benchmark runner times every call of the step
+function, so a step is one game tick in game scenarios and one call of the measured function in micro-benchmarks.
+The step function returns False when the scenario has finished (e.g. the game is over).
+"""
+import copy
+from functools import partial
+from math import cos, sin
+
+import numpy as np
+
+from game import AchtungDieKurveGame
+from players.aiplayers import MCTSPlayer, NStepPlanPlayer, PlanCache, PotentialFieldPlayer, PotentialFieldPolicy, \
+    RandomSteeringAIPlayer
+from players.misc_players import DummyPlayer
+from players.player_base import ReasonOfDeath
+from players.trail_segments import SegmentTrail
+from players.trails import CompactTrail
+
+
+class Scenario:
+    def __init__(self, name, setup, max_steps, seeds=(0, 1, 2), unit="tick"):
+        """
+
+        Args:
+            name (str): name of the scenario (key in the results)
+            setup: function(seed) -> step function
+            max_steps (int): maximum number of timed steps per seed
+            seeds (tuple): the scenario is run once for each seed
+            unit (str): what one step is ('tick' or 'call')
+        """
+        self.name = name
+        self.setup = setup
+        self.max_steps = max_steps
+        self.seeds = seeds
+        self.unit = unit
+
+
+def _headless_game(seed, **game_kwargs):
+    return AchtungDieKurveGame(mode="headless", rng_seed=seed, **game_kwargs)
+
+
+def _game_step(game):
+    game.running = True
+
+    def step():
+        game.tick_forward()
+        return game.running
+    return step
+
+
+def _serpentine(x0, y0, x1, y1, spacing, dist_per_point):
+    """ Points along horizontal lines (spacing `spacing`) that fill the rectangle (x0, y0, x1, y1) and the headings at
+    the points. The lines are walked like players move (one velocity vector added per point)."""
+    num_points = len(np.arange(x0, x1, dist_per_point))
+    rows, angles = [], []
+    for k, y in enumerate(np.arange(y0, y1, spacing)):
+        angle = 0. if k % 2 == 0 else np.pi
+        steps = np.tile(dist_per_point * np.asarray([cos(angle), sin(angle)]), (num_points, 1))
+        steps[0] = x0 if k % 2 == 0 else x0 + (num_points - 1) * dist_per_point, y
+        rows.append(np.cumsum(steps, axis=0))
+        angles.append(np.full(num_points, angle))
+    return np.concatenate(rows), np.concatenate(angles)
+
+
+def _make_trail(game, points, angles):
+    """ Trail in the trail format of the game"""
+    if game.trail_format == 'compact':
+        return CompactTrail.from_points(points)
+    if game.trail_format == 'segments':
+        return SegmentTrail.from_points(points, game.dist_per_tick, game.dphi_per_tick, angles)
+    return [xy for xy in points]
+
+
+def add_dense_trails(game, player_indices=(3, 4, 5, 6), spacing=12.):
+    """ Spawn eliminated players whose trails fill the arena except for a free area in the center, as in the late
+    phase of a round. Returns the free area (x0, y0, x1, y1)."""
+    w, h = game.screen_width, game.screen_height
+    free = (0.3 * w, 0.3 * h, 0.7 * w, 0.7 * h)
+    margin = 3 * game.player_radius
+    bands = [(margin, margin, w - margin, free[1] - margin),                 # top
+             (margin, free[3] + margin, w - margin, h - margin),             # bottom
+             (margin, free[1], free[0] - margin, free[3]),                   # left
+             (free[2] + margin, free[1], w - margin, free[3])]               # right
+    for idx, band in zip(player_indices, bands):
+        trail, angles = _serpentine(*band, spacing=spacing, dist_per_point=game.dist_per_tick)
+        p = game.spawn_player(idx, init_pos=trail[0], init_angle=0., player_type=RandomSteeringAIPlayer)
+        p.trail = _make_trail(game, trail, angles)
+        p.angle_history = list(angles)
+        p.pos = trail[-1].copy()
+        game.disable_player(p, ReasonOfDeath.OpponentCollision)
+    return free
+
+
+def empty_arena(seed):
+    """ One RandomSteeringAIPlayer alone in the arena: baseline cost of a tick"""
+    game = _headless_game(seed, run_until_last_player_dies=True)
+    game.spawn_player(1, player_type=RandomSteeringAIPlayer)
+    return _game_step(game)
+
+
+def six_random_steering(seed, trail_format='list'):
+    game = _headless_game(seed, run_until_last_player_dies=True, trail_format=trail_format)
+    for idx in range(1, 7):
+        game.spawn_player(idx, player_type=RandomSteeringAIPlayer)
+    return _game_step(game)
+
+
+def six_nstep_plan(seed, trail_format='list', plan_cache=None):
+    game = _headless_game(seed, run_until_last_player_dies=True, trail_format=trail_format)
+    for idx in range(1, 7):
+        game.spawn_player(idx, player_type=NStepPlanPlayer, num_steps=2, dist_per_step=40., plan_update_period=0.15,
+                          plan_cache=plan_cache)
+    return _game_step(game)
+
+
+def six_nstep_plan_cached(seed):
+    # A fresh cache per seed (PlanCache.shared() would carry entries over to the next run)
+    return six_nstep_plan(seed, plan_cache=PlanCache(4096))
+
+
+def six_potential_field(seed):
+    game = _headless_game(seed, run_until_last_player_dies=True)
+    for idx in range(1, 7):
+        game.spawn_player(idx, player_type=PotentialFieldPlayer)
+    return _game_step(game)
+
+
+def _late_round_game(seed, trail_format='list'):
+    game = _headless_game(seed, run_until_last_player_dies=True, trail_format=trail_format)
+    x0, y0, x1, y1 = add_dense_trails(game)
+    rng = np.random.default_rng(seed)
+    for idx, player_type in [(0, RandomSteeringAIPlayer), (1, NStepPlanPlayer), (2, NStepPlanPlayer)]:
+        pos = rng.uniform([x0 + 30., y0 + 30.], [x1 - 30., y1 - 30.])
+        game.spawn_player(idx, init_pos=pos, init_angle=rng.uniform(0, 2 * np.pi), player_type=player_type)
+    return game
+
+
+def late_round_dense_trails(seed, trail_format='list'):
+    """ Three active players in the center of an arena that is filled with the trails of eliminated players"""
+    return _game_step(_late_round_game(seed, trail_format))
+
+
+def find_best_plan(seed, trail_format='list'):
+    game = _late_round_game(seed, trail_format)
+    planner = [p for p in game.active_players if isinstance(p, NStepPlanPlayer)][0]
+    game_state = game.get_game_state()
+
+    def step():
+        planner.find_best_plan(game_state)
+        return True
+    return step
+
+
+def mcts_search(seed):
+    """ One search of an MCTSPlayer (default budget) in place of one of the planners of a late round"""
+    game = _late_round_game(seed)
+    p = [p for p in game.active_players if isinstance(p, NStepPlanPlayer)][0]
+    searcher = MCTSPlayer(game=game, idx=p.idx, init_pos=p.pos, init_angle=p.angle, dist_per_tick=game.dist_per_tick,
+                          dphi_per_tick=game.dphi_per_tick, radius=game.player_radius, game_bounds=game.game_bounds,
+                          search_seed=seed)
+
+    def step():
+        searcher.search()
+        return True
+    return step
+
+
+def wall_evasion_actions(seed):
+    """ Evasion checks for random poses in the arena (about a third of them close to a wall)"""
+    game = _headless_game(seed)
+    p = game.spawn_player(1, player_type=RandomSteeringAIPlayer)
+    rng = np.random.default_rng(seed)
+    R = game.min_turn_radius
+    positions = rng.uniform([R, R], [game.screen_width - R, game.screen_height - R], size=(256, 2))
+    angles = rng.uniform(0, 2 * np.pi, size=256)
+    k = 0
+
+    def step():
+        nonlocal k
+        p.pos, p.angle = positions[k % 256].copy(), angles[k % 256]
+        p.wall_evasion_actions(p.min_turn_radius)
+        k += 1
+        return True
+    return step
+
+
+def check_self_collision(seed, trail_format='list'):
+    """ Self-collision check of a player with a trail of several thousand points"""
+    game = _late_round_game(seed, trail_format)
+    p = game.active_players[0]
+    eliminated = [q for q in game.players if q not in game.active_players]
+    p.trail = list(eliminated[0].trail) + [p.pos.copy()]
+    if trail_format == 'compact':
+        p.trail = CompactTrail.from_points(p.trail)
+    elif trail_format == 'segments':
+        p.trail = copy.deepcopy(eliminated[0].trail)
+        p.trail.append(p.pos, p.angle)
+
+    def step():
+        p.check_self_collision()
+        return True
+    return step
+
+
+def raycast_sensor(seed):
+    """ 16 rays for each of the players of a late round (all of them in one call)"""
+    game = _late_round_game(seed)
+    sensor = game.create_raycast_sensor(num_rays=16)
+
+    def step():
+        sensor.sense(hit_types=True)
+        return True
+    return step
+
+
+def potential_field_decisions(seed, num_agents=128):
+    """ Actions of 128 potential field agents at random poses in a late round (all of them in one call)"""
+    game = _late_round_game(seed)
+    policy = PotentialFieldPolicy()
+    rng = np.random.default_rng(seed)
+    p = game.players[0]
+    agents = [DummyPlayer(init_pos=rng.uniform([0, 0], [game.screen_width, game.screen_height]),
+                          init_angle=rng.uniform(0, 2 * np.pi), dist_per_tick=p.dist_per_tick,
+                          dphi_per_tick=p.dphi_per_tick) for _ in range(num_agents)]
+
+    def step():
+        policy.actions(game, agents)
+        return True
+    return step
+
+
+def patch_observer(seed):
+    """ 32 x 32 heading-aligned patches of all players of a late round (all of them in one call)"""
+    game = _late_round_game(seed)
+    observer = game.create_patch_observer(size=32, resolution=4.)
+    out = np.empty((len(game.players), 3, 32, 32), dtype=np.uint8)
+
+    def step():
+        observer.observe(out=out)
+        return True
+    return step
+
+
+def check_player_collision(seed, trail_format='list'):
+    game = _late_round_game(seed, trail_format)
+    p = game.active_players[0]
+    others = [o for o in game.players if o != p]
+
+    def step():
+        for o in others:
+            p.check_player_collision(o)
+        return True
+    return step
+
+
+SCENARIOS = [
+    Scenario("empty_arena", empty_arena, max_steps=3000),
+    Scenario("six_random_steering", six_random_steering, max_steps=3000),
+    Scenario("six_nstep_plan", six_nstep_plan, max_steps=3000),
+    Scenario("six_nstep_plan_cached", six_nstep_plan_cached, max_steps=3000),
+    Scenario("late_round_dense_trails", late_round_dense_trails, max_steps=3000),
+    Scenario("find_best_plan", find_best_plan, max_steps=50, unit="call"),
+    Scenario("mcts_search", mcts_search, max_steps=200, unit="call"),
+    Scenario("wall_evasion_actions", wall_evasion_actions, max_steps=2000, unit="call"),
+    Scenario("check_self_collision", check_self_collision, max_steps=300, unit="call"),
+    Scenario("check_player_collision", check_player_collision, max_steps=300, unit="call"),
+    Scenario("raycast_sensor", raycast_sensor, max_steps=2000, unit="call"),
+    Scenario("patch_observer", patch_observer, max_steps=2000, unit="call"),
+    Scenario("six_potential_field", six_potential_field, max_steps=3000),
+    Scenario("potential_field_decisions", potential_field_decisions, max_steps=2000, unit="call"),
+    # Same scenarios with trail format 'compact'
+    Scenario("late_round_dense_trails_compact", partial(late_round_dense_trails, trail_format='compact'),
+             max_steps=3000),
+    Scenario("find_best_plan_compact", partial(find_best_plan, trail_format='compact'), max_steps=50, unit="call"),
+    Scenario("check_self_collision_compact", partial(check_self_collision, trail_format='compact'), max_steps=300,
+             unit="call"),
+    Scenario("check_player_collision_compact", partial(check_player_collision, trail_format='compact'),
+             max_steps=300, unit="call"),
+    # Same scenarios with trail format 'segments'
+    Scenario("six_random_steering_segments", partial(six_random_steering, trail_format='segments'), max_steps=3000),
+    Scenario("six_nstep_plan_segments", partial(six_nstep_plan, trail_format='segments'), max_steps=3000),
+    Scenario("late_round_dense_trails_segments", partial(late_round_dense_trails, trail_format='segments'),
+             max_steps=3000),
+    Scenario("find_best_plan_segments", partial(find_best_plan, trail_format='segments'), max_steps=50, unit="call"),
+    Scenario("check_self_collision_segments", partial(check_self_collision, trail_format='segments'), max_steps=300,
+             unit="call"),
+    Scenario("check_player_collision_segments", partial(check_player_collision, trail_format='segments'),
+             max_steps=300, unit="call"),
+]
@@ -0,0 +1,5 @@
+from evaluation.tournament import TournamentRunner, make_jobs, summarize_game
+from evaluation.worker_pool import WarmWorkerPool
+from evaluation.sweep import HyperparameterSweep, grid_configs, random_configs
+from evaluation.cached_runner import CachedRunner
+from evaluation.distributed import JobCoordinator, run_worker, start_local_workers
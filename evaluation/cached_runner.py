@@ -0,0 +1,48 @@
+"""Runner wrapper that looks up games in a result cache before scheduling them"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CachedRunner:
+    """ Wraps a TournamentRunner or WarmWorkerPool. Jobs found in the ResultCache are answered from it, only the
+    remaining ones are played by the wrapped runner. Their results are added to the cache.
+
+    Usage:
+        with ResultCache("./result-cache.sqlite") as cache, CachedRunner(TournamentRunner(), cache) as runner:
+            for result in runner.run(jobs):
+                ...
+    """
+
+    def __init__(self, runner, cache):
+        self.runner = runner
+        self.cache = cache
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.runner.close()
+
+    def terminate(self):
+        self.runner.terminate()
+
+    def run(self, jobs):
+        """ Generator that yields the cached result records first, then the records of the played games"""
+        jobs = list(jobs)
+        misses = []
+        for job in jobs:
+            record = self.cache.get(job)
+            if record is None:
+                misses.append(job)
+            else:
+                yield record
+
+        logger.info(f"{len(jobs) - len(misses)} of {len(jobs)} games found in result cache, playing {len(misses)}")
+        jobs_by_id = {job['job_id']: job for job in misses}
+        for record in self.runner.run(misses):
+            self.cache.put(jobs_by_id[record['job_id']], record)
+            yield record
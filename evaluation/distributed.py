@@ -0,0 +1,397 @@
+"""Multi-host evaluation: a coordinator serves game jobs over TCP, workers on any host pull and play them
+
+Protocol: newline-delimited JSON messages, each a dict with a 'type'
+
+    worker -> coordinator   hello {worker}, request, heartbeat, result {ticket, record}
+    coordinator -> worker   job {ticket, job}, wait, shutdown
+
+A worker holds at most one job at a time and asks for the next one when it has sent the result, so a worker host with
+N worker processes plays N games in parallel and the coordinator only handles one small message exchange per game.
+While playing, workers send a heartbeat every few seconds. If the coordinator does not hear from a worker for
+`heartbeat_timeout` seconds (or a game takes longer than `job_timeout`), the connection is dropped and the job is
+re-queued for another worker.
+
+Player classes in the jobs are sent as "module:ClassName" and must be importable on the worker hosts.
+
+Coordinator (the evaluation script):
+
+    with JobCoordinator(port=5555) as coordinator:
+        for result in coordinator.run(jobs):
+            ...
+
+Workers (on every worker host, one process per core by default):
+
+    python -m evaluation.distributed <coordinator host> --port 5555
+"""
+import argparse
+import importlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+import traceback
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 5555
+
+# Player classes can only be loaded from these packages on the workers
+_PLAYER_PACKAGES = ("players",)
+
+
+# Messages ------------------------------
+def _encode_default(obj):
+    if isinstance(obj, type):
+        return {'__type__': f"{obj.__module__}:{obj.__qualname__}"}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} cannot be sent to a worker")
+
+
+def _decode_type(obj):
+    if set(obj) != {'__type__'}:
+        return obj
+    module_name, qualname = obj['__type__'].split(":")
+    if module_name.split(".")[0] not in _PLAYER_PACKAGES:
+        raise ValueError(f"Refusing to load player type '{obj['__type__']}' from outside of {_PLAYER_PACKAGES}")
+    cls = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        cls = getattr(cls, name)
+    return cls
+
+
+def encode_message(msg:dict):
+    return (json.dumps(msg, default=_encode_default) + "\n").encode()
+
+
+def decode_message(line:bytes):
+    return json.loads(line, object_hook=_decode_type)
+
+
+class _Connection:
+    """ Socket that sends and receives messages. Sending is thread-safe (heartbeats are sent from a second thread)."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._rfile = sock.makefile('rb')
+        self._send_lock = threading.Lock()
+
+    def send(self, msg_type, **content):
+        data = encode_message(dict(type=msg_type, **content))
+        with self._send_lock:
+            self.sock.sendall(data)
+
+    def recv(self):
+        """ Next message or None if the connection was closed"""
+        line = self._rfile.readline()
+        return decode_message(line) if line else None
+
+    def close(self):
+        self._rfile.close()
+        self.sock.close()
+
+
+# Coordinator ------------------------------
+class _WorkerHandler(socketserver.BaseRequestHandler):
+    """ Serves one worker connection (runs in its own thread)"""
+
+    def handle(self):
+        coordinator = self.server.coordinator
+        self.request.settimeout(coordinator.heartbeat_timeout)
+        conn = _Connection(self.request)
+        worker = f"{self.client_address[0]}:{self.client_address[1]}"
+        ticket, t_dispatch = None, None
+        try:
+            hello = conn.recv()
+            if hello is None or hello['type'] != 'hello':
+                return
+            worker = hello.get('worker', worker)
+            coordinator._worker_connected(worker)
+
+            while True:
+                msg = conn.recv()
+                if msg is None:
+                    break
+                if msg['type'] == 'heartbeat':
+                    if coordinator.job_timeout is not None and ticket is not None and \
+                            time.monotonic() - t_dispatch > coordinator.job_timeout:
+                        logger.warning(f"Job {ticket} on worker {worker} timed out after {coordinator.job_timeout} s")
+                        break
+                elif msg['type'] == 'result':
+                    coordinator._finish(msg['ticket'], msg['record'])
+                    ticket = None
+                elif msg['type'] == 'request':
+                    if coordinator.closed:
+                        conn.send('shutdown')
+                        break
+                    ticket, job = coordinator._next_job(timeout=1.)
+                    if ticket is None:
+                        conn.send('wait')
+                    else:
+                        t_dispatch = time.monotonic()
+                        conn.send('job', ticket=ticket, job=job)
+                else:
+                    raise ValueError(f"Unknown message type '{msg['type']}'")
+        except socket.timeout:
+            logger.warning(f"No heartbeat from worker {worker} for {coordinator.heartbeat_timeout} s")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Connection to worker {worker} failed: {e!r}")
+        finally:
+            if ticket is not None:
+                coordinator._requeue(ticket, worker)
+            coordinator._worker_disconnected(worker)
+            conn.close()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class JobCoordinator:
+    """ Serves game jobs (see evaluation.tournament) to remote workers. Same interface as TournamentRunner."""
+
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT, heartbeat_timeout=30., job_timeout=None, max_retries=2):
+        """
+
+        Args:
+            host (str): interface to listen on
+            port (int): TCP port (0: any free port, see `address`)
+            heartbeat_timeout (float): seconds without a message after which a worker is considered dead
+            job_timeout (float): maximum duration of a game in seconds (no limit by default)
+            max_retries (int): number of times a job is re-queued after its worker died or timed out
+        """
+        self.heartbeat_timeout = heartbeat_timeout
+        self.job_timeout = job_timeout
+        self.max_retries = max_retries
+        self.closed = False
+        self.num_requeued = 0
+
+        self._cond = threading.Condition()
+        self._pending = deque()        # tickets waiting for a worker
+        self._outstanding = {}         # ticket -> [job, attempts] of all unfinished jobs
+        self._results = queue.Queue()  # (ticket, record)
+        self._tickets = itertools.count()
+        self.workers = set()
+
+        self._server = _Server((host, port), _WorkerHandler)
+        self._server.coordinator = self
+        self.address = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever, name="JobCoordinator", daemon=True)
+        self._thread.start()
+        logger.info(f"Job coordinator listening on {self.address[0]}:{self.address[1]}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def num_workers(self):
+        return len(self.workers)
+
+    def close(self):
+        """ Workers are sent 'shutdown' with their next request. Stops the server after a grace period."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        time.sleep(min(2., self.heartbeat_timeout))
+        self._server.shutdown()
+        self._server.server_close()
+
+    def terminate(self):
+        """ Discard all jobs that are not finished yet. Games that are being played are not interrupted, their
+        results are ignored."""
+        with self._cond:
+            self._pending.clear()
+            self._outstanding.clear()
+
+    # Called from the connection threads ------------------------------
+    def _worker_connected(self, worker):
+        with self._cond:
+            self.workers.add(worker)
+        logger.info(f"Worker {worker} connected ({self.num_workers} workers)")
+
+    def _worker_disconnected(self, worker):
+        with self._cond:
+            self.workers.discard(worker)
+        logger.info(f"Worker {worker} disconnected ({self.num_workers} workers)")
+
+    def _next_job(self, timeout):
+        """ (ticket, job) of the next pending job or (None, None) if there is none within `timeout` seconds"""
+        with self._cond:
+            deadline = time.monotonic() + timeout
+            while not self.closed:
+                while self._pending:
+                    ticket = self._pending.popleft()
+                    if ticket in self._outstanding:
+                        return ticket, self._outstanding[ticket][0]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    break
+        return None, None
+
+    def _finish(self, ticket, record):
+        with self._cond:
+            if self._outstanding.pop(ticket, None) is None:
+                # re-queued job that finished twice or discarded by terminate()
+                return
+        self._results.put((ticket, record))
+
+    def _requeue(self, ticket, worker):
+        with self._cond:
+            if ticket not in self._outstanding:
+                return
+            job, attempts = self._outstanding[ticket]
+            if attempts < self.max_retries:
+                self._outstanding[ticket][1] += 1
+                self._pending.appendleft(ticket)
+                self.num_requeued += 1
+                self._cond.notify()
+                logger.warning(f"Re-queued job {job.get('job_id')} of worker {worker}")
+                return
+            del self._outstanding[ticket]
+        self._results.put((ticket, dict(job_id=job.get('job_id'), error=f"job failed on {attempts + 1} workers")))
+
+    # ------------------------------
+    def run(self, jobs):
+        """ Generator that yields a result record per job in the order in which the games finish.
+
+        Jobs that failed on more than `max_retries` workers yield a record {'job_id': ..., 'error': ...}
+        """
+        tickets = set()
+        with self._cond:
+            for job in jobs:
+                ticket = next(self._tickets)
+                self._outstanding[ticket] = [job, 0]
+                self._pending.append(ticket)
+                tickets.add(ticket)
+            self._cond.notify_all()
+        if self.num_workers == 0:
+            logger.warning(f"No workers connected to {self.address[0]}:{self.address[1]} yet")
+
+        while tickets:
+            ticket, record = self._results.get()
+            if ticket in tickets:
+                tickets.remove(ticket)
+                yield record
+
+
+# Worker ------------------------------
+class _Heartbeat:
+    """ Sends heartbeats from a background thread while the game is played"""
+
+    def __init__(self, conn, interval):
+        self.conn = conn
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.conn.send('heartbeat')
+            except OSError:
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop_event.set()
+        self._thread.join()
+
+
+def run_worker(host, port=DEFAULT_PORT, name=None, heartbeat_interval=5., reconnect_timeout=60.):
+    """ Pull jobs from the coordinator at (host, port) and play them until the coordinator shuts down or could not be
+    reached for `reconnect_timeout` seconds. Returns the number of played games."""
+    from evaluation.tournament import play_job
+    import game  # noqa: F401 (pre-import)
+
+    name = f"{socket.gethostname()}-{os.getpid()}" if name is None else name
+    num_games = 0
+    last_contact = time.monotonic()
+    while True:
+        try:
+            conn = _Connection(socket.create_connection((host, port), timeout=10.))
+        except OSError as e:
+            if time.monotonic() - last_contact > reconnect_timeout:
+                logger.error(f"Could not reach coordinator {host}:{port} for {reconnect_timeout} s ({e!r}), stopping")
+                return num_games
+            time.sleep(1.)
+            continue
+
+        # The coordinator answers every request within about a second
+        conn.sock.settimeout(max(30., 3 * heartbeat_interval))
+        try:
+            conn.send('hello', worker=name)
+            while True:
+                conn.send('request')
+                msg = conn.recv()
+                last_contact = time.monotonic()
+                if msg is None or msg['type'] == 'shutdown':
+                    logger.info(f"Worker {name} stopped after {num_games} games")
+                    return num_games
+                if msg['type'] == 'wait':
+                    continue
+
+                job = msg['job']
+                with _Heartbeat(conn, heartbeat_interval):
+                    try:
+                        record = play_job(job)
+                    except Exception:
+                        record = dict(job_id=job.get('job_id'), error=traceback.format_exc())
+                        logger.warning(f"Job {job.get('job_id')} failed:\n{record['error']}")
+                conn.send('result', ticket=msg['ticket'], record=record)
+                num_games += 1
+        except (OSError, ValueError) as e:
+            logger.warning(f"Lost connection to coordinator {host}:{port} ({e!r}), reconnecting")
+        finally:
+            conn.close()
+
+
+def _worker_process_main(host, port, log_level, kwargs):
+    from log import setup_colored_logs
+    setup_colored_logs(log_level)
+    os.environ['SDL_NO_SIGNAL_HANDLERS'] = "1"
+    run_worker(host, port, **kwargs)
+
+
+def start_local_workers(host, port=DEFAULT_PORT, num_workers=None, log_level=logging.WARNING, **worker_kwargs):
+    """ Start `num_workers` worker processes on this machine (one per core by default). Returns the processes."""
+    num_workers = os.cpu_count() if num_workers is None else num_workers
+    processes = [multiprocessing.Process(target=_worker_process_main, args=(host, port, log_level, worker_kwargs),
+                                         daemon=True)
+                 for _ in range(num_workers)]
+    for p in processes:
+        p.start()
+    return processes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play game jobs of a JobCoordinator")
+    parser.add_argument("host", help="host of the coordinator")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-n", "--num-workers", type=int, default=None,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument("--heartbeat-interval", type=float, default=5.)
+    parser.add_argument("--reconnect-timeout", type=float, default=60.)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    for p in start_local_workers(args.host, args.port, args.num_workers, log_level=args.log_level,
+                                 heartbeat_interval=args.heartbeat_interval, reconnect_timeout=args.reconnect_timeout):
+        p.join()
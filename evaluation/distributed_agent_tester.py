@@ -0,0 +1,61 @@
+"""Agent Tester Script that serves the games to workers on other hosts
+
+Start workers on every worker host with
+
+    python -m evaluation.distributed <host of this script> --port 5555
+
+or pass --local-workers N to start N workers on this machine.
+"""
+import argparse
+import logging
+import time
+
+import pandas as pd
+from players.aiplayers import *
+from evaluation.distributed import JobCoordinator, start_local_workers
+from evaluation.tournament import make_jobs
+
+from log import setup_colored_logs
+
+setup_colored_logs(logging.INFO)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--local-workers", type=int, default=0, help="number of workers to start on this machine")
+    parser.add_argument("--num-runs", type=int, default=20)
+    args = parser.parse_args()
+
+    game_settings = dict(target_fps=30, game_speed_factor=1.0, run_until_last_player_dies=False,
+                     wall_collision_penalty=200., self_collision_penalty=150., player_collision_penalty=100.,
+                     survival_reward=100., ignore_self_collisions=False)
+
+    agent_ut_info = {'type': NStepPlanPlayer,
+                     'kwargs': dict(num_steps=2, dist_per_step=40.0, plan_update_period=0.15,
+                                    wall_penalty=200., trail_penalty=100., conflict_penalty=50., discount_factor=0.9),
+                     }
+
+    opponent_settings = [{'type': RandomSteeringAIPlayer,
+                          'kwargs': dict(turn_angles_deg=[20.,260.], straight_lengths=(0, 200.0))}] * 4
+
+    jobs = make_jobs(game_settings, agent_ut_info, opponent_settings, args.num_runs, base_seed=12345)
+
+    t0 = time.time()
+    with JobCoordinator(port=args.port, heartbeat_timeout=30.) as coordinator:
+        if args.local_workers > 0:
+            start_local_workers("localhost", coordinator.address[1], args.local_workers)
+
+        for result in coordinator.run(jobs):
+            if 'error' in result:
+                print(f"==== Run {result['job_id']+1} failed ====")
+                continue
+            print(f"==== Run {result['job_id']+1} (winner: {result['winner']}, {result['num_ticks']} ticks, "
+                  f"{result['wall_time']:.2f} s, worker pid {result['worker_pid']}) ====")
+            scoreboard = pd.DataFrame.from_records(result['players'], index='idx')
+            print(scoreboard[['name', 'score', 'total_reward', 'reason_of_death']])
+
+        print(f"\nWorkers: {coordinator.num_workers}, re-queued jobs: {coordinator.num_requeued}")
+
+    dt = time.time() - t0
+    print(f"\nTotal runtime for {args.num_runs} runs: {dt:.3f} seconds")
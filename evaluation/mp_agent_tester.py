@@ -1,38 +1,24 @@
 """Multiprocessing Agent Tester Script"""
 import logging
-import multiprocessing
 import time
 
-import numpy as np
-from game import AchtungDieKurveGame
+import pandas as pd
 from players.aiplayers import *
+from evaluation.sequential_testing import MeanRewardTest, WinRateSPRT, run_sequential_evaluation
+from evaluation.tournament import TournamentRunner, make_jobs
+from storage.results_store import ResultsStore, ResultsWriter
 
 from log import setup_colored_logs
 
 setup_colored_logs(logging.WARNING)
 
 
-
-def execute_single_run(game_settings, agent_under_test:dict, opponent_settings:list):
-
-    game = AchtungDieKurveGame(mode='headless', **game_settings)
-
-    # Spawn agent under test
-    #player_type = agent_under_test.pop('class')
-    game.spawn_player(1, player_type=agent_under_test['type'], name="Agent under Test", **agent_under_test['kwargs'])
-
-    max_idx = min(max(AchtungDieKurveGame.valid_player_indices), len(opponent_settings)+1)
-    for k, idx in enumerate(range(2, max_idx+1)):
-        game.spawn_player(idx, player_type=opponent_settings[k]['type'], **opponent_settings[k]['kwargs'])
-
-    # Run game
-    game.run_game_loop(close_when_finished=True)
-
-    return game
-
 if __name__ == "__main__":
 
     num_runs = 5
+    results_dir = "./results"
+    # Stop before num_runs games once the win rate and reward comparisons against the opponents are decided
+    early_stop = False
 
     game_settings = dict(target_fps=30, game_speed_factor=1.0, run_until_last_player_dies=False,
                      wall_collision_penalty=200., self_collision_penalty=150., player_collision_penalty=100.,
@@ -49,26 +35,37 @@ if __name__ == "__main__":
 
     t0 = time.time()
 
-
-    # Prepare batch of run settings for use with Pool.starmap()
     # Simplest case: num_runs repetitions of the same settings
-    run_settings_batch = [(game_settings, agent_ut_info, opponent_settings)] * num_runs
-
-    with  multiprocessing.Pool(processes=2) as pool:
-        finished_games = pool.starmap(execute_single_run, run_settings_batch)
-
-    for run_idx, fg in enumerate(finished_games):
-        print(f"==== Run {run_idx+1} ====")
-        fg.print_scoreboard()
+    jobs = make_jobs(game_settings, agent_ut_info, opponent_settings, num_runs)
+    jobs_by_id = {job['job_id']: job for job in jobs}
+
+    # One persistent worker per core, results are streamed back as soon as a game is finished
+    # and appended to the results store (one row per game and player)
+    with TournamentRunner() as runner, ResultsWriter(results_dir) as writer:
+        def on_result(result):
+            writer.append(result, jobs_by_id[result['job_id']])
+            print(f"==== Run {result['job_id']+1} (winner: {result['winner']}, {result['num_ticks']} ticks, "
+                  f"{result['wall_time']:.2f} s) ====")
+            scoreboard = pd.DataFrame.from_records(result['players'], index='idx')
+            print(scoreboard[['name', 'score', 'total_reward', 'reason_of_death']])
+
+        if early_stop:
+            # Equally strong players would win 1 out of (number of opponents + 1) games
+            p_fair = 1. / (len(opponent_settings) + 1)
+            tests = [WinRateSPRT(p0=p_fair, p1=1.5 * p_fair), MeanRewardTest(min_games=10)]
+            evaluation = run_sequential_evaluation(runner, jobs, tests, on_result=on_result)
+            print()
+            for test in tests:
+                print(test.summary())
+            print(f"Played {evaluation['num_games']} of {num_runs} games, saved {evaluation['num_saved']}")
+        else:
+            for result in runner.run(jobs):
+                on_result(result)
 
     dt = time.time() - t0
     print(f"\nTotal runtime for {num_runs} runs: {dt:.3f} seconds")
 
-
-
-
-
-
-
-
-
+    # Aggregates over all batches in the store, including the ones of earlier runs
+    store = ResultsStore(results_dir)
+    print("\n---- Agents under test (all stored results) ----")
+    print(store.win_rates().join(store.reward_summary(query="is_agent_ut")))
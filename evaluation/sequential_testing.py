@@ -0,0 +1,248 @@
+"""Sequential tests that stop an evaluation as soon as its outcome is clear
+
+The tests consume the result records of finished games (see evaluation.tournament.summarize_game) one at a time.
+Once a test has reached a decision, the remaining games of the evaluation budget don't need to be played.
+"""
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Player index of the agent under test (see evaluation.tournament.spawn_players)
+AGENT_UT_IDX = 1
+
+
+def agent_won(result, agent_idx=AGENT_UT_IDX):
+    return result['winner'] == agent_idx
+
+
+def reward_advantage(result, agent_idx=AGENT_UT_IDX):
+    """ Total reward of the agent minus the mean total reward of its opponents"""
+    agent_reward = [p['total_reward'] for p in result['players'] if p['idx'] == agent_idx][0]
+    opponent_rewards = [p['total_reward'] for p in result['players'] if p['idx'] != agent_idx]
+    return agent_reward - (np.mean(opponent_rewards) if len(opponent_rewards) > 0 else 0.)
+
+
+class SequentialTest:
+    """ Base class. `decision` is None until the test has reached a decision."""
+    name = "test"
+
+    def __init__(self, min_games=0):
+        self.min_games = min_games
+        self.num_games = 0
+        self.decision = None
+
+    def update(self, result):
+        """ Add the result record of a finished game. Returns the decision (or None)"""
+        if self.decision is not None or 'error' in result:
+            return self.decision
+        self.num_games += 1
+        self._add(result)
+        if self.num_games >= self.min_games:
+            self.decision = self._decide()
+        return self.decision
+
+    def _add(self, result):
+        raise NotImplementedError
+
+    def _decide(self):
+        raise NotImplementedError
+
+    def summary(self):
+        raise NotImplementedError
+
+
+class WinRateSPRT(SequentialTest):
+    """ Wald's sequential probability ratio test for the win rate p of the agent under test.
+
+    Tests H0: p = p0 against H1: p = p1 (p1 > p0) with error probabilities alpha (accept H1 although H0 is true)
+    and beta (accept H0 although H1 is true). Decisions are 'better' (H1) and 'not better' (H0).
+    """
+    name = "win rate SPRT"
+
+    def __init__(self, p0=0.2, p1=0.3, alpha=0.05, beta=0.05, min_games=0):
+        super().__init__(min_games)
+        if not 0. < p0 < p1 < 1.:
+            raise ValueError(f"Expected 0 < p0 < p1 < 1, got p0={p0}, p1={p1}")
+        self.p0, self.p1 = p0, p1
+        self.upper = math.log((1. - beta) / alpha)
+        self.lower = math.log(beta / (1. - alpha))
+        self.llr = 0.
+        self.num_wins = 0
+
+    def _add(self, result):
+        if agent_won(result):
+            self.num_wins += 1
+            self.llr += math.log(self.p1 / self.p0)
+        else:
+            self.llr += math.log((1. - self.p1) / (1. - self.p0))
+
+    def _decide(self):
+        if self.llr >= self.upper:
+            return 'better'
+        if self.llr <= self.lower:
+            return 'not better'
+        return None
+
+    def summary(self):
+        return (f"{self.name}: {self.num_wins}/{self.num_games} wins, log likelihood ratio {self.llr:.2f} "
+                f"(bounds {self.lower:.2f}, {self.upper:.2f}) -> {self.decision}")
+
+
+class WinRateBetaTest(SequentialTest):
+    """ Bayesian test with a Beta posterior of the win rate p of the agent under test.
+
+    Stops with 'better' / 'worse' once P(p > threshold) is above `confidence` / below 1 - `confidence`.
+    """
+    name = "win rate Beta posterior"
+
+    def __init__(self, threshold=0.2, confidence=0.95, prior=(1., 1.), min_games=10, num_samples=20000, seed=0):
+        """
+
+        Args:
+            threshold (float): win rate to compare to, e.g. 1 / number of players for equally strong players
+            confidence (float): required posterior probability
+            prior (tuple): parameters (a, b) of the Beta prior
+            min_games (int): never decide before this many games
+            num_samples (int): number of posterior samples used to estimate P(p > threshold)
+            seed (int): seed of the posterior samples, keeps decisions reproducible
+        """
+        super().__init__(min_games)
+        self.threshold = threshold
+        self.confidence = confidence
+        self.prior = prior
+        self.num_samples = num_samples
+        self.rng = np.random.default_rng(seed)
+        self.num_wins = 0
+        self.prob_better = None
+
+    def _add(self, result):
+        self.num_wins += int(agent_won(result))
+
+    def posterior(self):
+        return self.prior[0] + self.num_wins, self.prior[1] + self.num_games - self.num_wins
+
+    def credible_interval(self, mass=None):
+        mass = self.confidence if mass is None else mass
+        samples = self.rng.beta(*self.posterior(), size=self.num_samples)
+        return tuple(np.quantile(samples, [(1. - mass) / 2, (1. + mass) / 2]))
+
+    def _decide(self):
+        self.prob_better = float(np.mean(self.rng.beta(*self.posterior(), size=self.num_samples) > self.threshold))
+        if self.prob_better >= self.confidence:
+            return 'better'
+        if self.prob_better <= 1. - self.confidence:
+            return 'worse'
+        return None
+
+    def summary(self):
+        a, b = self.posterior()
+        lo, hi = self.credible_interval()
+        return (f"{self.name}: {self.num_wins}/{self.num_games} wins, mean {a / (a + b):.3f}, "
+                f"{self.confidence:.0%} interval [{lo:.3f}, {hi:.3f}], P(p > {self.threshold:g}) = "
+                f"{self.prob_better if self.prob_better is not None else float('nan'):.3f} -> {self.decision}")
+
+
+class MeanRewardTest(SequentialTest):
+    """ Bayesian test of the mean reward advantage d of the agent under test over its opponents (normal approximation,
+    flat prior). Stops with 'better' / 'worse' once P(d > margin) is above `confidence` / below 1 - `confidence`.
+    """
+    name = "mean reward advantage"
+
+    def __init__(self, margin=0., confidence=0.95, min_games=10):
+        super().__init__(max(min_games, 2))
+        self.margin = margin
+        self.confidence = confidence
+        self._sum = 0.
+        self._sum_sq = 0.
+        self.prob_better = None
+
+    def _add(self, result):
+        d = reward_advantage(result)
+        self._sum += d
+        self._sum_sq += d * d
+
+    @property
+    def mean(self):
+        return self._sum / self.num_games
+
+    @property
+    def std_error(self):
+        n = self.num_games
+        var = max(self._sum_sq / n - self.mean ** 2, 0.) * n / (n - 1)
+        return math.sqrt(var / n)
+
+    def _decide(self):
+        se = self.std_error
+        if se == 0.:
+            self.prob_better = float(self.mean > self.margin)
+        else:
+            self.prob_better = 0.5 * (1. + math.erf((self.mean - self.margin) / (se * math.sqrt(2.))))
+        if self.prob_better >= self.confidence:
+            return 'better'
+        if self.prob_better <= 1. - self.confidence:
+            return 'worse'
+        return None
+
+    def summary(self):
+        if self.num_games < 2:
+            return f"{self.name}: {self.num_games} games -> {self.decision}"
+        return (f"{self.name}: {self.mean:.1f} +- {self.std_error:.1f} over {self.num_games} games, "
+                f"P(d > {self.margin:g}) = {self.prob_better if self.prob_better is not None else float('nan'):.3f}"
+                f" -> {self.decision}")
+
+
+def run_sequential_evaluation(runner, jobs, tests, stop_when='all', on_result=None):
+    """ Play `jobs` on `runner` (TournamentRunner or WarmWorkerPool) until the tests have reached a decision or all
+    jobs are played. The tests consume the results in the order of `jobs` (not in the order the games finish), so a
+    decision never depends on which games happened to be short. The games still in progress are discarded when the
+    evaluation stops early.
+
+    Args:
+        runner: runner with a run(jobs) generator and terminate()
+        jobs (list): evaluation budget
+        tests (list): SequentialTest instances
+        stop_when (str): 'all' stops when every test has decided, 'any' when the first one has
+        on_result (callable): optional callback, called with every result record
+
+    Returns:
+        dict with the results, the decisions, the number of games played and the number of games saved
+    """
+    if stop_when not in ('all', 'any'):
+        raise ValueError(f"Invalid value for stop_when: '{stop_when}'")
+    stop_condition = all if stop_when == 'all' else any
+
+    # Results arrive in completion order, which favours short games. The tests consume them in the order of the jobs,
+    # so that a decision is always based on a contiguous prefix of the job list.
+    job_order = [job.get('job_id') for job in jobs]
+    pending = {}
+    num_tested = 0
+
+    results = []
+    stopped_early = False
+    for result in runner.run(jobs):
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+        pending[result.get('job_id')] = result
+        while num_tested < len(job_order) and job_order[num_tested] in pending:
+            next_result = pending.pop(job_order[num_tested])
+            num_tested += 1
+            for test in tests:
+                test.update(next_result)
+        if stop_condition(test.decision is not None for test in tests):
+            stopped_early = len(results) < len(jobs)
+            break
+
+    if stopped_early:
+        runner.terminate()
+
+    num_saved = len(jobs) - len(results)
+    for test in tests:
+        logger.info(test.summary())
+    logger.info(f"Played {len(results)} of {len(jobs)} games, saved {num_saved} ({num_saved / max(len(jobs), 1):.0%})")
+
+    return dict(results=results, decisions={test.name: test.decision for test in tests},
+                num_games=len(results), num_saved=num_saved, stopped_early=stopped_early)
@@ -1,28 +1,24 @@
-"""Agent Tester Script that uses subprocessing"""
+"""Agent Tester Script that uses a pool of warm worker processes"""
 import logging
-import multiprocessing
-import subprocess
 import time
-import os
-import pickle as pkl
 
-import numpy as np
-from game import AchtungDieKurveGame
+import pandas as pd
 from players.aiplayers import *
+from evaluation.cached_runner import CachedRunner
+from evaluation.tournament import make_jobs
+from evaluation.worker_pool import WarmWorkerPool
+from storage.result_cache import ResultCache
 
 from log import setup_colored_logs
 
 setup_colored_logs(logging.WARNING)
 
-import ruamel.yaml as yaml
-
-def run_in_subprocess(run_dir):
-    subprocess.run(f"python ./execute_single_run.py {run_dir}", check=True)
-
 
 if __name__ == "__main__":
 
     num_runs = 10
+    # Seeded games are only played once, reruns take their results from the cache
+    cache_path = "./result-cache.sqlite"
 
     game_settings = dict(target_fps=30, game_speed_factor=1.0, run_until_last_player_dies=False,
                      wall_collision_penalty=200., self_collision_penalty=150., player_collision_penalty=100.,
@@ -39,43 +35,27 @@ if __name__ == "__main__":
 
     t0 = time.time()
 
-
-    # Prepare batch of run settings for use with Pool.starmap()
-    # Simplest case: num_runs repetitions of the same settings
-    run_settings_batch = [(game_settings, agent_ut_info, opponent_settings)] * num_runs
-
-    # Prepare run batch folder
-    batch_dir = os.path.abspath(os.path.join(".", "run-batch"))
-    os.makedirs(batch_dir, exist_ok=True)
-
-    # Create and prepare one folder for each run:
-    run_dirs = []
-    for run_idx in range(num_runs):
-        run_dir = os.path.join(batch_dir, f"run-{run_idx:04d}")
-        os.makedirs(run_dir, exist_ok=True)
-
-        # Write run_settings pickle
-        with open(os.path.join(run_dir, "run_settings.pkl"),'wb') as rsf:
-            pkl.dump({'game_settings': game_settings,
-                      'agent_ut_info':agent_ut_info,
-                      'opponent_settings':opponent_settings},
-                      rsf)
-
-        run_dirs.append((run_dir,))
-
-
-    with multiprocessing.Pool(processes=4) as pool:
-        pool.starmap(run_in_subprocess, run_dirs)
-
+    # Simplest case: num_runs repetitions of the same settings, seeds 12345, 12346, ...
+    base_seed = game_settings.pop('rng_seed')
+    jobs = make_jobs(game_settings, agent_ut_info, opponent_settings, num_runs, base_seed=base_seed)
+
+    # Jobs and results are sent over pipes, each worker is replaced by a fresh process after 5 games
+    results = []
+    pool = WarmWorkerPool(num_workers=4, max_games_per_worker=5)
+    with ResultCache(cache_path) as cache, CachedRunner(pool, cache) as runner:
+        for result in runner.run(jobs):
+            if 'error' in result:
+                print(f"==== Run {result['job_id']+1} failed ====")
+                continue
+            source = "cached" if result.get('cached') else f"{result['wall_time']:.2f} s"
+            print(f"==== Run {result['job_id']+1} (winner: {result['winner']}, {result['num_ticks']} ticks, "
+                  f"{source}) ====")
+            scoreboard = pd.DataFrame.from_records(result['players'], index='idx')
+            print(scoreboard[['name', 'score', 'total_reward', 'reason_of_death']])
+            results.append(result)
+
+        print(f"\nRecycled workers: {pool.num_recycled}, crashed workers: {pool.num_crashes}, "
+              f"result cache hit rate: {cache.hit_rate:.0%}")
 
     dt = time.time() - t0
     print(f"\nTotal runtime for {num_runs} runs: {dt:.3f} seconds")
-
-
-
-
-
-
-
-
-
@@ -0,0 +1,211 @@
+"""Hyperparameter sweeps over the kwargs of AI players
+
+All configurations play against the same opponents on the same seeds (common random numbers), so differences between
+configurations are not drowned in the variance between games. Poor configurations are dropped early by successive
+halving: in rung r every remaining configuration has played `min_games * eta**r` games and only the best 1/eta of
+them advance to the next rung.
+
+Results are appended to a results store (see storage.results_store). A sweep that is restarted with the same
+configurations only plays the (configuration, seed) pairs that are missing in the store, so an interrupted sweep
+continues where it stopped.
+"""
+import itertools
+import logging
+import math
+
+import numpy as np
+
+from evaluation.cached_runner import CachedRunner
+from evaluation.tournament import TournamentRunner
+from storage.results_store import ResultsStore, ResultsWriter, config_hash, settings_to_json
+
+logger = logging.getLogger(__name__)
+
+
+class Choice:
+    """ Search space dimension: one of `values`"""
+    def __init__(self, values):
+        self.values = list(values)
+
+    def sample(self, rng):
+        return self.values[rng.integers(len(self.values))]
+
+
+class Uniform:
+    """ Search space dimension: uniform in [low, high], rounded to integers if both limits are integers"""
+    def __init__(self, low, high):
+        self.low, self.high = low, high
+
+    def sample(self, rng):
+        if isinstance(self.low, int) and isinstance(self.high, int):
+            return int(rng.integers(self.low, self.high + 1))
+        return float(rng.uniform(self.low, self.high))
+
+
+class LogUniform(Uniform):
+    """ Search space dimension: log-uniform in [low, high]"""
+    def sample(self, rng):
+        return float(np.exp(rng.uniform(np.log(self.low), np.log(self.high))))
+
+
+def grid_configs(grid:dict):
+    """ All combinations of a parameter grid {name: [values]}"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def random_configs(space:dict, num_configs:int, seed=None):
+    """ `num_configs` random configurations. Values of `space` are Choice/Uniform/LogUniform or constants."""
+    rng = np.random.default_rng(seed)
+    return [{name: dim.sample(rng) if hasattr(dim, 'sample') else dim for name, dim in space.items()}
+            for _ in range(num_configs)]
+
+
+class HyperparameterSweep:
+    """ Successive halving over configurations (kwargs) of one player type, played in parallel on a TournamentRunner
+
+    Usage:
+        sweep = HyperparameterSweep(NStepPlanPlayer, grid_configs(grid), game_settings, opponent_settings,
+                                    store_dir="./sweep-nstep")
+        ranking = sweep.run()
+    """
+
+    def __init__(self, player_type, configs:list, game_settings:dict, opponent_settings:list, store_dir,
+                 base_kwargs=None, min_games=8, eta=2, max_games=None, base_seed=0, metric='win_rate'):
+        """
+
+        Args:
+            player_type: class of the player under test
+            configs (list): kwargs dicts to compare (e.g. from grid_configs() or random_configs())
+            game_settings (dict): settings of all games (without rng_seed)
+            opponent_settings (list): opponents, same format as in evaluation.tournament
+            store_dir (str): results store of the sweep, reused when the sweep is restarted
+            base_kwargs (dict): kwargs shared by all configurations
+            min_games (int): number of games per configuration in the first rung
+            eta (int): factor by which the number of configurations shrinks (and the games grow) per rung
+            max_games (int): maximum number of games per configuration, defaults to what one configuration plays
+                             when halving down to a single configuration
+            base_seed (int): games of all configurations use the seeds base_seed, base_seed + 1, ...
+            metric (str): 'win_rate' or 'total_reward' of the player under test, the other one breaks ties
+        """
+        if metric not in ('win_rate', 'total_reward'):
+            raise ValueError(f"Invalid metric '{metric}'")
+        if len(configs) == 0:
+            raise ValueError("No configurations to sweep")
+
+        self.player_type = player_type
+        self.configs = [dict(base_kwargs or {}, **c) for c in configs]
+        self.game_settings = {k: v for k, v in game_settings.items() if k != 'rng_seed'}
+        self.opponent_settings = opponent_settings
+        self.store_dir = store_dir
+        self.min_games = min_games
+        self.eta = eta
+        num_rungs = max(int(math.ceil(math.log(len(self.configs), eta))), 0) + 1
+        self.max_games = min_games * eta ** (num_rungs - 1) if max_games is None else max_games
+        self.base_seed = base_seed
+        self.metric = metric
+        self.hashes = [self._config_hash(c) for c in self.configs]
+        self.rung_of_config = np.zeros(len(self.configs), dtype=int)
+
+    def _agent_info(self, config):
+        return {'type': self.player_type, 'kwargs': config}
+
+    def _config_hash(self, config):
+        return config_hash(self.game_settings, self._agent_info(config), self.opponent_settings)
+
+    def _make_job(self, job_id, k, seed):
+        return dict(job_id=job_id, game_settings=dict(self.game_settings, rng_seed=seed),
+                    agent_ut_info=self._agent_info(self.configs[k]), opponent_settings=self.opponent_settings)
+
+    def _played_seeds(self, store):
+        """ Seeds that were already played per configuration hash"""
+        rows = store.load(columns=['config_hash', 'seed'], query="is_agent_ut")
+        return rows.groupby('config_hash')['seed'].agg(set).to_dict()
+
+    def scores(self, store=None, num_games=None):
+        """ Number of games, win rate and mean total reward of the player under test per configuration, using the
+        first `num_games` seeds only (all seeds by default)"""
+        store = ResultsStore(self.store_dir) if store is None else store
+        query = "is_agent_ut"
+        if num_games is not None:
+            query += f" and {self.base_seed} <= seed < {self.base_seed + num_games}"
+        rows = store.load(columns=['config_hash', 'seed', 'winner', 'player', 'total_reward'], query=query)
+        rows = rows[rows['config_hash'].isin(self.hashes)].drop_duplicates(['config_hash', 'seed'])
+        rows = rows.assign(won=rows['winner'] == rows['player'])
+        stats = rows.groupby('config_hash').agg(games=('seed', 'size'), win_rate=('won', 'mean'),
+                                                total_reward=('total_reward', 'mean'))
+        return stats.reindex(self.hashes)
+
+    def _play(self, runner, writer, store, num_games, candidates):
+        """ Play the missing games (seeds base_seed ... base_seed + num_games - 1) of all candidate configurations"""
+        played = self._played_seeds(store)
+        jobs = []
+        for k in candidates:
+            done = played.get(self.hashes[k], set())
+            for seed in range(self.base_seed, self.base_seed + num_games):
+                if seed not in done:
+                    jobs.append(self._make_job(len(jobs), k, seed))
+
+        logger.info(f"Playing {len(jobs)} games for {len(candidates)} configurations ({num_games} games each)")
+        for result in runner.run(jobs):
+            if 'error' in result:
+                logger.warning(f"Game {result['job_id']} failed: {result['error']}")
+                continue
+            writer.append(result, jobs[result['job_id']])
+        writer.flush()
+        store.refresh()
+
+    def run(self, runner=None, cache=None):
+        """ Run (or continue) the sweep. Returns the ranking of all configurations as DataFrame.
+
+        Args:
+            runner: TournamentRunner or WarmWorkerPool, by default a TournamentRunner with one worker per core
+            cache (ResultCache): optional result cache, games found in it are not played again
+        """
+        own_runner = runner is None
+        runner = TournamentRunner() if own_runner else runner
+        if cache is not None:
+            runner = CachedRunner(runner, cache)
+        writer = ResultsWriter(self.store_dir, batch_size=1000)
+        store = ResultsStore(self.store_dir)
+
+        try:
+            candidates = list(range(len(self.configs)))
+            num_games = min(self.min_games, self.max_games)
+            rung = 0
+            while True:
+                self.rung_of_config[candidates] = rung
+                self._play(runner, writer, store, num_games, candidates)
+                if len(candidates) <= 1 or num_games >= self.max_games:
+                    break
+
+                stats = self.scores(store, num_games=num_games).iloc[candidates]
+                order = self._rank(stats)
+                num_keep = max(1, len(candidates) // self.eta)
+                candidates = [candidates[i] for i in order[:num_keep]]
+                logger.info(f"Rung {rung}: keeping {num_keep} configurations, best: "
+                            f"{self.configs[candidates[0]]} ({stats.iloc[order[0]].to_dict()})")
+                num_games = min(num_games * self.eta, self.max_games)
+                rung += 1
+        finally:
+            writer.close()
+            if own_runner:
+                runner.close()
+
+        return self.ranking(store)
+
+    def _rank(self, stats):
+        """ Positions of the rows of `stats`, best first"""
+        tie_breaker = 'total_reward' if self.metric == 'win_rate' else 'win_rate'
+        keys = stats[[self.metric, tie_breaker]].fillna(-np.inf).to_numpy()
+        return list(np.lexsort((-keys[:, 1], -keys[:, 0])))
+
+    def ranking(self, store=None):
+        """ All configurations, ordered by the rung they reached and their score in it"""
+        stats = self.scores(store)
+        stats['rung'] = self.rung_of_config
+        stats['kwargs'] = [settings_to_json(c) for c in self.configs]
+        tie_breaker = 'total_reward' if self.metric == 'win_rate' else 'win_rate'
+        stats = stats.sort_values(['rung', self.metric, tie_breaker], ascending=False, na_position='last')
+        return stats.reset_index()
+
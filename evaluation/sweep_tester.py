@@ -0,0 +1,53 @@
+"""Hyperparameter Sweep Script for NStepPlanPlayer
+
+Results are stored in `store_dir`. Restarting the script continues an interrupted sweep.
+"""
+import logging
+import time
+
+import pandas as pd
+from players.aiplayers import *
+from evaluation.sweep import HyperparameterSweep, Choice, Uniform, grid_configs, random_configs
+from storage.result_cache import ResultCache
+
+from log import setup_colored_logs
+
+setup_colored_logs(logging.INFO)
+
+
+if __name__ == "__main__":
+
+    store_dir = "./sweep-nstep-plan-player"
+    # Games that were played before (e.g. by another sweep with overlapping configurations) are not played again
+    cache_path = "./result-cache.sqlite"
+    random_search = False
+
+    game_settings = dict(target_fps=30, game_speed_factor=1.0, run_until_last_player_dies=False,
+                     wall_collision_penalty=200., self_collision_penalty=150., player_collision_penalty=100.,
+                     survival_reward=100., ignore_self_collisions=False)
+
+    opponent_settings = [{'type': RandomSteeringAIPlayer,
+                          'kwargs': dict(turn_angles_deg=[20.,260.], straight_lengths=(0, 200.0))}] * 4
+
+    if random_search:
+        space = dict(num_steps=Choice([1, 2, 3]), dist_per_step=Uniform(20., 60.), plan_update_period=Uniform(0.05, 0.3),
+                     wall_penalty=Uniform(50., 300.), trail_penalty=Uniform(50., 300.), discount_factor=Uniform(0.7, 1.0))
+        configs = random_configs(space, num_configs=128, seed=0)
+    else:
+        grid = dict(num_steps=[1, 2, 3], dist_per_step=[30., 40., 50.], plan_update_period=[0.1, 0.15, 0.25],
+                    wall_penalty=[100., 200.], trail_penalty=[100., 200.], discount_factor=[0.8, 0.9])
+        configs = grid_configs(grid)
+
+    t0 = time.time()
+
+    # All configurations play on the same seeds, the worse half is dropped after 8, 16, 32, ... games
+    sweep = HyperparameterSweep(NStepPlanPlayer, configs, game_settings, opponent_settings, store_dir=store_dir,
+                                base_kwargs=dict(conflict_penalty=50.), min_games=8, eta=2)
+    with ResultCache(cache_path) as cache:
+        ranking = sweep.run(cache=cache)
+        print(f"\nResult cache hit rate: {cache.hit_rate:.1%}")
+
+    dt = time.time() - t0
+    print(f"\nSweep over {len(configs)} configurations finished after {dt:.1f} seconds\n")
+    with pd.option_context('display.max_colwidth', None, 'display.width', 200):
+        print(ranking.head(10)[['rung', 'games', 'win_rate', 'total_reward', 'kwargs']])
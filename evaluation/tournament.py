@@ -0,0 +1,144 @@
+"""Tournament runner with persistent worker processes
+
+Each worker process keeps one warm (headless) game engine and reuses it for all its games. Instead of the finished
+game, workers send back a small result record (see `summarize_game()`) as soon as a game is finished, so memory
+and IPC per game stay constant, no matter how many games are played.
+"""
+import logging
+import multiprocessing
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Game engine of the current worker process, reused between games
+_worker_game = None
+_worker_game_settings = None
+
+
+def make_jobs(game_settings:dict, agent_ut_info:dict, opponent_settings:list, num_runs:int, base_seed=None):
+    """ Create `num_runs` jobs with the same setup. With `base_seed`, job k uses seed `base_seed + k`."""
+    jobs = []
+    for k in range(num_runs):
+        settings = dict(game_settings)
+        if base_seed is not None:
+            settings['rng_seed'] = base_seed + k
+        jobs.append(dict(job_id=k, game_settings=settings, agent_ut_info=agent_ut_info,
+                         opponent_settings=opponent_settings))
+    return jobs
+
+
+def spawn_players(game, agent_ut_info:dict, opponent_settings:list):
+    """ Spawn the agent under test as player 1 and the opponents as players 2, 3, ..."""
+    from game import AchtungDieKurveGame
+
+    game.spawn_player(1, player_type=agent_ut_info['type'], name="Agent under Test", **agent_ut_info['kwargs'])
+
+    max_idx = min(max(AchtungDieKurveGame.valid_player_indices), len(opponent_settings)+1)
+    for k, idx in enumerate(range(2, max_idx+1)):
+        game.spawn_player(idx, player_type=opponent_settings[k]['type'], **opponent_settings[k]['kwargs'])
+
+
+def summarize_game(game, wall_time=None, job_id=None):
+    """ Compact result record of a finished game"""
+    num_ticks = game.current_frame + 1
+    players = [dict(idx=p.idx, type=type(p).__name__, name=p.name, score=game.scoreboard[p.idx],
+                    total_reward=p.total_reward, dist_travelled=p.dist_travelled,
+                    ticks_survived=num_ticks if p.death_tick is None else p.death_tick + 1,
+                    reason_of_death=None if p.reason_of_death is None else p.reason_of_death.name)
+               for p in game.players]
+
+    return dict(job_id=job_id, seed=game._rng_seed, num_ticks=num_ticks,
+                winner=None if game.winner is None else game.winner.idx,
+                wall_time=wall_time, ticks_per_second=num_ticks / wall_time if wall_time else None,
+                players=players)
+
+
+def get_warm_game(game_settings:dict):
+    """ Returns the game engine of this process, reset for a new round with `game_settings`.
+    A new engine is only created if settings other than the seed have changed."""
+    global _worker_game, _worker_game_settings
+    from game import AchtungDieKurveGame
+
+    settings = dict(game_settings)
+    rng_seed = settings.pop('rng_seed', None)
+    if _worker_game is None or settings != _worker_game_settings:
+        _worker_game = AchtungDieKurveGame(mode='headless', rng_seed=rng_seed, **settings)
+        _worker_game_settings = settings
+    else:
+        _worker_game.reset(rng_seed)
+    return _worker_game
+
+
+def play_job(job:dict):
+    """ Play the game described by `job` on the warm engine of this process and return its result record.
+
+    If the job has an entry 'profiling' (dict with an 'output_dir' and the kwargs of game.enable_profiling()), the
+    game is profiled and the collapsed stacks are written to the output directory.
+    """
+    t0 = time.perf_counter()
+    game = get_warm_game(job['game_settings'])
+    spawn_players(game, job['agent_ut_info'], job['opponent_settings'])
+    profiling = job.get('profiling')
+    if profiling is not None:
+        profiling = dict(profiling)
+        output_dir = profiling.pop('output_dir')
+        game.enable_profiling(**profiling)
+    game.run_game_loop(close_when_finished=False)
+    result = summarize_game(game, wall_time=time.perf_counter() - t0, job_id=job.get('job_id'))
+    result['worker_pid'] = os.getpid()
+    if profiling is not None:
+        result['profile'] = game.profiler.save(os.path.join(output_dir, f"job-{job.get('job_id')}.folded"))
+    return result
+
+
+def add_profiling(jobs, profiling):
+    """ Jobs with profiling settings (see play_job), no-op if `profiling` is None"""
+    if profiling is None:
+        return jobs
+    return [dict(job, profiling=profiling) for job in jobs]
+
+
+def _init_worker(log_level):
+    from log import setup_colored_logs
+    setup_colored_logs(log_level)
+    # SDL would otherwise catch SIGTERM, which is used to stop the workers in TournamentRunner.terminate()
+    os.environ['SDL_NO_SIGNAL_HANDLERS'] = "1"
+
+
+class TournamentRunner:
+    """ Runs games on a pool of long-lived worker processes (one per core by default) """
+
+    def __init__(self, num_workers=None, log_level=logging.WARNING, chunksize=1, profiling=None):
+        """
+
+        Args:
+            num_workers (int): number of worker processes, defaults to the number of cores
+            log_level: log level inside the workers
+            chunksize (int): number of jobs sent to a worker at once. Larger values reduce IPC for very short games.
+            profiling (dict): profile all games, e.g. dict(output_dir="./profiles", mode='sampling', slowest=10).
+                              One collapsed stack file is written per game.
+        """
+        self.num_workers = os.cpu_count() if num_workers is None else num_workers
+        self.chunksize = chunksize
+        self.profiling = profiling
+        self.pool = multiprocessing.Pool(processes=self.num_workers, initializer=_init_worker,
+                                         initargs=(log_level,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        """ Stop the workers immediately, discarding all jobs that are not finished yet"""
+        self.pool.terminate()
+
+    def run(self, jobs):
+        """ Generator that yields the result records of `jobs` in the order in which the games finish"""
+        yield from self.pool.imap_unordered(play_job, add_profiling(jobs, self.profiling), chunksize=self.chunksize)
@@ -0,0 +1,170 @@
+"""Pool of pre-imported worker processes that receive game jobs over pipes
+
+Compared to launching a Python subprocess per game (which read its settings from a pickle in a run directory), the
+interpreter start and the imports (pygame, pandas, shapely, ...) are paid once per worker. Games still run in separate
+processes: workers are recycled after a fixed number of games and replaced if they crash, without affecting the other
+workers or the parent.
+"""
+import logging
+import multiprocessing
+import os
+import traceback
+from collections import deque
+from multiprocessing.connection import wait
+
+from evaluation.tournament import add_profiling
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(conn, max_games, log_level):
+    # Pay for the heavy imports once, before the first job arrives
+    from log import setup_colored_logs
+    from evaluation.tournament import play_job
+    import game  # noqa: F401 (pre-import)
+
+    setup_colored_logs(log_level)
+
+    for num_games in range(1, max_games + 1):
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        retiring = num_games == max_games
+        try:
+            conn.send(('ok', play_job(job), retiring))
+        except Exception:
+            conn.send(('error', dict(job_id=job.get('job_id'), error=traceback.format_exc()), retiring))
+
+
+class _Worker:
+    def __init__(self, ctx, max_games, log_level):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, max_games, log_level), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.job = None
+        self.num_attempts = 0
+
+    def send(self, job):
+        self.job = job
+        self.conn.send(job)
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class WarmWorkerPool:
+    """ Pool of persistent, pre-imported worker processes that play game jobs (see evaluation.tournament)"""
+
+    def __init__(self, num_workers=None, max_games_per_worker=200, max_retries=1, log_level=logging.WARNING,
+                 start_method=None, profiling=None):
+        """
+
+        Args:
+            num_workers (int): number of worker processes, defaults to the number of cores
+            max_games_per_worker (int): a worker is replaced by a fresh process after this many games
+            max_retries (int): number of times a job is re-scheduled after its worker crashed
+            log_level: log level inside the workers
+            start_method (str): multiprocessing start method ('fork', 'spawn', 'forkserver'), defaults to the
+                                platform default
+            profiling (dict): profile all games, see evaluation.tournament.play_job()
+        """
+        self.num_workers = os.cpu_count() if num_workers is None else num_workers
+        self.max_games_per_worker = max_games_per_worker
+        self.max_retries = max_retries
+        self.log_level = log_level
+        self.profiling = profiling
+        self._ctx = multiprocessing.get_context(start_method)
+        self.workers = [self._start_worker() for _ in range(self.num_workers)]
+        self.num_recycled = 0
+        self.num_crashes = 0
+
+    def _start_worker(self):
+        return _Worker(self._ctx, self.max_games_per_worker, self.log_level)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for w in self.workers:
+            w.stop()
+        self.workers = []
+
+    def terminate(self):
+        """ Kill the workers immediately, discarding all jobs that are not finished yet"""
+        for w in self.workers:
+            w.process.kill()
+            w.process.join()
+            w.conn.close()
+        self.workers = []
+
+    def _replace(self, worker):
+        worker.stop()
+        new_worker = self._start_worker()
+        self.workers[self.workers.index(worker)] = new_worker
+        return new_worker
+
+    def run(self, jobs):
+        """ Generator that yields a result record per job in the order in which the games finish.
+
+        Jobs whose worker crashed more than `max_retries` times yield a record {'job_id': ..., 'error': ...}
+        """
+        queue = deque((job, 0) for job in add_profiling(jobs, self.profiling))
+
+        def dispatch(worker):
+            if len(queue) > 0:
+                job, attempts = queue.popleft()
+                worker.num_attempts = attempts
+                worker.send(job)
+
+        for w in self.workers:
+            dispatch(w)
+
+        while any(w.job is not None for w in self.workers):
+            busy = {w.conn: w for w in self.workers if w.job is not None}
+            sentinels = {w.process.sentinel: w for w in busy.values()}
+            for ready in wait(list(busy) + list(sentinels)):
+                worker = busy.get(ready, sentinels.get(ready))
+                if worker.job is None:
+                    # already handled via its connection
+                    continue
+
+                try:
+                    status, record, retiring = worker.conn.recv()
+                except (EOFError, OSError):
+                    # Worker process died while playing
+                    self.num_crashes += 1
+                    job, attempts = worker.job, worker.num_attempts
+                    logger.warning(f"Worker {worker.process.pid} crashed (exit code {worker.process.exitcode}) "
+                                   f"while playing job {job.get('job_id')}")
+                    worker.job = None
+                    worker = self._replace(worker)
+                    if attempts < self.max_retries:
+                        queue.appendleft((job, attempts + 1))
+                    else:
+                        yield dict(job_id=job.get('job_id'), error=f"worker crashed {attempts + 1} times")
+                    dispatch(worker)
+                    continue
+
+                worker.job = None
+                if status == 'error':
+                    logger.warning(f"Job {record['job_id']} failed:\n{record['error']}")
+                if retiring:
+                    self.num_recycled += 1
+                    worker = self._replace(worker)
+                dispatch(worker)
+                yield record
@@ -1,5 +1,6 @@
 # Import the pygame module
 import logging
+import os
 import random
 
 # Import pygame.locals for easier access to key coordinates
@@ -14,10 +15,12 @@ import pygame.freetype  # Import the freetype module.
 import numpy as np
 from math import pi,sqrt, asin
 
-from players.player_base import Player, ReasonOfDeath
+from players.player_base import Player, PlayerAction, ReasonOfDeath
 from players.human_player import HumanPlayer
-from players.aiplayers import AIPlayer, WallAvoidingAIPlayer, RandomSteeringAIPlayer, NStepPlanPlayer
-from players.misc_players import ScriptedPlayer, FixedActionListPlayer
+from players.aiplayers import AIPlayer, WallAvoidingAIPlayer, RandomSteeringAIPlayer, NStepPlanPlayer, RemotePlayer, \
+    PolicyPlayer, MCTSPlayer, PotentialFieldPlayer
+from players.misc_players import ScriptedPlayer, FixedActionListPlayer, ReplayPlayer
+from observations import DangerField, EgocentricPatchObserver, PixelObservationRenderer, RaycastSensor
 
 # Define the enemy object by extending pygame.sprite.Sprite
 
@@ -64,22 +67,41 @@ class AchtungDieKurveGame:
 
     def __init__(self, mode="gui", target_fps=30., game_speed_factor=1.0, run_until_last_player_dies=False,
                  wall_collision_penalty=200., self_collision_penalty=150., player_collision_penalty=100.,
-                 survival_reward=100., ignore_self_collisions=False, rng_seed=None):
+                 survival_reward=100., ignore_self_collisions=False, rng_seed=None, tick_rate=None,
+                 max_frame_time=0.25, trail_format='list'):
         """
 
         Args:
-            target_fps (float):
+            target_fps (float): Rate at which frames are rendered (gui modes only)
             game_speed_factor (float):
             run_until_last_player_dies (bool):
             mode (str):
             wall_collision_penalty: float
             self_collision_penalty (float):
             ignore_self_collisions (bool):
-            startpos_seed (int):
+            rng_seed (int): seed for start positions, holes and numpy's global RNG (used by AI players). If set, the
+                            game is fully determined by its settings and players.
+            tick_rate (float): Fixed rate at which the game state is simulated (ticks per second of game time).
+                               Defaults to `target_fps`. Player movement per tick only depends on this value.
+            max_frame_time (float): Upper limit (in seconds) of real time that is simulated between two rendered
+                                    frames. Prevents the game from freezing if ticks take longer than real time.
+            trail_format (str): 'list' (one float64 point per tick, NaN for holes), 'compact' (float32 points and
+                                hole ranges, see players.trails.CompactTrail) or 'segments' (line and arc segments,
+                                see players.trail_segments.SegmentTrail). The compact formats need less memory and
+                                spare collision checks and planners the NaN handling in long games. Collisions are
+                                checked exactly in 'list' and 'segments' format. 'compact' checks them against its
+                                float32 points, so close calls can end differently than in the other formats.
+                                Planners see the arcs of 'segments' as polylines.
         """
-        if rng_seed is not None:
-            np.random.seed(rng_seed)
-        self._rng_seed = rng_seed
+        # Settings that fully determine the game (together with the player setup), e.g. used for replays
+        self.game_settings = dict(target_fps=target_fps, game_speed_factor=game_speed_factor,
+                                  run_until_last_player_dies=run_until_last_player_dies,
+                                  wall_collision_penalty=wall_collision_penalty,
+                                  self_collision_penalty=self_collision_penalty,
+                                  player_collision_penalty=player_collision_penalty,
+                                  survival_reward=survival_reward, ignore_self_collisions=ignore_self_collisions,
+                                  rng_seed=rng_seed, tick_rate=tick_rate, max_frame_time=max_frame_time,
+                                  trail_format=trail_format)
 
 
         if mode in ["gui", "gui-debug", "headless"]:
@@ -107,24 +129,25 @@ class AchtungDieKurveGame:
                             self.screen_height - self.player_radius]
 
         self.target_fps = target_fps
-        #dt_per_tick = 1/self.target_fps
-        self.current_frame = -1 # game has not been started yet
-        self.dist_per_tick = self.player_speed/self.target_fps # distance travelled by player during 1 tick
+        # Simulation runs at a fixed tick rate, independent of the rate at which frames are rendered
+        self.tick_rate = target_fps if tick_rate is None else tick_rate
+        self.dt_per_tick = 1/self.tick_rate
+        self.max_frame_time = max_frame_time
+        self.dist_per_tick = self.player_speed/self.tick_rate # distance travelled by player during 1 tick
         self.dphi_per_tick = 2*asin(self.dist_per_tick/(2*self.min_turn_radius)) # angle change in randians per tick
         #self.player_turn_rate = self.player_speed / self.min_turn_radius # turn rate (radians per second)
         #logging.info(f"dphi_per_tick = {self.dphi_per_tick * 180/pi}")
 
-        self.players = []
-        self.active_players = []
-        self.winner = None
         # Scoring
-        self.scoreboard = {idx:0 for idx in AchtungDieKurveGame.player_keys}
         self.wall_collision_penalty = wall_collision_penalty   # subtracted from rewards in case of wall collision
         self.self_collision_penalty = self_collision_penalty   # subtracted from rewards in case of self collision
         self.player_collision_penalty = player_collision_penalty  # subtracted from rewards in case of collision with opponent
         self.survival_reward = survival_reward  # reward for surviving longer than an opponent (awarded when opponent dies)
 
         # Initialize pygame
+        if self.mode == 'headless':
+            # Headless games must not require a display (e.g. on compute servers or in worker processes)
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
         pygame.init()
         # Fonts
         self.font = pygame.freetype.SysFont(pygame.freetype.get_default_font(), size=22)
@@ -132,37 +155,80 @@ class AchtungDieKurveGame:
 
         # Create the screen object
         # The size is determined by the constant SCREEN_WIDTH and SCREEN_HEIGHT
-        flags = pygame.HWSURFACE | pygame.SCALED
         if self.mode == 'headless':
-            flags |= pygame.HIDDEN
+            # No window required. Several headless games can exist in the same process.
+            self.screen = pygame.Surface((self.screen_width, self.screen_height))
         else:
-            flags |= pygame.SHOWN
-
-        self.screen = pygame.display.set_mode(size=(self.screen_width, self.screen_height), flags=flags)
-        self.screen.fill(self.bg_color)
+            flags = pygame.HWSURFACE | pygame.SCALED | pygame.SHOWN
+            self.screen = pygame.display.set_mode(size=(self.screen_width, self.screen_height), flags=flags)
+        # Off-screen surface that accumulates the trails. The screen is composed from it for each rendered frame,
+        # player heads are drawn on top at positions interpolated between ticks.
+        self.trail_surface = pygame.Surface((self.screen_width, self.screen_height))
 
         # Setup game clock
         self.clock = pygame.time.Clock()
 
+        if trail_format not in ('list', 'compact', 'segments'):
+            raise ValueError(f"Invalid trail format '{trail_format}'")
+        self.trail_format = trail_format
+
         # Debug flags
         self.run_until_last_player_dies = run_until_last_player_dies
         self.ignore_self_collisions = ignore_self_collisions
 
-        # Diagnostics
-        self.timing_stats = []
+        self.profiler = None
+        self.reset(rng_seed)
 
         colorama.init()
 
+    def reset(self, rng_seed=None):
+        """ Prepare a new round with the same settings. Removes all players and tick observers, but keeps the pygame
+        engine (display, fonts, clock) alive, so that one game object can be reused for many rounds.
+
+        Args:
+            rng_seed (int): seed of the new round (see __init__)
+        """
+        self.game_settings['rng_seed'] = rng_seed
+        if rng_seed is None:
+            # Always use a seed for start positions and holes, so that every game can be replayed. It is drawn from
+            # the OS, since forked worker processes share the state of np.random.
+            rng_seed = random.SystemRandom().randrange(2**31 - 1)
+        np.random.seed(rng_seed)
+        self._rng_seed = rng_seed
+        self.spawn_rng = random.Random(rng_seed)
 
-    @staticmethod
-    def _roll_random_angle():
-        return 2*pi*random.random()
+        self.running = False
+        self.paused = False
+        self.current_frame = -1 # game has not been started yet (counts ticks)
+        self.players = []
+        self.active_players = []
+        self.winner = None
+        self.scoreboard = {idx:0 for idx in AchtungDieKurveGame.player_keys}
+
+        self.screen.fill(self.bg_color)
+        self.trail_surface.fill(self.bg_color)
+        self._prev_head_positions = {}
+
+        # Objects that are notified after every tick via `on_tick(game)`, e.g. observation renderers
+        self.tick_observers = []
+        self.replay_recorder = None
+        if self.profiler is not None:
+            self.profiler.stop()
+        self.profiler = None
+
+        # Diagnostics
+        self.timing_stats = []  # one entry per tick
+        self.render_stats = []  # one entry per rendered frame
+        self.num_skipped_frames = 0
+
+    def _roll_random_angle(self):
+        return 2*pi*self.spawn_rng.random()
 
     def _roll_valid_start_position(self, max_attempts=100):
         attempt_counter = 0
         while attempt_counter < max_attempts:
-            x = self.min_turn_radius + (self.screen_width - 2 * self.min_turn_radius) * random.random()
-            y = self.min_turn_radius + (self.screen_height - 2 * self.min_turn_radius) * random.random()
+            x = self.min_turn_radius + (self.screen_width - 2 * self.min_turn_radius) * self.spawn_rng.random()
+            y = self.min_turn_radius + (self.screen_height - 2 * self.min_turn_radius) * self.spawn_rng.random()
 
             for p in self.players:
                 dist = sqrt((x - p.pos[0])**2 + (y - p.pos[1])**2)
@@ -204,12 +270,14 @@ class AchtungDieKurveGame:
             color = pygame.Color(color)
 
         player_kwargs = dict(idx=idx, init_pos=init_pos, init_angle=init_angle,
+                             rng=np.random.default_rng([self._rng_seed, idx]),
                              dist_per_tick=self.dist_per_tick,
                              dphi_per_tick=self.dphi_per_tick,
                              steer_left_key=self.player_keys[idx]['left'],
                              steer_right_key=self.player_keys[idx]['right'],
                              radius=self.player_radius,
                              color=color, color_name=color_name,
+                             trail_format=self.trail_format,
                              )
 
         if player_type == "human" or player_type in [Player,HumanPlayer]:
@@ -221,6 +289,8 @@ class AchtungDieKurveGame:
             scripted_player_kwargs.update(kwargs)
             if player_type == FixedActionListPlayer:
                 p = FixedActionListPlayer(**scripted_player_kwargs)
+            elif player_type == ReplayPlayer:
+                p = ReplayPlayer(**scripted_player_kwargs)
             else:
                 raise ValueError(f"Invalid scripted player type {player_type}")
         elif issubclass(player_type, AIPlayer):
@@ -238,6 +308,15 @@ class AchtungDieKurveGame:
                     raise NotImplementedError
             elif player_type == NStepPlanPlayer:
                 p = NStepPlanPlayer(**aiplayer_kwargs)
+            elif player_type == RemotePlayer:
+                p = RemotePlayer(**aiplayer_kwargs)
+            elif player_type == PolicyPlayer:
+                p = PolicyPlayer(game=self, **aiplayer_kwargs)
+            elif player_type == PotentialFieldPlayer:
+                p = PotentialFieldPlayer(game=self, **aiplayer_kwargs)
+            elif player_type == MCTSPlayer:
+                aiplayer_kwargs.setdefault('search_seed', [self._rng_seed, idx, 1])
+                p = MCTSPlayer(game=self, **aiplayer_kwargs)
             else:
                 raise ValueError(f"Invalid AI player type {player_type}")
         else:
@@ -259,6 +338,8 @@ class AchtungDieKurveGame:
         elif reason == ReasonOfDeath.OpponentCollision:
             p.total_reward -= self.player_collision_penalty
 
+        p.reason_of_death = reason
+        p.death_tick = self.current_frame
         self.active_players.remove(p)
         # Increment scores of all remaining players
         for op in self.active_players:
@@ -280,11 +361,81 @@ class AchtungDieKurveGame:
                 self.spawn_player(player_id)
 
 
+    def add_tick_observer(self, observer):
+        """ Register an object whose method `on_tick(game)` is called at the end of every tick """
+        self.tick_observers.append(observer)
+        return observer
+
+    def record_replay(self, keyframe_interval=None, record_debug_trails=False):
+        """ Start recording a replay of this game. Must be called before the first tick.
+
+        Args:
+            keyframe_interval (int): store a keyframe of the game state every `keyframe_interval` ticks (optional)
+            record_debug_trails (bool): also record the planned trails of NStepPlanPlayers (for the replay viewer)
+
+        Returns: ReplayRecorder
+        """
+        from replay import ReplayRecorder
+        self.replay_recorder = ReplayRecorder(self, keyframe_interval=keyframe_interval,
+                                              record_debug_trails=record_debug_trails)
+        return self.add_tick_observer(self.replay_recorder)
+
+    def save_replay(self, fp:str):
+        """ Save the replay recorded since `record_replay()` was called"""
+        if self.replay_recorder is None:
+            raise RuntimeError("No replay has been recorded for this game. Call `record_replay()` before starting it.")
+        return self.replay_recorder.save(fp)
+
+    def enable_profiling(self, mode='sampling', ticks=None, slowest=None, interval=0.001):
+        """ Profile the ticks of this game (see profiling.TickProfiler). Call `save(fp)` on the returned profiler
+        to write the collapsed stacks after the game.
+
+        Args:
+            mode (str): 'sampling' or 'deterministic'
+            ticks (tuple): only profile ticks in [ticks[0], ticks[1])
+            slowest (int): only keep the N slowest ticks
+            interval (float): sampling interval in seconds
+        """
+        from profiling import TickProfiler
+        self.profiler = TickProfiler(mode=mode, ticks=ticks, slowest=slowest, interval=interval)
+        return self.profiler
+
+    def publish_shared_state(self, capacity=2**16, name=None):
+        """ Publish the game state in shared memory after every tick (see remote.shared_state), so that agents in
+        other processes can read it without copying. Call `close()` on the returned publisher after the game."""
+        from remote.shared_state import SharedStatePublisher
+        return self.add_tick_observer(SharedStatePublisher(self, capacity=capacity, name=name))
+
+    def create_pixel_observer(self, **renderer_kwargs):
+        """ Create an off-screen PixelObservationRenderer for this game that is updated after every tick"""
+        renderer = PixelObservationRenderer(self.screen_width, self.screen_height, player_radius=self.player_radius,
+                                            player_indices=self.valid_player_indices, **renderer_kwargs)
+        renderer.update(self.players)
+        return self.add_tick_observer(renderer)
+
+    def create_raycast_sensor(self, num_rays=16, fov=2 * pi, max_range=None, **sensor_kwargs):
+        """ Create a RaycastSensor for this game (see observations.raycast) that is updated after every tick. Call
+        `sense()` on it to get the ray distances of all players."""
+        sensor = RaycastSensor(self, num_rays=num_rays, fov=fov, max_range=max_range, **sensor_kwargs)
+        return self.add_tick_observer(sensor)
+
+    def create_patch_observer(self, size=32, resolution=4., num_headings=64, **observer_kwargs):
+        """ Create an EgocentricPatchObserver for this game (see observations.local_patches) that is updated after every
+        tick. Call `observe()` on it to get the heading-aligned patches of all players."""
+        observer = EgocentricPatchObserver(self, size=size, resolution=resolution, num_headings=num_headings,
+                                           **observer_kwargs)
+        return self.add_tick_observer(observer)
+
+    def create_danger_field(self, **field_kwargs):
+        """ Create a DangerField for this game (see observations.danger_field) that is updated after every tick. Call
+        `sample()` on it to get the danger at any positions."""
+        return self.add_tick_observer(DangerField(self, **field_kwargs))
+
     def draw_start_positions(self):
         for p in self.active_players:
-            p.draw(self.screen)
+            p.draw(self.trail_surface)
 
-        pygame.display.flip()
+        self.render_frame()
 
 
     def move_players(self, pressed_keys, draw=True, draw_debug=False):
@@ -298,21 +449,30 @@ class AchtungDieKurveGame:
         timing = {'coll_checks':0., 'draw':0., 'draw_dbg':0.}
 
         # NOTE: parallelize this?
-        for p in self.active_players:
+        profiler = self.profiler
+        # Iterate over a copy: players that collide are removed from `active_players` during the loop
+        for p in list(self.active_players):
+            if profiler is not None:
+                profiler.set_phase('move', p.idx)
             # Process player input
             p.apply_steering(pressed_keys)
-            # Update player positions
-            p.move()
-            # Draw player at its current position
+            # Stamp the player at its position of the previous tick. The trail lags one tick behind, the newest part is
+            # drawn by the head, which render_frame() interpolates between the previous and the current position.
             if draw:
+                if profiler is not None:
+                    profiler.set_phase('draw', p.idx)
                 t0 = time.time()
-                p.draw(self.screen)
+                p.draw(self.trail_surface)
                 timing['draw'] += time.time() - t0
+            # Update player positions
+            p.move()
             if draw_debug:
                 t0 = time.time()
-                p.draw_debug_info(self.screen)
+                p.draw_debug_info(self.trail_surface)
                 timing['draw_dbg'] += time.time() - t0
 
+            if profiler is not None:
+                profiler.set_phase('collision', p.idx)
             t0 = time.time()
             # Detect wall collisions
             if self.detect_wall_collision(p):
@@ -336,14 +496,22 @@ class AchtungDieKurveGame:
 
             timing['coll_checks'] += time.time() - t0
 
+            # Heads are only drawn for active players, stamp the final position of a player that just died
+            if draw and p not in self.active_players:
+                t0 = time.time()
+                p.draw(self.trail_surface)
+                timing['draw'] += time.time() - t0
+
         return timing
 
 
     def get_game_state(self):
+        """ Trail (N x 2 array, NaN rows are holes), alive status and angles of every player. With trail format
+        'compact' or 'segments', 'trail' is the trail object of the player itself (not a copy)."""
         game_state = {}
         for p in self.players:
             game_state[p.idx] = {'alive': p in self.active_players,
-                                 'trail': np.asarray(p.trail),
+                                 'trail': np.asarray(p.trail) if self.trail_format == 'list' else p.trail,
                                  'angles': np.asarray(p.angle_history)}
 
         return game_state
@@ -355,55 +523,93 @@ class AchtungDieKurveGame:
         with open(fp,"wb") as f:
            pickle.dump(game_state, f)
 
-    def draw_wall_zones(self):
+    def draw_wall_zones(self, surface=None):
+        if surface is None:
+            surface = self.screen
         c = pygame.color.Color("cyan")
         w = 1
         R = self.min_turn_radius
-        pygame.draw.line(self.screen, c, (0,2*R),(self.screen_width, 2*R), w)
-        pygame.draw.line(self.screen, c, (0, self.screen_height - 2 * R), (self.screen_width, self.screen_height - 2 * R), w)
-        pygame.draw.line(self.screen, c, (2*R,0),(2*R, self.screen_height), w)
-        pygame.draw.line(self.screen, c, (self.screen_width - 2*R,0), (self.screen_width - 2*R, self.screen_height), w)
+        pygame.draw.line(surface, c, (0,2*R),(self.screen_width, 2*R), w)
+        pygame.draw.line(surface, c, (0, self.screen_height - 2 * R), (self.screen_width, self.screen_height - 2 * R), w)
+        pygame.draw.line(surface, c, (2*R,0),(2*R, self.screen_height), w)
+        pygame.draw.line(surface, c, (self.screen_width - 2*R,0), (self.screen_width - 2*R, self.screen_height), w)
 
         c = pygame.color.Color("green")
         rect = pygame.rect.Rect(R,R,self.screen_width - 2*R, self.screen_height - 2*R)
-        pygame.draw.rect(self.screen, c, rect=rect, width=w)
+        pygame.draw.rect(surface, c, rect=rect, width=w)
 
 
     def draw_debug_info(self):
         # Draw player info
         for ap in self.active_players:
-            ap.draw_debug_info(self.screen)
+            ap.draw_debug_info(self.trail_surface)
+
+    def draw_heads(self, surface, alpha=1.0):
+        """ Draw heads of active players, interpolated between their positions in the previous and the current tick.
+
+        Args:
+            surface: pygame surface to draw on
+            alpha (float): interpolation factor in [0, 1]. 0 -> previous tick, 1 -> current tick
+        """
+        for p in self.active_players:
+            prev_pos = self._prev_head_positions.get(p.idx, p.pos)
+            pos = prev_pos + alpha * (p.pos - prev_pos)
+            surface.blit(p.surf, (pos[0] - p.radius, pos[1] - p.radius))
+
+    def render_frame(self, alpha=1.0, wall_zones=False):
+        """ Compose the screen from the trail surface and the (interpolated) player heads, then flip the display
+
+        Returns: time spent on rendering
+        """
+        t0 = time.time()
+        self.screen.blit(self.trail_surface, (0, 0))
+        if wall_zones:
+            self.draw_wall_zones(self.screen)
+        self.draw_heads(self.screen, alpha)
+        pygame.display.flip()
+        return time.time() - t0
 
-    def tick_forward(self):
+    def tick_forward(self, draw=None, actions=None):
         """
         Advance game state by one tick
 
+        Args:
+            draw (bool): draw the trails (and debug info in mode 'gui-debug'). Defaults to True in the gui modes.
+            actions (dict): actions of AI players (idx -> PlayerAction) that were computed elsewhere, e.g. by a
+                            vectorized environment. These players are not queried.
+
         Return timing info
         """
         self.current_frame += 1
         logging.debug(f">==== Frame {self.current_frame:d} ===============")
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_tick(self.current_frame)
+
+        # Remember head positions for interpolation during rendering
+        self._prev_head_positions = {p.idx: p.pos.copy() for p in self.active_players}
 
         # Get key presses
         pressed_keys = pygame.key.get_pressed()
 
         # Query AI-players for steering input
         t0_ai = time.time()
-        game_state = self.get_game_state()
-        for ap in self.active_players:
-            if isinstance(ap, AIPlayer):
-                steering = ap.get_keypresses(game_state=game_state)
-                ap.apply_steering(steering)
+        self.apply_ai_actions(actions)
         dt_ai = time.time() - t0_ai
 
-        if self.mode == "gui":
-            timing = self.move_players(pressed_keys, draw=True, draw_debug=False)
-        elif self.mode == "gui-debug":
-            timing = self.move_players(pressed_keys, draw=True, draw_debug=True)
-        else:
-            timing = self.move_players(pressed_keys, draw=False, draw_debug=False)
+        if draw is None:
+            draw = self.mode != "headless"
+        timing = self.move_players(pressed_keys, draw=draw, draw_debug=draw and self.mode == "gui-debug")
 
         timing['ai'] = dt_ai
 
+        if profiler is not None:
+            profiler.set_phase('observers')
+        t0 = time.time()
+        for observer in self.tick_observers:
+            observer.on_tick(self)
+        timing['observers'] = time.time() - t0
+
         if len(self.active_players) == 1:
             self.winner = self.active_players[0]
             if not self.run_until_last_player_dies:
@@ -412,9 +618,44 @@ class AchtungDieKurveGame:
         elif len(self.active_players) == 0:
             self.running = False
 
+        if profiler is not None:
+            profiler.end_tick()
+
         return timing
 
 
+    def policy_groups(self, players=None):
+        """ Active PolicyPlayers (or those of `players`) grouped by their policy: dict policy -> list of players"""
+        groups = {}
+        for p in self.active_players if players is None else players:
+            if isinstance(p, PolicyPlayer) and p in self.active_players:
+                groups.setdefault(p.policy, []).append(p)
+        return groups
+
+    def apply_ai_actions(self, actions=None):
+        """ Query the active AI players for their actions and steer them. PolicyPlayers are queried once per policy
+        with the stacked observations of all its players. Players in `actions` (idx -> action) are not queried."""
+        actions = {} if actions is None else actions
+        profiler = self.profiler
+        ai_players = [ap for ap in self.active_players if isinstance(ap, AIPlayer) and ap.idx not in actions]
+        single_players = [ap for ap in ai_players if not isinstance(ap, PolicyPlayer)]
+        if len(single_players) > 0:
+            game_state = self.get_game_state()
+            for ap in single_players:
+                if profiler is not None:
+                    profiler.set_phase('ai', ap.idx)
+                action = ap.next_action(game_state)
+                logging.info(f"{ap} carries out {PlayerAction(action).name}")
+                ap.apply_action(action)
+        for policy, players in self.policy_groups(ai_players).items():
+            if profiler is not None:
+                profiler.set_phase('ai', players[0].idx)
+            for ap, action in zip(players, policy.actions(self, players)):
+                ap.apply_action(action)
+        for p in self.active_players:
+            if p.idx in actions:
+                p.apply_action(actions[p.idx])
+
     def reverse_tick(self):
         "Step back game by 1 tick"
 
@@ -429,17 +670,26 @@ class AchtungDieKurveGame:
             logging.info("Game continued")
 
     def run_game_loop(self, close_when_finished=True):
-        self.draw_start_positions()
-        # Show Start positions for a short time before starting
-        pygame.time.wait(500)
+        """ Run the game until it is finished or closed by the user.
+
+        The game state is advanced with a fixed timestep (`dt_per_tick`). In the gui modes, real time is accumulated
+        between rendered frames and as many ticks are simulated as fit into it. If rendering falls behind, frames are
+        skipped instead of slowing down the simulation. Player heads are interpolated between the last two ticks.
+        In headless mode, ticks are simulated back-to-back as fast as possible and nothing is rendered.
+        """
+        if self.mode != 'headless':
+            self.draw_start_positions()
+            # Show Start positions for a short time before starting
+            pygame.time.wait(500)
 
         # Variable to keep the main loop running
         self.running = True
         closed_by_user = False
+        accumulator = 0.0
+        t_last = time.perf_counter()
         # Main game loop
         while self.running:
-            ft_t0 = time.time() # frame time timer
-            timing = {}
+            ft_t0 = time.perf_counter() # frame time timer
             # Look at every event in the queue
             for event in pygame.event.get():
                 # Did the user hit a key?
@@ -457,37 +707,44 @@ class AchtungDieKurveGame:
             if self.paused:
                 # avoid looping too fast while paused
                 time.sleep(1/self.target_fps)
+                t_last = time.perf_counter()
                 continue
 
             if closed_by_user:
                 logging.info("Game was stopped by user")
                 self.running = False
                 self.quit()
+                break
 
-            if "debug" in self.mode:
-                t0 = time.time()
-                self.draw_wall_zones()
-                timing['draw_dbg'] = time.time() - t0
+            if self.mode == 'headless':
+                self._timed_tick()
+                continue
+
+            # Accumulate real time and simulate the matching number of ticks
+            t_now = time.perf_counter()
+            accumulator += min(t_now - t_last, self.max_frame_time)
+            t_last = t_now
 
-            # Advance game state by one tick
-            tf_timing = self.tick_forward()
-            timing.update(tf_timing)
+            num_ticks = 0
+            while accumulator >= self.dt_per_tick and self.running:
+                self._timed_tick()
+                accumulator -= self.dt_per_tick
+                num_ticks += 1
+
+            if num_ticks > 1:
+                self.num_skipped_frames += num_ticks - 1
 
             # Render the display (flip everything to the display)
-            t0 = time.time()
-            if "gui" in self.mode:
-                pygame.display.flip()
-            timing['draw'] += time.time() - t0
+            alpha = accumulator / self.dt_per_tick if self.running else 1.0
+            dt_render = self.render_frame(alpha, wall_zones="debug" in self.mode)
 
             if self.fps_locked:
-                # Ensure program maintains a target FPS
+                # Limit the render rate to the target FPS
                 self.clock.tick(self.target_fps)
-            else:
-                self.clock.tick() # used in headless mode
 
             # frame time: source of FPS calculation
-            timing['frame_time'] = time.time() - ft_t0
-            self.timing_stats.append(timing)
+            self.render_stats.append({'render': dt_render, 'ticks': num_ticks,
+                                      'frame_time': time.perf_counter() - ft_t0})
 
         # game has finished
         if self.mode == "gui" and self.winner is not None:
@@ -497,8 +754,16 @@ class AchtungDieKurveGame:
             if self.mode != 'headless':
                 pygame.time.wait(1200)
             self.quit()
-        else:
+        elif self.mode != 'headless':
             self.wait_for_window_close()
+        # else: keep the headless engine alive, e.g. for another round after `reset()`
+
+    def _timed_tick(self, actions=None):
+        """ Advance the game by one tick and record its timing """
+        t0 = time.perf_counter()
+        timing = self.tick_forward(actions=actions)
+        timing['tick_time'] = time.perf_counter() - t0
+        self.timing_stats.append(timing)
 
 
     def show_win_message(self):
@@ -510,10 +775,7 @@ class AchtungDieKurveGame:
         #self.running = False
 
     def flush_display(self, wall_zones=True):
-        if wall_zones:
-            self.draw_wall_zones()
-
-        pygame.display.flip()
+        self.render_frame(wall_zones=wall_zones)
 
 
     def wait_for_window_close(self):
@@ -563,23 +825,28 @@ class AchtungDieKurveGame:
     def print_timing_stats(self):
         timing_history = pd.DataFrame.from_records(self.timing_stats)
 
-        avg_fps_frametime = 1 / timing_history.frame_time.mean()
+        avg_tick_rate = 1 / timing_history.tick_time.mean()
 
-        timing_history.drop('frame_time',axis='columns', inplace=True)
+        timing_history.drop('tick_time',axis='columns', inplace=True)
         timing_history['total'] = timing_history.sum(axis=1)
         average_times = timing_history.mean(axis=0)
         average_times.sort_values(ascending=False, inplace=True)
 
-        avg_fps_total = 1 / average_times.total
-
-        print("---- Computation Time [ms] per Frame (avg) ----")
+        print("---- Computation Time [ms] per Tick (avg) ----")
         print("\n".join(str(average_times * 1000.).splitlines()[:-1]))
-        if self.fps_locked:
-            print(f"---- Average FPS (FPS locked, Target: {self.target_fps:.1f}) ----")
-        else:
-            print("---- Average FPS (FPS not locked) ----")
-        print(f"FPS (based on timing total): {avg_fps_total:6.1f}")
-        print(f"FPS (based on frame time):   {avg_fps_frametime:6.1f} ")
+        print(f"---- Simulation (fixed tick rate: {self.tick_rate:.1f}) ----")
+        print(f"Ticks per second (based on tick time): {avg_tick_rate:8.1f}")
+
+        if len(self.render_stats) > 0:
+            render_history = pd.DataFrame.from_records(self.render_stats)
+            avg_fps_frametime = 1 / render_history.frame_time.mean()
+            if self.fps_locked:
+                print(f"---- Rendering (FPS locked, Target: {self.target_fps:.1f}) ----")
+            else:
+                print("---- Rendering (FPS not locked) ----")
+            print(f"Render time per frame [ms] (avg): {render_history.render.mean() * 1000.:6.2f}")
+            print(f"FPS (based on frame time):        {avg_fps_frametime:6.1f}")
+            print(f"Skipped frames:                   {self.num_skipped_frames:6d}")
 
 
     def quit(self, force=False):
@@ -593,6 +860,10 @@ class AchtungDieKurveGame:
         else:
             logging.info("Closing game")
 
+        if self.mode == 'headless':
+            # Headless games share the pygame engine with other games in the same process, keep it alive
+            return
+
         # Unwind pygame engine
         pygame.display.quit()
         pygame.quit()
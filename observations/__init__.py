@@ -0,0 +1,4 @@
+from observations.pixel_renderer import PixelObservationRenderer
+from observations.local_patches import EgocentricPatchObserver
+from observations.raycast import HitType, RaycastSensor
+from observations.danger_field import DangerField
@@ -0,0 +1,165 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class DangerField:
+    """ Potential field of the danger of all positions in the arena, shared by all players of a game.
+
+    The field is the convolution of an occupancy raster (walls, trails and the predicted heads of the players) with a
+    Gaussian kernel: a single occupied cell at distance d contributes exp(-d^2 / 2 sigma^2). Sampling the field is a
+    lookup of the raster cell, so the danger of many positions (e.g. ahead of many players) is a single gather.
+
+    The walls are convolved once with the separable kernel. Trails only grow, so by linearity the trail part is
+    maintained incrementally: the kernel is added around every cell that gets occupied. The predicted heads (every
+    active player moving straight on for `prediction_ticks`) are stamped into a separate layer in every tick.
+    """
+
+    def __init__(self, game, resolution=4., sigma=8., truncate=2.5, head_weight=1., prediction_ticks=(5, 10, 15)):
+        """
+
+        Args:
+            game (AchtungDieKurveGame): game whose arena is observed
+            resolution (float): game units per raster cell
+            sigma (float): standard deviation of the Gaussian kernel (game units)
+            truncate (float): the kernel is cut off at `truncate` * sigma
+            head_weight (float): weight of the predicted heads relative to walls and trails
+            prediction_ticks: ticks ahead at which the heads of the players are predicted
+        """
+        self.game = game
+        self.resolution = float(resolution)
+        self.sigma = float(sigma)
+        self.head_weight = float(head_weight)
+        self.prediction_ticks = np.asarray(prediction_ticks, dtype=float)
+        self.width, self.height = game.screen_width, game.screen_height
+
+        # Kernel (2 r + 1 cells per axis) and its 1D factor
+        r = int(np.ceil(truncate * self.sigma / self.resolution))
+        x = np.arange(-r, r + 1) * self.resolution
+        self.kernel_1d = np.exp(-x ** 2 / (2 * self.sigma ** 2)).astype(np.float32)
+        self.kernel = np.outer(self.kernel_1d, self.kernel_1d)
+        self._kernel_flat = self.kernel.ravel()
+        self.kernel_radius = r
+        self._kernel_dy, self._kernel_dx = [d.ravel() for d in np.mgrid[-r:r + 1, -r:r + 1]]
+
+        # Padding of one kernel radius (plus one cell): the outermost cells are surrounded by walls only and have the
+        # maximum wall value. Samples beyond the padding are clipped to them.
+        self.padding = r + 1
+        self.shape = (int(np.ceil(self.height / self.resolution)) + 2 * self.padding,
+                      int(np.ceil(self.width / self.resolution)) + 2 * self.padding)
+        self.walls = self._convolve_walls()
+        self.trails = np.zeros(self.shape, dtype=np.float32)
+        self.heads = np.zeros(self.shape, dtype=np.float32)
+        self._occupied = np.zeros(self.shape, dtype=bool)
+        self._num_points_consumed = {}
+        self._head_cells = {}           # player idx -> predicted head cells (k x 2: row, col)
+        self.update(game)
+
+    def _convolve_walls(self):
+        p, r = self.padding, self.kernel_radius
+        walls = np.ones(self.shape, dtype=np.float32)
+        walls[p:-p, p:-p] = 0.
+        # Cells that are partially outside of the arena count as walls
+        if self.height % self.resolution > 0:
+            walls[-p - 1, :] = 1.
+        if self.width % self.resolution > 0:
+            walls[:, -p - 1] = 1.
+        # Separable convolution (rows, then columns). The raster is extended with walls, so that the padding is
+        # surrounded by walls as well.
+        extended = np.pad(walls, r, constant_values=1.)
+        windows = np.lib.stride_tricks.sliding_window_view(extended, 2 * r + 1, axis=0)
+        walls_rows = windows @ self.kernel_1d
+        windows = np.lib.stride_tricks.sliding_window_view(walls_rows, 2 * r + 1, axis=1)
+        return np.ascontiguousarray(windows @ self.kernel_1d, dtype=np.float32)
+
+    def to_cells(self, points):
+        """ (rows, cols) of game coordinates (... x 2), clipped to the raster"""
+        points = np.asarray(points)
+        cols = np.floor(points[..., 0] / self.resolution).astype(np.intp) + self.padding
+        rows = np.floor(points[..., 1] / self.resolution).astype(np.intp) + self.padding
+        return np.clip(rows, 0, self.shape[0] - 1), np.clip(cols, 0, self.shape[1] - 1)
+
+    def _stamp(self, layer, rows, cols, weight=1.):
+        """ Add the kernel (times `weight`) around the cells (rows, cols) to `layer`"""
+        stamp_rows = np.clip(rows[:, np.newaxis] + self._kernel_dy, 0, self.shape[0] - 1)
+        stamp_cols = np.clip(cols[:, np.newaxis] + self._kernel_dx, 0, self.shape[1] - 1)
+        np.add.at(layer, (stamp_rows, stamp_cols), np.float32(weight) * self._kernel_flat)
+
+    def _inside(self, points):
+        return (points[:, 0] >= 0) & (points[:, 0] < self.width) & (points[:, 1] >= 0) & (points[:, 1] < self.height)
+
+    def on_tick(self, game):
+        """ Tick observer interface of AchtungDieKurveGame """
+        self.update(game)
+
+    def update(self, game):
+        """ Add the trail points of all players that are new since the last update and predict the heads"""
+        new_points = []
+        for p in game.players:
+            num_consumed = self._num_points_consumed.get(p.idx, 0)
+            num_points = len(p.trail)
+            if num_points < num_consumed:
+                # Trail got shorter (reverse_tick()) -> rebuild the trail layer
+                logger.debug(f"Trail of {p} shrank, rebuilding the danger field")
+                self.trails.fill(0.)
+                self._occupied.fill(False)
+                self._num_points_consumed = {}
+                return self.update(game)
+            if num_points > num_consumed:
+                new_points.append(np.asarray(p.trail[num_consumed:], dtype=float).reshape(-1, 2))
+                self._num_points_consumed[p.idx] = num_points
+
+        if new_points:
+            points = np.concatenate(new_points)
+            # Holes and points outside of the arena (wall collisions)
+            points = points[~np.isnan(points[:, 0])]
+            points = points[self._inside(points)]
+            rows, cols = self.to_cells(points)
+            cells = np.unique(rows * self.shape[1] + cols)
+            cells = cells[~self._occupied.ravel()[cells]]
+            if cells.size > 0:
+                self._occupied.ravel()[cells] = True
+                self._stamp(self.trails, *np.divmod(cells, self.shape[1]))
+
+        self.heads.fill(0.)
+        self._head_cells = {}
+        players = game.active_players
+        if len(players) > 0 and self.head_weight != 0:
+            pos = np.array([p.pos for p in players], dtype=float).reshape(-1, 2)
+            angles = np.array([p.angle for p in players], dtype=float)
+            dist = np.array([p.dist_per_tick for p in players], dtype=float)[:, np.newaxis] * self.prediction_ticks
+            heads = pos[:, np.newaxis, :] + dist[..., np.newaxis] * np.stack([np.cos(angles), np.sin(angles)],
+                                                                             axis=-1)[:, np.newaxis, :]
+            rows, cols = self.to_cells(heads)
+            inside = self._inside(heads.reshape(-1, 2)).reshape(rows.shape)
+            # Heads beyond the walls are not stamped (cells far away from the arena stand for them in _head_cells)
+            rows, cols = np.where(inside, rows, -self.shape[0]), np.where(inside, cols, -self.shape[1])
+            self._stamp(self.heads, rows[inside], cols[inside], self.head_weight)
+            self._head_cells = {p.idx: np.stack([rows[k], cols[k]], axis=1) for k, p in enumerate(players)}
+
+    def sample(self, points, players=None):
+        """ Danger at `points` (game coordinates, n x m x 2 or m x 2).
+
+        Args:
+            points: positions to sample
+            players: n players the rows of `points` belong to. The predicted heads of a player are not dangerous to
+                     itself and are left out of its samples.
+
+        Returns:
+            float32 array (n, m) or (m,)
+        """
+        rows, cols = self.to_cells(points)
+        danger = self.walls[rows, cols] + self.trails[rows, cols] + self.heads[rows, cols]
+        if players is None or not self._head_cells:
+            return danger
+
+        far = np.full((len(self.prediction_ticks), 2), -np.array(self.shape))
+        head_cells = np.stack([self._head_cells.get(p.idx, far) for p in players])    # (n, k, 2)
+        r = self.kernel_radius
+        dy = rows[:, :, np.newaxis] - head_cells[:, np.newaxis, :, 0]
+        dx = cols[:, :, np.newaxis] - head_cells[:, np.newaxis, :, 1]
+        inside = (np.abs(dy) <= r) & (np.abs(dx) <= r)
+        own = np.where(inside, self.kernel[np.clip(dy + r, 0, 2 * r), np.clip(dx + r, 0, 2 * r)], 0.)
+        return danger - np.float32(self.head_weight) * own.sum(axis=2, dtype=np.float32)
@@ -0,0 +1,109 @@
+import logging
+
+import numpy as np
+
+from observations.pixel_renderer import PixelObservationRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class EgocentricPatchObserver:
+    """ Heading-aligned occupancy patches around the heads of the players, for all players at once.
+
+    A patch is a `size` x `size` window of cells with `resolution` game units each, centered on the head of a player
+    and rotated with its heading: the player looks up (row 0 is ahead), its right-hand side is on the right. Channels:
+    trail of the player itself, trails of the opponents, walls (everything outside of the arena).
+
+    Patches are sampled from the owner-code raster of a PixelObservationRenderer (nearest cell, no pygame involved).
+    The headings are quantized into `num_headings` bins and the cell offsets of the sampling grid are precomputed per
+    bin, so that extracting the patches of all players is a single gather from the raster.
+    """
+
+    occupied_value = 255
+
+    def __init__(self, game, size=32, resolution=4., num_headings=64, renderer=None, downsample=1):
+        """
+
+        Args:
+            game (AchtungDieKurveGame): game whose players are observed
+            size (int): edge length of the patches in cells
+            resolution (float): game units per patch cell
+            num_headings (int): number of heading bins (sampling grids)
+            renderer (PixelObservationRenderer): single channel renderer of the game to sample from. It must be
+                                                 updated by someone else (e.g. created by create_pixel_observer()).
+                                                 By default, the observer creates and updates its own renderer.
+            downsample (int): game units per raster cell of the own renderer. Should be small compared to the trail
+                              width if `resolution` is, otherwise trails can fall between the samples.
+        """
+        self.game = game
+        self.size = int(size)
+        self.resolution = float(resolution)
+        self.num_headings = int(num_headings)
+
+        if renderer is None:
+            renderer = PixelObservationRenderer(game.screen_width, game.screen_height,
+                                                player_radius=game.player_radius, downsample=downsample,
+                                                player_indices=game.valid_player_indices)
+            renderer.update(game.players)
+            self._owns_renderer = True
+        elif renderer.per_player_channels:
+            raise ValueError("EgocentricPatchObserver needs a renderer with owner codes (per_player_channels=False)")
+        else:
+            self._owns_renderer = False
+        self.renderer = renderer
+        self._row_offsets, self._col_offsets = self._sampling_grids()
+
+    def _sampling_grids(self):
+        """ Offsets (rows, cols) of the raster cells of all patch cells relative to the cell of the head, per heading
+        bin: two int arrays (num_headings, size * size)"""
+        half = self.size / 2
+        rows, cols = np.mgrid[:self.size, :self.size]
+        forward = ((half - rows - 0.5) * self.resolution).ravel()
+        right = ((cols - half + 0.5) * self.resolution).ravel()
+
+        headings = 2 * np.pi * np.arange(self.num_headings) / self.num_headings
+        cos, sin = np.cos(headings)[:, np.newaxis], np.sin(headings)[:, np.newaxis]
+        # Heading (cos, sin), right-hand side (-sin, cos) in screen coordinates (y axis points down)
+        dx = forward * cos - right * sin
+        dy = forward * sin + right * cos
+        # Samples are taken relative to the center of the cell of the head. Rounding first keeps axis-aligned grids
+        # exact (e.g. cos(3 pi / 2) is not exactly 0).
+        scale = self.renderer.downsample
+        dy, dx = np.round(dy / scale, 6), np.round(dx / scale, 6)
+        return np.floor(dy + 0.5).astype(np.intp), np.floor(dx + 0.5).astype(np.intp)
+
+    def on_tick(self, game):
+        """ Tick observer interface of AchtungDieKurveGame """
+        if self._owns_renderer:
+            self.renderer.update(game.players)
+
+    def heading_bins(self, angles):
+        return np.rint(np.asarray(angles) * self.num_headings / (2 * np.pi)).astype(np.intp) % self.num_headings
+
+    def observe(self, players=None, out=None):
+        """ Patches of `players` (default: all players of the game, in the order of game.players) as uint8 array
+        (n_players, 3, size, size). Channels: self, opponents, walls. Pass a preallocated `out` array to avoid
+        allocations."""
+        if players is None:
+            players = self.game.players
+        n = len(players)
+        if out is None:
+            out = np.empty((n, 3, self.size, self.size), dtype=np.uint8)
+        elif not out.flags.c_contiguous:
+            raise ValueError("`out` must be a C-contiguous array")
+
+        buffer = self.renderer.buffer
+        heads = self.renderer.to_cells(np.array([p.pos for p in players], dtype=float).reshape(n, 2))
+        bins = self.heading_bins([p.angle for p in players])
+        rows = np.clip(heads[:, 1:2] + self._row_offsets[bins], 0, buffer.shape[0] - 1)
+        cols = np.clip(heads[:, 0:1] + self._col_offsets[bins], 0, buffer.shape[1] - 1)
+        codes = buffer[rows, cols]
+
+        own_codes = np.array([[p.idx + 1] for p in players], dtype=np.uint8).reshape(n, 1)
+        walls = codes == self.renderer.wall_value
+        own = codes == own_codes
+        patches = out.reshape(n, 3, -1)
+        np.multiply(own, self.occupied_value, out=patches[:, 0], casting='unsafe')
+        np.multiply((codes != 0) & ~own & ~walls, self.occupied_value, out=patches[:, 1], casting='unsafe')
+        np.multiply(walls, self.occupied_value, out=patches[:, 2], casting='unsafe')
+        return out
@@ -0,0 +1,161 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PixelObservationRenderer:
+    """ Off-screen renderer that rasterizes player trails directly into a preallocated uint8 NumPy buffer.
+
+    The raster does not depend on pygame or a display. It is updated incrementally: each call to `update()` only
+    draws the trail points that were added since the previous call. All observations returned by `observation` and
+    `crop()` are views into the buffer (no copies).
+
+    Buffer layout:
+      - single channel (default): shape (H, W), a cell contains the owner code of the trail that covers it
+        (player idx + 1), 0 for free cells and `wall_value` for cells outside of the arena
+      - per-player channels: shape (n_players + 1, H, W), channel k belongs to `player_indices[k]` and holds
+        `trail_value` where the trail of that player is drawn. The last channel holds the walls.
+
+    The buffer is padded by `padding` cells on every side (filled with walls), so that egocentric crops of up to
+    2*padding+1 cells can be returned as views even at the borders of the arena.
+    """
+
+    wall_value = 255
+    trail_value = 255
+
+    def __init__(self, width, height, player_radius=2.0, downsample=1, per_player_channels=False,
+                 player_indices=(0, 1, 2, 3, 4, 5, 6), crop_size=None):
+        """
+
+        Args:
+            width (int): width of the arena in game units (px)
+            height (int): height of the arena in game units (px)
+            player_radius (float): radius of the dots that make up a trail (game units)
+            downsample (int): number of game units per raster cell
+            per_player_channels (bool): use one channel per player instead of owner codes in a single channel
+            player_indices: player indices that get a channel (only used if per_player_channels is True)
+            crop_size (int): maximal edge length (in cells) of egocentric crops. Determines the padding of the buffer.
+        """
+        self.downsample = int(downsample)
+        if self.downsample < 1:
+            raise ValueError(f"Invalid downsample factor {downsample}. Must be an integer >= 1.")
+
+        self.width = int(np.ceil(width / self.downsample))
+        self.height = int(np.ceil(height / self.downsample))
+        self.per_player_channels = per_player_channels
+        self.player_indices = list(player_indices)
+        self._channel_of_player = {idx: k for k, idx in enumerate(self.player_indices)}
+
+        # Precompute cell offsets of a filled circle (stamp) with the player radius
+        r = max(player_radius / self.downsample, 0.5)
+        r_int = int(np.ceil(r))
+        dy, dx = np.mgrid[-r_int:r_int + 1, -r_int:r_int + 1]
+        inside = dx ** 2 + dy ** 2 <= r ** 2
+        self._stamp_dy = dy[inside].astype(np.intp)
+        self._stamp_dx = dx[inside].astype(np.intp)
+
+        self.crop_size = crop_size
+        self.padding = r_int + 1
+        if crop_size is not None:
+            self.padding = max(self.padding, int(crop_size) // 2 + 1)
+
+        shape = (self.height + 2 * self.padding, self.width + 2 * self.padding)
+        if self.per_player_channels:
+            shape = (len(self.player_indices) + 1,) + shape
+
+        self.buffer = np.zeros(shape, dtype=np.uint8)
+        self._num_points_drawn = {}  # number of trail points consumed per player
+        self.reset()
+
+    @property
+    def observation(self):
+        """ View of the raster without padding: (H, W) or (n_players + 1, H, W)"""
+        p = self.padding
+        return self.buffer[..., p:p + self.height, p:p + self.width]
+
+    def reset(self):
+        """ Clear all trails and redraw the walls """
+        self.buffer.fill(0)
+        p = self.padding
+        walls = self.buffer[-1] if self.per_player_channels else self.buffer
+        walls[:p, :] = self.wall_value
+        walls[-p:, :] = self.wall_value
+        walls[:, :p] = self.wall_value
+        walls[:, -p:] = self.wall_value
+        self._num_points_drawn = {}
+
+    def on_tick(self, game):
+        """ Tick observer interface of AchtungDieKurveGame """
+        self.update(game.players)
+
+    def update(self, players):
+        """ Draw all trail points that were added since the last update """
+        for p in players:
+            num_drawn = self._num_points_drawn.get(p.idx, 0)
+            num_points = len(p.trail)
+            if num_points < num_drawn:
+                # Trail got shorter (reverse_tick()) -> rebuild the whole raster
+                logger.debug(f"Trail of {p} shrank, redrawing all trails")
+                self.reset()
+                self.update(players)
+                return
+            if num_points > num_drawn:
+                self.draw_points(p.idx, np.asarray(p.trail[num_drawn:]))
+                self._num_points_drawn[p.idx] = num_points
+
+    def draw_points(self, player_idx, points):
+        """ Stamp trail points (N x 2 array in game coordinates, NaN rows are holes) of a player into the buffer"""
+        points = points[~np.isnan(points[:, 0])]
+        if points.shape[0] == 0:
+            return
+
+        rows, cols = self._stamp_indices(points)
+        if self.per_player_channels:
+            self.buffer[self._channel_of_player[player_idx], rows, cols] = self.trail_value
+        else:
+            self.buffer[rows, cols] = player_idx + 1
+
+    def _stamp_indices(self, points):
+        centers = self.to_cells(points)
+        rows = (centers[:, 1:2] + self._stamp_dy[np.newaxis, :]).ravel()
+        cols = (centers[:, 0:1] + self._stamp_dx[np.newaxis, :]).ravel()
+        # Points outside of the arena (e.g. in the tick of a wall collision) must not leave the buffer
+        np.clip(rows, 0, self.buffer.shape[-2] - 1, out=rows)
+        np.clip(cols, 0, self.buffer.shape[-1] - 1, out=cols)
+        return rows, cols
+
+    def to_cells(self, points):
+        """ Convert game coordinates (N x 2) to integer (col, row) indices into the padded buffer"""
+        return (np.floor(np.asarray(points) / self.downsample) + self.padding).astype(np.intp)
+
+    def crop(self, center, size=None):
+        """ Egocentric, axis-aligned crop of `size` x `size` cells around `center` (game coordinates).
+
+        Returns a view into the buffer, i.e. the crop is updated automatically by subsequent calls to `update()`.
+        """
+        if size is None:
+            size = self.crop_size
+        if size is None or size > 2 * self.padding - 1:
+            raise ValueError(f"Crop size {size} exceeds maximum crop size of this renderer ({self.crop_size})")
+
+        col, row = self.to_cells(np.asarray(center).reshape(1, 2))[0]
+        # keep the crop inside the padded buffer if the center is outside the arena
+        half = size // 2
+        row = int(np.clip(row, half, self.buffer.shape[-2] - size + half))
+        col = int(np.clip(col, half, self.buffer.shape[-1] - size + half))
+        return self.buffer[..., row - half:row - half + size, col - half:col - half + size]
+
+    def player_crops(self, players, size=None, out=None):
+        """ Stack egocentric crops around the heads of `players` into one array (n_players, [C,] size, size).
+
+        Stacking requires a copy; pass a preallocated `out` array to avoid allocations.
+        """
+        if size is None:
+            size = self.crop_size
+        if out is None:
+            out = np.empty((len(players),) + self.buffer.shape[:-2] + (size, size), dtype=np.uint8)
+        for k, p in enumerate(players):
+            out[k] = self.crop(p.pos, size)
+        return out
@@ -0,0 +1,142 @@
+import logging
+from enum import IntEnum
+
+import numpy as np
+
+from observations.pixel_renderer import PixelObservationRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class HitType(IntEnum):
+    Nothing = 0     # nothing within the range of the ray
+    Wall = 1
+    Self = 2        # trail of the player itself
+    Opponent = 3    # trail of another player
+
+
+class RaycastSensor:
+    """ Distances from the heads of the players to the nearest wall or trail along K rays fanned around their headings.
+
+    All rays of all players are cast in one vectorized pass. Trails are looked up in the owner-code raster of a
+    PixelObservationRenderer (updated incrementally after every tick), walls are intersected analytically. Rays are
+    marched in chunks of `chunk_size` samples, rays that hit something in a chunk are not marched any further.
+
+    Distances to trails are accurate up to the sample step (one raster cell), distances to walls are exact. Rays start
+    at `min_dist` from the head, otherwise they would hit the newest trail points of the player itself.
+    """
+
+    def __init__(self, game, num_rays=16, fov=2 * np.pi, max_range=None, renderer=None, downsample=1,
+                 chunk_size=32):
+        """
+
+        Args:
+            game (AchtungDieKurveGame): game whose players are sensed
+            num_rays (int): number of rays (K) per player
+            fov (float): angle in radians covered by the rays, centered on the heading. A full circle (2 pi, default)
+                         has one ray every 2 pi / K, starting straight ahead; otherwise the outermost rays are at
+                         +-fov/2.
+            max_range (float): maximum distance in game units (default: arena diagonal)
+            renderer (PixelObservationRenderer): single channel renderer of the game to use as occupancy grid. It must
+                                                 be updated by someone else (e.g. created by create_pixel_observer()).
+                                                 By default, the sensor creates and updates its own renderer.
+            downsample (int): game units per raster cell of the own renderer
+            chunk_size (int): number of samples per ray that are looked up in one pass
+        """
+        self.game = game
+        self.num_rays = int(num_rays)
+        self.fov = fov
+        if fov >= 2 * np.pi:
+            self.ray_offsets = 2 * np.pi * np.arange(self.num_rays) / self.num_rays
+        elif self.num_rays == 1:
+            self.ray_offsets = np.zeros(1)
+        else:
+            self.ray_offsets = np.linspace(-fov / 2, fov / 2, self.num_rays)
+
+        self.width, self.height = game.screen_width, game.screen_height
+        self.max_range = float(np.hypot(self.width, self.height) if max_range is None else max_range)
+
+        if renderer is None:
+            renderer = PixelObservationRenderer(self.width, self.height, player_radius=game.player_radius,
+                                                downsample=downsample, player_indices=game.valid_player_indices)
+            renderer.update(game.players)
+            self._owns_renderer = True
+        elif renderer.per_player_channels:
+            raise ValueError("RaycastSensor needs a renderer with owner codes (per_player_channels=False)")
+        else:
+            self._owns_renderer = False
+        self.renderer = renderer
+        self.chunk_size = int(chunk_size)
+
+        # One sample per raster cell. The stamp of a trail point reaches at most `padding` cells (per axis) from the
+        # cell of the point, so samples beyond this distance can not hit the newest points at the head.
+        self.step = float(renderer.downsample)
+        self.min_dist = renderer.padding * renderer.downsample * np.sqrt(2)
+
+    def on_tick(self, game):
+        """ Tick observer interface of AchtungDieKurveGame """
+        if self._owns_renderer:
+            self.renderer.update(game.players)
+
+    def sense(self, players=None, hit_types=False):
+        """ Cast the rays of `players` (default: all players of the game, in the order of game.players).
+
+        Returns:
+            distances (n_players, K) float32: distance to the first hit, `max_range` if nothing was hit
+            hit types (n_players, K) int8 (only if `hit_types` is True): HitType of the first hit
+        """
+        if players is None:
+            players = self.game.players
+        n, K = len(players), self.num_rays
+        pos = np.array([p.pos for p in players], dtype=float).reshape(n, 2)
+        angles = np.array([p.angle for p in players], dtype=float)[:, np.newaxis] + self.ray_offsets
+        dirs = np.stack([np.cos(angles), np.sin(angles)], axis=-1).reshape(n * K, 2)
+        origins = np.repeat(pos, K, axis=0)
+
+        dist, types = self._wall_distances(origins, dirs)
+        owners = np.zeros(n * K, dtype=np.intp)
+        self._march_trails(origins, dirs, dist, owners)
+
+        hit_trail = owners > 0
+        if hit_types:
+            own_code = np.repeat([p.idx + 1 for p in players], K)
+            types[hit_trail] = np.where(owners[hit_trail] == own_code[hit_trail], HitType.Self, HitType.Opponent)
+            return dist.reshape(n, K).astype(np.float32), types.reshape(n, K)
+        return dist.reshape(n, K).astype(np.float32)
+
+    def _wall_distances(self, origins, dirs):
+        """ Exact distances to the arena borders along the rays (capped at max_range) and hit types Wall/Nothing"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tx = np.where(dirs[:, 0] > 0, (self.width - origins[:, 0]) / dirs[:, 0],
+                          np.where(dirs[:, 0] < 0, -origins[:, 0] / dirs[:, 0], np.inf))
+            ty = np.where(dirs[:, 1] > 0, (self.height - origins[:, 1]) / dirs[:, 1],
+                          np.where(dirs[:, 1] < 0, -origins[:, 1] / dirs[:, 1], np.inf))
+        dist = np.maximum(np.minimum(tx, ty), 0.)
+        types = np.where(dist <= self.max_range, HitType.Wall, HitType.Nothing).astype(np.int8)
+        return np.minimum(dist, self.max_range), types
+
+    def _march_trails(self, origins, dirs, dist, owners):
+        """ March all rays through the raster until they hit a trail or reach `dist`. Updates `dist` and `owners`
+        (owner code of the hit trail) of the rays that hit a trail."""
+        buffer = self.renderer.buffer
+        wall = self.renderer.wall_value
+        max_row, max_col = buffer.shape[0] - 1, buffer.shape[1] - 1
+        active = np.flatnonzero(dist > self.min_dist)
+        offsets = self.step * np.arange(self.chunk_size)
+        t0 = self.min_dist
+        while active.size > 0:
+            ts = t0 + offsets
+            points = origins[active, np.newaxis, :] + ts[np.newaxis, :, np.newaxis] * dirs[active, np.newaxis, :]
+            cells = self.renderer.to_cells(points)
+            codes = buffer[np.clip(cells[..., 1], 0, max_row), np.clip(cells[..., 0], 0, max_col)]
+            hits = (codes != 0) & (codes != wall) & (ts[np.newaxis, :] < dist[active, np.newaxis])
+
+            hit_any = hits.any(axis=1)
+            first = np.argmax(hits, axis=1)[hit_any]
+            hit_rays = active[hit_any]
+            dist[hit_rays] = ts[first]
+            owners[hit_rays] = codes[hit_any, first]
+
+            t0 += self.chunk_size * self.step
+            active = active[~hit_any]
+            active = active[dist[active] > t0]
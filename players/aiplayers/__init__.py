@@ -1,3 +1,8 @@
 from players.aiplayers.aiplayer_base import AIPlayer
 from players.aiplayers.wall_evaders import WallAvoidingAIPlayer, RandomSteeringAIPlayer
 from players.aiplayers.heuristic_governed import NStepPlanPlayer
+from players.aiplayers.plan_cache import PlanCache
+from players.aiplayers.remote_player import RemotePlayer
+from players.aiplayers.policy_player import BatchPolicy, LinearRaycastPolicy, PolicyPlayer
+from players.aiplayers.mcts_player import MCTSPlayer, RolloutSimulator
+from players.aiplayers.potential_field import PotentialFieldPlayer, PotentialFieldPolicy
@@ -2,6 +2,7 @@ import copy
 import itertools
 import logging
 import time
+from math import pi
 
 import matplotlib.pyplot as plt
 import pygame
@@ -9,6 +10,9 @@ import numpy as np
 from players.player_base import PlayerAction, Player
 from players.misc_players import DummyPlayer
 from players.aiplayers.aiplayer_base import AIPlayer
+from players.aiplayers.plan_cache import LocalStateKeys, PlanCache
+from players.trail_segments import SegmentTrail
+from players.trails import CompactTrail
 
 import shapely
 
@@ -62,7 +66,8 @@ def distance_to_conflict(path:shapely.LineString, obstacle:shapely.Geometry):
 
 class NStepPlanPlayer(AIPlayer):
     def __init__(self, num_steps=2, dist_per_step=40.0, wall_penalty=100., trail_penalty=111., conflict_penalty=50,
-                 discount_factor=0.95, plan_update_period=None, ticks_per_step=None, **aiplayer_kwargs):
+                 discount_factor=0.95, plan_update_period=None, ticks_per_step=None, plan_cache=None,
+                 cache_resolution=4., cache_heading_bins=64, **aiplayer_kwargs):
         """
 
         Args:
@@ -75,6 +80,11 @@ class NStepPlanPlayer(AIPlayer):
             plan_update_period: number of ticks between plan updates. If `plan_update_period` is a float, the number of ticks
                                 is calculated as int(plan_update_period * ticks_per_step)
             ticks_per_step (int):
+            plan_cache: cache of plan evaluations (see players.aiplayers.plan_cache). None (default) disables caching,
+                        'shared' uses the cache of all NStepPlanPlayers with the same configuration in this process, an
+                        int creates a cache of that size for this player. A PlanCache can also be passed directly.
+            cache_resolution (float): quantization of the position in the cache keys (game units)
+            cache_heading_bins (int): number of heading bins of the cache keys
             **aiplayer_kwargs:
         """
         self.N = num_steps
@@ -91,7 +101,8 @@ class NStepPlanPlayer(AIPlayer):
         if plan_update_period is None:
             plan_update_period = self.N * self.ticks_per_step
         elif isinstance(plan_update_period, float):
-            plan_update_period = int(plan_update_period * self.ticks_per_step)
+            # Fraction of a step, at least one tick
+            plan_update_period = max(int(plan_update_period * self.ticks_per_step), 1)
         assert plan_update_period <= self.N * self.ticks_per_step
         assert plan_update_period > 0
 
@@ -112,6 +123,37 @@ class NStepPlanPlayer(AIPlayer):
 
         self.num_updates = 0
 
+        if plan_cache == 'shared':
+            plan_cache = PlanCache.shared(self.cache_config(cache_resolution, cache_heading_bins))
+        elif isinstance(plan_cache, int):
+            plan_cache = PlanCache(plan_cache)
+        self.plan_cache = plan_cache
+        if plan_cache is not None:
+            plan_length = self.N * self.ticks_per_step * self.dist_per_tick
+            # Two points of a curve with curvature <= 1/R and arc length s <= pi R between them are at least
+            # 2 R sin(s / 2R) apart, so plans can not get back to the own trail of the last pi R - plan length
+            num_own_ticks_excluded = max(int(np.ceil(2.5 * self.radius / self.dist_per_tick)),
+                                         int((pi * self.min_turn_radius - plan_length) / self.dist_per_tick))
+            self._cache_keys = LocalStateKeys(self.idx, (self.xmin, self.xmax, self.ymin, self.ymax), self.plan_paths,
+                                              collision_distance=2 * self.radius,
+                                              num_own_ticks_excluded=num_own_ticks_excluded,
+                                              resolution=cache_resolution, num_headings=cache_heading_bins,
+                                              on_change=plan_cache.invalidate)
+
+    def cache_config(self, *cache_settings):
+        """ Everything that determines the plans of this player, except for its state"""
+        return (type(self).__name__, self.N, self.ticks_per_step, self.plan_update_period, self.wall_penalty,
+                self.trail_penalty, self.conflict_penalty, self.discount_per_tick, self.dist_per_tick,
+                self.dphi_per_tick, self.radius, self.xmin, self.xmax, self.ymin, self.ymax) + cache_settings
+
+    def plan_paths(self, angle):
+        """ Points of all plans from the origin with heading `angle` (M x 2)"""
+        plans = np.array(list(itertools.product([-1, 0, 1], repeat=self.N)))
+        actions = np.repeat(plans, self.ticks_per_step, axis=1)
+        angles = angle + np.cumsum(actions * self.dphi_per_tick, axis=1)
+        x = np.cumsum(self.dist_per_tick * np.cos(angles), axis=1)
+        y = np.cumsum(self.dist_per_tick * np.sin(angles), axis=1)
+        return np.concatenate([[[0., 0.]], np.stack([x.ravel(), y.ravel()], axis=1)])
 
     def __str__(self):
         return f"{self.N}-StepPlanPlayer '{self.name}' ({self.color_name})"
@@ -122,7 +164,7 @@ class NStepPlanPlayer(AIPlayer):
         #self.ticks_until_next_update -= 1
         # Check if we should update the plan
         if self.ticks_until_next_update <= 0 or len(self.planned_actions) < 1:
-            best_plan = np.asarray(self.find_best_plan(game_state), dtype=PlayerAction)
+            best_plan = np.asarray(self.cached_best_plan(game_state), dtype=PlayerAction)
             self.planned_actions = list(np.repeat(best_plan, self.ticks_per_step))
             self.ticks_until_next_update = self.plan_update_period
             self.in_planning_tick = True
@@ -148,6 +190,21 @@ class NStepPlanPlayer(AIPlayer):
         return opponent_futures
 
 
+    def cached_best_plan(self, game_state:dict):
+        """ Best plan from the plan cache, evaluated with find_best_plan() if it is not cached"""
+        if self.plan_cache is None:
+            return self.find_best_plan(game_state)
+        self._cache_keys.update(game_state)
+        key, blocks = self._cache_keys.key(self.pos, self.angle)
+        cached = self.plan_cache.get(key)
+        if cached is not None:
+            best_plan, self.best_plan_score = cached
+            self.best_trails = []
+            return best_plan
+        best_plan = self.find_best_plan(game_state)
+        self.plan_cache.put(key, (best_plan, self.best_plan_score), blocks)
+        return best_plan
+
     def find_best_plan(self, game_state:dict):
         """ Finds the best plan based on the heuristic"""
 
@@ -160,6 +217,11 @@ class NStepPlanPlayer(AIPlayer):
         collidable_trails = []
         for pidx,player_state in game_state.items():
             xy = player_state['trail']
+            if isinstance(xy, (CompactTrail, SegmentTrail)):
+                # Holes are known, no need to search for NaNs. SegmentTrails return sparse polylines.
+                stop = -num_own_pos_to_ignore if pidx == self.idx else None
+                collidable_trails += [part for part in xy.segments(stop) if part.shape[0] >= 2]
+                continue
             if pidx == self.idx:
                 # We need to exclude the last positions from self, otherwise we always detect (self-)collision!
                 xy = xy[:-num_own_pos_to_ignore, :]
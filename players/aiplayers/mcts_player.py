@@ -0,0 +1,316 @@
+from math import log, sqrt
+
+from players.aiplayers.aiplayer_base import *
+from observations.pixel_renderer import PixelObservationRenderer
+
+
+class RolloutSimulator:
+    """ Stripped-down simulation of the active players of a game for Monte-Carlo rollouts.
+
+    A batch of R rollouts of all n players is simulated at once on (R, n) arrays: no pygame, no logging, no player
+    objects. Steering, movement and the collision rules are those of AchtungDieKurveGame (walls, trails of opponents
+    within one radius, own trail within two radii except for the newest points), with two simplifications:
+
+    - Trails drawn before the rollout are looked up in the owner-code raster of a PixelObservationRenderer, which the
+      game updates incrementally after every tick. Only the points drawn during the rollout are compared exactly.
+    - No holes are created during rollouts.
+
+    One player (the agent) follows a given plan of actions and then the default policy, all other players follow the
+    default policy throughout: RandomSteeringAIPlayer-style random turns and straight lines, with a simple wall evasion
+    (steer towards the arena center if the wall is close ahead) if `rollout_policy` is 'heuristic'.
+    """
+
+    def __init__(self, renderer, game_bounds, dist_per_tick, dphi_per_tick, radius, horizon=60, ticks_per_step=15,
+                 rollout_policy='heuristic', turn_angles_deg=(40., 180.), straight_lengths=(0, 200.0), rng=None):
+        """
+
+        Args:
+            renderer (PixelObservationRenderer): single channel renderer of the game (owner codes)
+            game_bounds: [xmin xmax ymin ymax] of the arena
+            horizon (int): number of ticks per rollout
+            ticks_per_step (int): number of ticks each action of a plan is held
+            rollout_policy (str): default policy, 'random' or 'heuristic' (random with wall evasion)
+            turn_angles_deg: minimum/maximum angle of a random turn (degrees)
+            straight_lengths: minimum/maximum length of a random straight line (game units)
+            rng: numpy random generator
+        """
+        if rollout_policy not in ('random', 'heuristic'):
+            raise ValueError(f"Invalid rollout policy '{rollout_policy}'")
+        if renderer.per_player_channels:
+            raise ValueError("RolloutSimulator needs a renderer with owner codes (per_player_channels=False)")
+        self.renderer = renderer
+        self.xmin, self.xmax, self.ymin, self.ymax = game_bounds
+        self.dist_per_tick = dist_per_tick
+        self.dphi_per_tick = dphi_per_tick
+        self.radius = radius
+        self.horizon = int(horizon)
+        self.ticks_per_step = int(ticks_per_step)
+        self.rollout_policy = rollout_policy
+        self.rng = np.random.default_rng() if rng is None else rng
+
+        # Same as Player.check_self_collision()
+        self.num_recent_ticks_to_skip = int(np.ceil(5 * radius / dist_per_tick))
+        self.turn_ticks = np.deg2rad(turn_angles_deg) / dphi_per_tick
+        self.straight_ticks = np.asarray(straight_lengths, dtype=float) / dist_per_tick
+        min_turn_radius = dist_per_tick / (2 * np.sin(0.5 * dphi_per_tick))
+        self.lookahead = 2 * min_turn_radius
+        self.center = 0.5 * (self.xmin + self.xmax) + 0.5j * (self.ymin + self.ymax)
+
+    def _durations(self, states):
+        """ Random number of ticks of new default policy states (turns or straight lines)"""
+        u = self.rng.random(states.shape)
+        turns = self.turn_ticks[0] + (self.turn_ticks[1] - self.turn_ticks[0]) * u
+        straights = self.straight_ticks[0] + (self.straight_ticks[1] - self.straight_ticks[0]) * u
+        return np.where(states == 0, straights, turns).astype(np.int64)
+
+    def _wall_evasion(self, z, heading, actions):
+        """ Steer towards the center of the arena where a wall is less than `lookahead` ahead"""
+        ahead = z + self.lookahead * heading
+        wall_ahead = (ahead.real < self.xmin) | (ahead.real > self.xmax) | (ahead.imag < self.ymin) | \
+            (ahead.imag > self.ymax)
+        # Increasing the angle turns the heading clockwise on screen (SteerRight), towards the center if the cross
+        # product of heading and direction to the center is positive
+        cross = (heading.conjugate() * (self.center - z)).imag
+        return np.where(wall_ahead, np.where(cross > 0, PlayerAction.SteerRight, PlayerAction.SteerLeft), actions)
+
+    def simulate(self, pos, angles, codes, plans, agent=0):
+        """ Simulate one rollout per plan.
+
+        Args:
+            pos: (n, 2) positions of the players at the start
+            angles: (n,) headings of the players
+            codes: (n,) owner codes of the players in the raster (idx + 1)
+            plans: R sequences of PlayerActions of the agent, every action is held for `ticks_per_step` ticks
+            agent (int): row of the agent in `pos`, `angles` and `codes`
+
+        Returns:
+            survived (R,) int: number of ticks the agent survived in each rollout (`horizon` if it is still alive)
+        """
+        R, n, T = len(plans), len(pos), self.horizon
+        survived = np.full(R, T, dtype=np.int64)
+        if R == 0:
+            return survived
+
+        planned = np.full((R, T), 2, dtype=np.int64)    # 2: default policy
+        for r, plan in enumerate(plans):
+            ticks = np.repeat(np.asarray(plan, dtype=np.int64), self.ticks_per_step)[:T]
+            planned[r, :len(ticks)] = ticks
+
+        # Positions as complex numbers x + iy: fewer array operations per tick
+        pos = np.asarray(pos, dtype=float)
+        z = np.repeat((pos[:, 0] + 1j * pos[:, 1])[np.newaxis], R, axis=0)
+        angles = np.repeat(np.asarray(angles, dtype=float)[np.newaxis], R, axis=0)
+        heading = np.exp(1j * angles)
+        codes = np.asarray(codes)[np.newaxis, :]
+        alive = np.ones((R, n), dtype=bool)
+        rollouts = np.arange(R)       # rows of the rollouts in which the agent is still alive
+        num_finished = 0              # rows in which the agent is dead
+
+        states = self.rng.integers(-1, 2, (R, n))
+        remaining = (self._durations(states) * self.rng.random((R, n))).astype(np.int64)
+        # Rollout trails, NaN for the ticks after the death of a player
+        history = np.full((T, R, n), np.nan, dtype=complex)
+
+        # Lookups in the raster, see PixelObservationRenderer.to_cells(). The padding of the raster is filled with
+        # walls. Shifting by the padding before truncating to integers keeps the indices of positions up to one
+        # padding outside of the arena non-negative, positions beyond that are clipped to wall cells at the borders of
+        # the buffer (or wrap into the padding of the neighboring row).
+        raster = self.renderer.buffer.ravel()
+        raster_width = self.renderer.buffer.shape[1]
+        shift = self.renderer.padding * self.renderer.downsample
+        scale = 1. / self.renderer.downsample
+        # Exact wall checks are only needed if players can jump over the padding within one tick
+        check_walls = self.dist_per_tick >= shift
+        not_own = ~np.eye(n, dtype=bool)
+
+        for t in range(T):
+            expired = remaining <= 0
+            if expired.any():
+                states[expired] = self.rng.integers(-1, 2, int(expired.sum()))
+                remaining[expired] = self._durations(states[expired])
+            remaining -= 1
+
+            if self.rollout_policy == 'heuristic':
+                # Heading of the previous tick, the steering of this tick is decided before the move
+                actions = self._wall_evasion(z, heading, states)
+            else:
+                actions = states.copy()
+            actions[:, agent] = np.where(planned[:, t] != 2, planned[:, t], actions[:, agent])
+
+            # Steering and movement (see Player.apply_action() and Player.move()), dead players do not move
+            angles += actions * (alive * self.dphi_per_tick)
+            heading = np.exp(1j * angles)
+            z += (alive * self.dist_per_tick) * heading
+
+            # Trails before the rollout and walls. The newest points of the own trail are skipped.
+            cells = ((z.imag + shift) * scale).astype(np.intp) * raster_width + ((z.real + shift) * scale).astype(np.intp)
+            found = raster.take(cells, mode='clip')
+            if t >= self.num_recent_ticks_to_skip:
+                dead = found != 0
+            else:
+                dead = (found != 0) & (found != codes)
+            if check_walls:
+                dead |= (z.real < self.xmin) | (z.real > self.xmax) | (z.imag < self.ymin) | (z.imag > self.ymax)
+            # Trails of the rollout
+            if t > 0:
+                dist = np.abs(history[:t, :, np.newaxis, :] - z[np.newaxis, :, :, np.newaxis])    # (t, R, head, trail)
+                if n > 1:
+                    dead |= np.any((dist.min(axis=0) < self.radius) & not_own, axis=2)
+                num_old = t - self.num_recent_ticks_to_skip + 1
+                if num_old > 0:
+                    dead |= np.diagonal(dist[:num_old], axis1=2, axis2=3).min(axis=0) <= 2 * self.radius
+
+            dead &= alive
+            alive &= ~dead
+            history[t] = np.where(alive, z, np.nan)
+
+            agent_dead = dead[:, agent]
+            if agent_dead.any():
+                survived[rollouts[agent_dead]] = t
+                num_finished += int(agent_dead.sum())
+                if num_finished == len(rollouts):
+                    break
+                if 4 * num_finished >= len(rollouts):
+                    # Drop the finished rollouts
+                    keep = alive[:, agent]
+                    rollouts, planned, z, angles, heading, alive = (rollouts[keep], planned[keep], z[keep],
+                                                                    angles[keep], heading[keep], alive[keep])
+                    states, remaining, history = states[keep], remaining[keep], history[:, keep]
+                    num_finished = 0
+
+        return survived
+
+
+class _Node:
+    __slots__ = ('children', 'visits', 'value')
+
+    def __init__(self):
+        self.children = {}
+        self.visits = 0
+        self.value = 0.
+
+    @property
+    def mean_value(self):
+        return self.value / self.visits if self.visits > 0 else 0.
+
+
+class MCTSPlayer(AIPlayer):
+    """ AI player that chooses its actions with Monte-Carlo tree search.
+
+    The tree is built over plans of up to `max_depth` actions, each held for `ticks_per_step` ticks. Leaves are evaluated
+    with rollouts of all active players (see RolloutSimulator), the value of a rollout is the fraction of the horizon
+    that the player survives. Leaves are selected with UCT in batches of `batch_size` (with virtual loss) and evaluated
+    in one call of the simulator.
+
+    The search runs every tick with a budget of `rollouts_per_tick` rollouts, the first action of the plan with the best
+    mean value is carried out.
+    """
+
+    search_actions = (PlayerAction.SteerLeft, PlayerAction.KeepStraight, PlayerAction.SteerRight)
+
+    def __init__(self, game=None, rollouts_per_tick=48, batch_size=24, horizon=60, ticks_per_step=15, max_depth=3,
+                 exploration=1.0, rollout_policy='heuristic', search_seed=None, **aiplayer_kwargs):
+        """
+
+        Args:
+            game (AchtungDieKurveGame): game of the player (set by spawn_player)
+            rollouts_per_tick (int): rollout budget of the search in every tick
+            batch_size (int): number of rollouts that are simulated at once
+            horizon (int): number of ticks per rollout
+            ticks_per_step (int): number of ticks each action of a plan is held
+            max_depth (int): maximum number of actions of a plan (depth of the tree)
+            exploration (float): exploration constant of UCT
+            rollout_policy (str): default policy of the rollouts, 'random' or 'heuristic'
+            search_seed: seed of the random generator of the search (independent of the holes)
+        """
+        self.game = game
+        super().__init__(**aiplayer_kwargs)
+        self.rollouts_per_tick = rollouts_per_tick
+        self.batch_size = batch_size
+        self.horizon = horizon
+        self.ticks_per_step = ticks_per_step
+        self.max_depth = max_depth
+        self.exploration = exploration
+        self.rollout_policy = rollout_policy
+        self.search_rng = np.random.default_rng(search_seed)
+
+        self._renderer = None
+        self._simulator = None
+        self.root = None            # tree of the last search
+        self.num_rollouts = 0
+
+    def __str__(self):
+        return f"MCTSPlayer '{self.name}' ({self.color_name})"
+
+    @property
+    def simulator(self):
+        if self.game is None:
+            raise RuntimeError(f"{self} has no game to simulate")
+        # Reuse the raster of another observer of the game if possible. A reset of the game removes its observers.
+        if self._renderer is None or self._renderer not in self.game.tick_observers:
+            renderers = [o for o in self.game.tick_observers if isinstance(o, PixelObservationRenderer) and
+                         not o.per_player_channels and o.downsample == 1]
+            self._renderer = renderers[0] if renderers else self.game.create_pixel_observer()
+            self._simulator = RolloutSimulator(self._renderer, (self.xmin, self.xmax, self.ymin, self.ymax),
+                                               self.dist_per_tick, self.dphi_per_tick, self.radius,
+                                               horizon=self.horizon, ticks_per_step=self.ticks_per_step,
+                                               rollout_policy=self.rollout_policy, rng=self.search_rng)
+        return self._simulator
+
+    def next_action(self, game_state):
+        root = self.search()
+        if not root.children:
+            return PlayerAction.KeepStraight
+        return max(root.children, key=lambda a: root.children[a].mean_value)
+
+    def search(self):
+        """ Run the search from the current state of the game. Returns the root of the tree."""
+        simulator = self.simulator
+        # Opponents that can not get close to the player within the horizon only matter through their trails so far
+        reach = 2 * (simulator.horizon * self.dist_per_tick + self.radius)
+        players = [self] + [p for p in self.game.active_players
+                            if p != self and np.hypot(*(p.pos - self.pos)) < reach]
+        pos = np.array([p.pos for p in players])
+        angles = np.array([p.angle for p in players])
+        codes = np.array([p.idx + 1 for p in players])
+
+        root = _Node()
+        num_rollouts = 0
+        while num_rollouts < self.rollouts_per_tick:
+            paths, plans = [], []
+            for _ in range(min(self.batch_size, self.rollouts_per_tick - num_rollouts)):
+                path, plan = self._select(root)
+                # Virtual loss: the visit counts before the value, so that the batch spreads over the tree
+                for node in path:
+                    node.visits += 1
+                paths.append(path)
+                plans.append(plan)
+
+            survived = simulator.simulate(pos, angles, codes, plans)
+            for path, value in zip(paths, survived / simulator.horizon):
+                for node in path:
+                    node.value += value
+            num_rollouts += len(plans)
+
+        self.num_rollouts += num_rollouts
+        self.root = root
+        return root
+
+    def _select(self, root):
+        """ Path from the root to a new (or maximum depth) node along the UCT choices, and the plan of the path"""
+        node, path, plan = root, [root], []
+        while len(plan) < self.max_depth:
+            untried = [a for a in self.search_actions if a not in node.children]
+            if untried:
+                action = untried[self.search_rng.integers(len(untried))]
+                node.children[action] = _Node()
+                path.append(node.children[action])
+                plan.append(action)
+                break
+            log_visits = log(node.visits)
+            action = max(node.children, key=lambda a: node.children[a].mean_value +
+                         self.exploration * sqrt(log_visits / node.children[a].visits))
+            node = node.children[action]
+            path.append(node)
+            plan.append(action)
+        return path, plan
@@ -0,0 +1,261 @@
+"""Cache of plan evaluations, keyed by quantized local states
+
+A planner that looks a fixed distance ahead gets the same result whenever it is in (nearly) the same position and
+heading and the obstacles its plans can reach are the same. The PlanCache stores the results under a key of
+
+    - the position, quantized to a grid with `resolution` game units, if a wall is within reach of the plans (in open
+      areas, the plans do not depend on the position),
+    - the heading, quantized to `num_headings` bins,
+    - the obstacles in the neighbourhood: the contents of all cells of a coarse occupancy grid that are swept by any of
+      the candidate plans (widened by the collision distance and the quantization errors), relative to the position.
+
+The occupancy grid is maintained incrementally by LocalStateKeys from the trails in the game state. Keys that contain
+the position belong to a location: when new trail points land in the neighbourhood of such an entry (tracked per block
+of cells), the entry is invalidated, so that the cache does not fill up with neighbourhoods that do not exist any more.
+Entries of open areas stay valid wherever their neighbourhood occurs again and are only evicted by the LRU policy.
+
+Caches can be shared by all planners with the same configuration (see PlanCache.shared()), e.g. all planners of a game
+or all games in a worker process.
+"""
+from collections import OrderedDict
+from math import ceil, pi
+
+import numpy as np
+
+
+class PlanCache:
+    """ Bounded LRU cache of plan evaluations with invalidation by neighbourhood"""
+
+    _shared = {}
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = int(maxsize)
+        self._entries = OrderedDict()     # key -> (value, blocks)
+        self._keys_of_block = {}          # block -> set of keys whose neighbourhood contains the block
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @classmethod
+    def shared(cls, config, maxsize=4096):
+        """ The cache of all planners with configuration `config` (hashable) in this process"""
+        cache = cls._shared.get(config)
+        if cache is None:
+            cache = cls._shared[config] = cls(maxsize)
+        return cache
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"PlanCache({len(self)}/{self.maxsize} entries, hit rate {self.hit_rate:.1%})"
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.
+
+    def stats(self):
+        return dict(size=len(self), hits=self.hits, misses=self.misses, hit_rate=self.hit_rate,
+                    invalidations=self.invalidations, evictions=self.evictions)
+
+    def get(self, key):
+        """ Cached value of `key` (None if there is none). Counts as hit or miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, blocks=()):
+        """ Store `value` under `key`. The entry is invalidated when one of the `blocks` changes."""
+        if key in self._entries:
+            self._remove(key)
+        blocks = tuple(blocks)
+        self._entries[key] = (value, blocks)
+        for block in blocks:
+            self._keys_of_block.setdefault(block, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, blocks):
+        """ Remove all entries whose neighbourhood contains one of the `blocks`. Returns the number of entries."""
+        keys = set()
+        for block in blocks:
+            keys.update(self._keys_of_block.get(block, ()))
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_of_block.clear()
+
+    def _remove(self, key):
+        _, blocks = self._entries.pop(key)
+        for block in blocks:
+            keys = self._keys_of_block[block]
+            keys.discard(key)
+            if not keys:
+                del self._keys_of_block[block]
+
+
+class LocalStateKeys:
+    """ Cache keys of a planner: quantized pose and the occupancy of the cells its plans can reach.
+
+    The occupancy grid counts the collidable trail points per cell. The own trail of the last `num_own_ticks_excluded`
+    ticks is left out: if plans can not get back to it, it does not affect plan evaluations but would change the key
+    every tick.
+    """
+
+    _shared_neighbourhoods = {}     # (plan points, margin, heading bins, cell size) -> (row offsets, col offsets)
+
+    def __init__(self, player_idx, game_bounds, plan_paths, collision_distance, num_own_ticks_excluded, resolution=4.,
+                 num_headings=64, cell_size=4., block_size=2, on_change=None):
+        """
+
+        Args:
+            player_idx (int): index of the planning player
+            game_bounds: [xmin xmax ymin ymax] of the arena
+            plan_paths: function(angle) -> (M, 2) array of the points of all candidate plans, relative to the position
+            collision_distance (float): distance at which a trail point affects a plan
+            num_own_ticks_excluded (int): newest ticks of the own trail that are not part of the key
+            resolution (float): quantization of the position (game units)
+            num_headings (int): number of heading bins
+            cell_size (float): edge length of the cells of the occupancy grid (game units)
+            block_size (int): edge length (in cells) of the blocks that are used to invalidate cache entries
+            on_change: function(blocks) that is called with the blocks that got new trail points
+        """
+        self.player_idx = player_idx
+        self.xmin, self.xmax, self.ymin, self.ymax = game_bounds
+        self.plan_paths = plan_paths
+        self.num_own_ticks_excluded = int(num_own_ticks_excluded)
+        self.resolution = float(resolution)
+        self.num_headings = int(num_headings)
+        self.cell_size = float(cell_size)
+        self.block_size = int(block_size)
+        self.on_change = on_change
+
+        # Worst-case distance between the plans of a pose and of the center of its quantization bin
+        self._margin = collision_distance + self.resolution / np.sqrt(2)
+        self._neighbourhoods = {}       # heading bin -> (row offsets, col offsets)
+        self._wall_range = None         # distance to a wall below which the position is part of the key
+
+        self._padding = None
+        self.grid = None
+        self._num_points_consumed = {}
+
+    def _cell_offsets(self, heading_bin):
+        """ Cells (relative to the cell of the quantized position) within reach of any plan of the heading bin"""
+        offsets = self._neighbourhoods.get(heading_bin)
+        if offsets is None:
+            angle = 2 * pi * heading_bin / self.num_headings
+            points = self.plan_paths(angle)
+            # Planners of the same configuration have the same neighbourhoods
+            shared_key = (points.tobytes(), self._margin, self.num_headings, self.cell_size)
+            offsets = self._shared_neighbourhoods.get(shared_key)
+        if offsets is None:
+            # Plans of the headings in the bin deviate by at most half a bin
+            reach = float(np.max(np.hypot(points[:, 0], points[:, 1])))
+            # A cell is in reach if its center is closer than the margin plus two half diagonals (cell extent, position
+            # within its cell) to a point of a plan. Centers are relative to the center of the cell of the position.
+            max_dist = self._margin + reach * pi / self.num_headings + self.cell_size * np.sqrt(2)
+            extent = int(ceil(max_dist / self.cell_size)) + 1
+            disc_rows, disc_cols = np.mgrid[-extent:extent + 1, -extent:extent + 1]
+            point_cells = np.floor(points / self.cell_size + 0.5).astype(np.intp)
+            # Candidates: cells around the cells of the points
+            cols = point_cells[:, 0:1] + disc_cols.ravel()
+            rows = point_cells[:, 1:2] + disc_rows.ravel()
+            sq_dist = (cols * self.cell_size - points[:, 0:1]) ** 2 + (rows * self.cell_size - points[:, 1:2]) ** 2
+            inside = sq_dist <= max_dist ** 2
+            width = 2 * (int(np.max(np.abs(point_cells))) + extent) + 1
+            cells = np.unique(rows[inside] * width + cols[inside])
+            rows, cols = np.divmod(cells + (width // 2) * (width + 1), width)
+            offsets = (rows - width // 2, cols - width // 2)
+            self._shared_neighbourhoods[shared_key] = offsets
+        self._neighbourhoods[heading_bin] = offsets
+        return offsets
+
+    def _allocate(self):
+        if self.grid is None:
+            # Neighbourhoods that reach beyond the padding are clipped to its (empty) border cells
+            row_offsets, _ = self._cell_offsets(0)
+            self._padding = int(np.max(np.abs(row_offsets))) + 2
+            points = self.plan_paths(0.)
+            self._wall_range = float(np.max(np.hypot(points[:, 0], points[:, 1]))) + self._margin + self.resolution
+            shape = (int(ceil((self.ymax - self.ymin) / self.cell_size)) + 2 * self._padding,
+                     int(ceil((self.xmax - self.xmin) / self.cell_size)) + 2 * self._padding)
+            self.grid = np.zeros(shape, dtype=np.uint8)
+
+    def _cells(self, points):
+        """ (rows, cols) of game coordinates (N x 2) in the grid, clipped to the grid"""
+        cols = np.floor((points[:, 0] - self.xmin) / self.cell_size).astype(np.intp) + self._padding
+        rows = np.floor((points[:, 1] - self.ymin) / self.cell_size).astype(np.intp) + self._padding
+        return np.clip(rows, 0, self.grid.shape[0] - 1), np.clip(cols, 0, self.grid.shape[1] - 1)
+
+    def update(self, game_state):
+        """ Add the collidable trail points that are new since the last update to the occupancy grid"""
+        self._allocate()
+        new_points = []
+        for pidx, player_state in game_state.items():
+            trail = player_state['trail']
+            stop = len(trail)
+            if pidx == self.player_idx:
+                stop = max(stop - self.num_own_ticks_excluded, 0)
+            start = self._num_points_consumed.get(pidx, 0)
+            if stop < start:
+                # Trail got shorter (reverse_tick()) -> rebuild the grid
+                self.grid.fill(0)
+                self._num_points_consumed = {}
+                return self.update(game_state)
+            if stop > start:
+                new_points.append(np.asarray(trail[start:stop], dtype=float).reshape(-1, 2))
+                self._num_points_consumed[pidx] = stop
+        if not new_points:
+            return
+
+        points = np.concatenate(new_points)
+        points = points[~np.isnan(points[:, 0])]
+        if len(points) == 0:
+            return
+        rows, cols = self._cells(points)
+        cells, counts = np.unique(rows * self.grid.shape[1] + cols, return_counts=True)
+        flat = self.grid.reshape(-1)
+        # Saturate, do not wrap around
+        flat[cells] = np.minimum(flat[cells] + counts, 254)
+        if self.on_change is not None:
+            self.on_change(self._blocks(*np.divmod(cells, self.grid.shape[1])))
+
+    def heading_bin(self, angle):
+        return int(np.floor(angle * self.num_headings / (2 * pi) + 0.5)) % self.num_headings
+
+    def key(self, pos, angle):
+        """ Cache key of the pose and the blocks of its neighbourhood (to invalidate the entry, see PlanCache.put())"""
+        self._allocate()
+        qx = int(np.floor(pos[0] / self.resolution))
+        qy = int(np.floor(pos[1] / self.resolution))
+        near_x_wall = min(pos[0] - self.xmin, self.xmax - pos[0]) < self._wall_range
+        near_y_wall = min(pos[1] - self.ymin, self.ymax - pos[1]) < self._wall_range
+        heading_bin = self.heading_bin(angle)
+        row_offsets, col_offsets = self._cell_offsets(heading_bin)
+        center = np.array([[(qx + 0.5) * self.resolution, (qy + 0.5) * self.resolution]])
+        row, col = self._cells(center)
+        rows = np.clip(row[0] + row_offsets, 0, self.grid.shape[0] - 1)
+        cols = np.clip(col[0] + col_offsets, 0, self.grid.shape[1] - 1)
+        key = (qx if near_x_wall else None, qy if near_y_wall else None, heading_bin, self.grid[rows, cols].tobytes())
+        # Away from the walls, the key does not depend on the location: the entry stays valid wherever its
+        # neighbourhood occurs again
+        blocks = self._blocks(rows, cols) if near_x_wall or near_y_wall else []
+        return key, blocks
+
+    def _blocks(self, rows, cols):
+        # Blocks are tagged with the player: in a shared cache, the grids of the other players contain the newest own
+        # trail points, which would invalidate all entries around the own head
+        blocks_per_row = self.grid.shape[1] // self.block_size + 1
+        ids = np.unique((rows // self.block_size) * blocks_per_row + cols // self.block_size)
+        return [(self.player_idx, block) for block in ids.tolist()]
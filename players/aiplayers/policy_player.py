@@ -0,0 +1,113 @@
+import weakref
+
+from players.aiplayers.aiplayer_base import *
+
+
+class BatchPolicy:
+    """ Policy that computes the actions of several players in one call, e.g. one inference of a model.
+
+    The game groups its PolicyPlayers by policy and queries every policy once per tick with the stacked observations
+    of its players (see AchtungDieKurveGame.tick_forward). A vectorized environment (training.vector_env) also stacks
+    the observations of several games.
+
+    Subclasses implement `act()`. By default, observations are the distances of a ray-cast sensor (see
+    observations.RaycastSensor), divided by its range: float32 array (n_players, num_rays) with values in [0, 1].
+    Override `observe()` for other observations.
+    """
+
+    def __init__(self, num_rays=16, fov=2 * np.pi, max_range=None):
+        self.num_rays = num_rays
+        self.fov = fov
+        self.max_range = max_range
+        self._sensors = weakref.WeakKeyDictionary()     # game -> RaycastSensor
+
+    def __str__(self):
+        return type(self).__name__
+
+    def _sensor(self, game):
+        sensor = self._sensors.get(game)
+        # A reset of the game removes its tick observers
+        if sensor is None or sensor not in game.tick_observers:
+            sensor = game.create_raycast_sensor(num_rays=self.num_rays, fov=self.fov, max_range=self.max_range)
+            self._sensors[game] = sensor
+        return sensor
+
+    def observe(self, game, players):
+        """ Stacked observations of `players` (all in `game`), one row per player"""
+        sensor = self._sensor(game)
+        return sensor.sense(players) / np.float32(sensor.max_range)
+
+    def act(self, observations):
+        """
+
+        Args:
+            observations: stacked observations (first axis: players), as returned by `observe()` or several of them
+                          concatenated
+
+        Returns:
+            actions: integer array (n_players,) of PlayerAction values
+        """
+        raise NotImplementedError
+
+    def actions(self, game, players):
+        return self.act(self.observe(game, players))
+
+
+class LinearRaycastPolicy(BatchPolicy):
+    """ Linear policy on the ray distances. The actions have the scores `weights @ obs + bias`: the action with the
+    largest score is carried out, or, with a `temperature` > 0, an action sampled from softmax(scores / temperature).
+    Small enough to be trained with policy gradients or evolution strategies, or used as a baseline."""
+
+    def __init__(self, weights=None, bias=None, num_rays=16, temperature=0., rng=None, **policy_kwargs):
+        """
+
+        Args:
+            weights: (3, num_rays) scores of the actions SteerLeft, KeepStraight, SteerRight per ray. Random by default.
+            bias: (3,) score offsets
+            temperature (float): 0 for the best action, otherwise actions are sampled
+            rng: numpy random generator for the random weights and the sampled actions
+        """
+        super().__init__(num_rays=num_rays, **policy_kwargs)
+        self.rng = np.random.default_rng() if rng is None else rng
+        if weights is None:
+            weights = self.rng.normal(size=(3, num_rays))
+        self.weights = np.asarray(weights, dtype=np.float32).reshape(3, num_rays)
+        self.bias = np.zeros(3, dtype=np.float32) if bias is None else np.asarray(bias, dtype=np.float32)
+        self.temperature = temperature
+
+    def scores(self, observations):
+        return observations @ self.weights.T + self.bias
+
+    def probabilities(self, observations):
+        """ Probabilities of the actions (n_players, 3) when sampling with the temperature of this policy"""
+        scores = self.scores(observations) / self.temperature
+        exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def act(self, observations):
+        if self.temperature > 0:
+            cumulative = np.cumsum(self.probabilities(observations), axis=1)
+            u = self.rng.random((len(observations), 1))
+            # the last column is 1 (up to rounding), clip in case of rounding errors
+            choice = np.minimum(np.sum(cumulative < u, axis=1), 2)
+        else:
+            choice = np.argmax(self.scores(observations), axis=1)
+        return choice + PlayerAction.SteerLeft
+
+
+class PolicyPlayer(AIPlayer):
+    """ AI player whose actions are computed by a BatchPolicy, in one batch with all other players of the policy"""
+
+    def __init__(self, policy, game=None, **aiplayer_kwargs):
+        self.policy = policy
+        self.game = game
+        super().__init__(**aiplayer_kwargs)
+
+    def __str__(self):
+        return f"PolicyPlayer '{self.name}' ({self.color_name}, {self.policy})"
+
+    def next_action(self, game_state):
+        """ Action of this player alone (the game queries all players of a policy at once instead)"""
+        if self.game is None:
+            raise RuntimeError(f"{self} has no game to observe")
+        return PlayerAction(int(self.policy.actions(self.game, [self])[0]))
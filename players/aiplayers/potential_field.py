@@ -0,0 +1,98 @@
+import weakref
+
+from players.aiplayers.aiplayer_base import *
+from players.aiplayers.policy_player import BatchPolicy, PolicyPlayer
+
+
+class PotentialFieldPolicy(BatchPolicy):
+    """ Steers away from danger: samples the DangerField of the game (see observations.danger_field) along the arcs of
+    the three actions (each action kept up for `lookahead` game units) and takes the action with the least danger.
+
+    The field is maintained once per tick for the whole game, all players of the policy are decided with one gather
+    from it. Observations are the mean danger along the arcs: float32 array (n_players, 3) for SteerLeft,
+    KeepStraight, SteerRight.
+    """
+
+    _default = None
+
+    def __init__(self, lookahead=160., num_samples=12, straight_bonus=0.05, **field_kwargs):
+        """
+
+        Args:
+            lookahead (float): length of the arcs (game units)
+            num_samples (int): number of samples per arc
+            straight_bonus (float): danger that KeepStraight is allowed to exceed the turns by (avoids zig-zagging)
+            **field_kwargs: settings of the DangerField (resolution, sigma, head_weight, prediction_ticks, ...)
+        """
+        super().__init__()
+        self.lookahead = float(lookahead)
+        self.num_samples = int(num_samples)
+        self.straight_bonus = straight_bonus
+        self.field_kwargs = field_kwargs
+        self._fields = weakref.WeakKeyDictionary()      # game -> DangerField
+
+    @classmethod
+    def default(cls):
+        """ The policy of all PotentialFieldPlayers that are created without a policy (in this process)"""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def field(self, game):
+        field = self._fields.get(game)
+        # A reset of the game removes its tick observers
+        if field is None or field not in game.tick_observers:
+            field = game.create_danger_field(**self.field_kwargs)
+            self._fields[game] = field
+        return field
+
+    def arc_points(self, players, first_dist):
+        """ Sample points (n_players, 3, num_samples, 2) on the arcs of SteerLeft, KeepStraight and SteerRight.
+        Samples start at `first_dist`, closer to the head the newest own trail points would be sampled."""
+        n = len(players)
+        s = np.linspace(min(first_dist, self.lookahead), self.lookahead, self.num_samples)
+        pos = np.array([p.pos for p in players], dtype=float).reshape(n, 2)
+        angles = np.array([p.angle for p in players], dtype=float)
+        radii = np.array([p.min_turn_radius for p in players], dtype=float)
+
+        # Arcs in the frame of the player: forward, sideways (towards increasing angles)
+        turn = s[np.newaxis, :] / radii[:, np.newaxis]
+        forward = np.stack([radii[:, np.newaxis] * np.sin(turn), np.broadcast_to(s, turn.shape),
+                            radii[:, np.newaxis] * np.sin(turn)], axis=1)
+        side = radii[:, np.newaxis] * (1 - np.cos(turn))
+        sideways = np.stack([-side, np.zeros_like(side), side], axis=1)     # SteerLeft decreases the angle
+
+        cos, sin = np.cos(angles)[:, np.newaxis, np.newaxis], np.sin(angles)[:, np.newaxis, np.newaxis]
+        x = pos[:, 0, np.newaxis, np.newaxis] + forward * cos - sideways * sin
+        y = pos[:, 1, np.newaxis, np.newaxis] + forward * sin + sideways * cos
+        return np.stack([x, y], axis=-1)
+
+    def observe(self, game, players):
+        field = self.field(game)
+        # The kernel around the newest own trail point reaches (kernel radius + 1) cells along both axes
+        first_dist = (field.kernel_radius + 1) * field.resolution * np.sqrt(2)
+        points = self.arc_points(players, first_dist)
+        n = len(points)
+        danger = field.sample(points.reshape(n, -1, 2), players).reshape(n, 3, self.num_samples)
+        return danger.mean(axis=2, dtype=np.float32)
+
+    def act(self, observations):
+        danger = np.array(observations, dtype=np.float32)
+        danger[:, 1] -= self.straight_bonus
+        # Ties (e.g. no danger at all) are resolved in favour of KeepStraight
+        order = np.array([1, 0, 2])
+        return order[np.argmin(danger[:, order], axis=1)] + PlayerAction.SteerLeft
+
+
+class PotentialFieldPlayer(PolicyPlayer):
+    """ Cheap AI player for large populations: steers by the danger field of the game (see PotentialFieldPolicy).
+    All PotentialFieldPlayers created without a policy share the default policy, so that the game decides them all in
+    one batch from one field."""
+
+    def __init__(self, policy=None, game=None, **aiplayer_kwargs):
+        if policy is None:
+            policy = PotentialFieldPolicy.default()
+        super().__init__(policy, game=game, **aiplayer_kwargs)
+
+    def __str__(self):
+        return f"PotentialFieldPlayer '{self.name}' ({self.color_name})"
@@ -0,0 +1,47 @@
+from players.aiplayers.aiplayer_base import *
+
+
+class RemotePlayer(AIPlayer):
+    """ Player that is controlled by an agent in another process (see remote.GameServer).
+
+    The server sets the action of the agent for the upcoming tick via `set_action()`. If the agent did not send an
+    action in time, `default_action` is carried out.
+    """
+
+    def __init__(self, default_action=PlayerAction.KeepStraight, **aiplayer_kwargs):
+        super().__init__(**aiplayer_kwargs)
+        self.default_action = PlayerAction(default_action)
+        self.connected = False
+        self.next_tick = 0              # tick for which an action is expected
+        self.pending_action = None
+        self.num_late_actions = 0       # ticks in which the default action was used
+
+    def __str__(self):
+        return f"RemotePlayer '{self.name}' ({self.color_name})"
+
+    def expect_action(self, tick):
+        """ Discard the current action and wait for the action of tick `tick`"""
+        self.next_tick = tick
+        self.pending_action = None
+
+    def set_action(self, tick, action):
+        """ Set the action for tick `tick`. Returns False if the action is too late or not valid."""
+        if tick != self.next_tick:
+            return False
+        try:
+            self.pending_action = PlayerAction(action)
+        except ValueError:
+            return False
+        return True
+
+    @property
+    def has_action(self):
+        return self.pending_action is not None
+
+    def next_action(self, game_state):
+        action = self.pending_action
+        if action is None:
+            self.num_late_actions += 1
+            action = self.default_action
+        self.pending_action = None
+        return action
@@ -1,6 +1,8 @@
 import logging
 
-from players.player_base import Player, PlayerAction
+import numpy as np
+
+from players.player_base import Player
 
 logger = logging.getLogger(__name__)
 
@@ -12,12 +14,6 @@ class ScriptedPlayer(Player):
         # Child classes need to define steering
         pass
 
-    def apply_action(self, action):
-        if action == PlayerAction.SteerLeft:
-            self.steer_left()
-        elif action == PlayerAction.SteerRight:
-            self.steer_right()
-
     def steer_left(self):
         self.angle -= self.dphi_per_tick
 
@@ -63,3 +59,16 @@ class FixedActionListPlayer(ScriptedPlayer):
         self.action_idx = (self.action_idx + 1) % self.list_length
 
 
+class ReplayPlayer(ScriptedPlayer):
+    """ Replays a recorded sequence of actions (one per tick). Keeps going straight when the sequence is exhausted."""
+
+    def __init__(self, actions, **player_kwargs):
+        super().__init__(**player_kwargs)
+
+        self.actions = np.asarray(actions, dtype=np.int8)
+        self.action_idx = 0
+
+    def apply_steering(self, pressed_keys):
+        if self.action_idx < self.actions.size:
+            self.apply_action(self.actions[self.action_idx])
+        self.action_idx += 1
@@ -29,12 +29,16 @@ import pygame.freetype  # Import the freetype module.
 
 from math import pi, sin, cos, sqrt, ceil
 
+from players.trail_segments import SegmentTrail
+from players.trails import CompactTrail, make_trail
+
 logger = logging.getLogger(__name__)
 
 class Player(pygame.sprite.Sprite):
     def __init__(self, idx=1, name=None, init_pos=(0., 0.), init_angle=0.0, dist_per_tick=5.0, dphi_per_tick=0.01, radius=2,
                  color=(255, 10, 10), color_name="Red", steer_left_key=pygame.K_LEFT, steer_right_key=pygame.K_DOWN,
-                 hole_width=3.0, startblock_length=100., min_dist_between_holes=200., max_dist_between_holes=1500.):
+                 hole_width=3.0, startblock_length=100., min_dist_between_holes=200., max_dist_between_holes=1500.,
+                 rng=None, trail_format='list'):
         """
         Base class for Achtung,die Kurve players
 
@@ -57,6 +61,10 @@ class Player(pygame.sprite.Sprite):
             startblock_length:
             min_dist_between_holes:
             max_dist_between_holes:
+            rng: random number generator used to place the holes (e.g. np.random.default_rng(seed)). Defaults to the
+                 global numpy RNG. Pass a dedicated generator to make the holes independent of other random draws.
+            trail_format: 'list' (one float64 point per tick, NaN for holes), 'compact' (see players.trails) or
+                          'segments' (see players.trail_segments)
         """
 
         super(Player, self).__init__()
@@ -67,6 +75,7 @@ class Player(pygame.sprite.Sprite):
             self.name = name
 
         self.pos = np.array(init_pos, dtype=float)  # x-position in game world (pixel coordinates)
+        self.init_pos = self.pos.copy()  # spawn position (the first trail point is float32 in 'compact' format)
         self.dist_per_tick = dist_per_tick
         self.dphi_per_tick = dphi_per_tick
         self.min_turn_radius = self.dist_per_tick / (2 * sin(0.5*self.dphi_per_tick))
@@ -86,10 +95,17 @@ class Player(pygame.sprite.Sprite):
         pygame.draw.circle(self.surf, color, (self.radius, self.radius), self.radius, 0)
         self.surf.set_colorkey((0, 0, 0), RLEACCEL)  # set transparent color
         #self.rect = self.surf.get_rect(center=self.pos)
-        self.trail = [self.pos.copy()]  # Trail behind player (in cartesian coordinates)
+        # Trail behind player (in cartesian coordinates)
+        self.trail = make_trail(self.pos, trail_format, self.angle, self.dist_per_tick, self.dphi_per_tick)
         self.angle_history = [self.angle]
 
+        # Life cycle (set by the game when the player is disabled)
+        self.reason_of_death = None
+        self.death_tick = None
+
         # Hole settings
+        self.rng = np.random if rng is None else rng
+        self.num_hole_rolls = 0  # number of draws from `rng` (allows to restore the state of the generator)
         self.hole_width = 2 * self.radius * hole_width  # hole width in game units (px)
         # self.active_hole = False # If true, player does currently draw a "hole" as trail
         self.size_of_active_hole = 0.0
@@ -117,6 +133,12 @@ class Player(pygame.sprite.Sprite):
     def active_hole(self):
         return self.dist_to_next_hole <= 0.0
 
+    def hole_settings(self):
+        """ Keyword arguments that reproduce the hole settings of this player"""
+        return dict(hole_width=self.hole_width / (2 * self.radius), startblock_length=self.startblock_length,
+                    min_dist_between_holes=self.min_dist_between_holes,
+                    max_dist_between_holes=self.max_dist_between_holes)
+
     def apply_steering(self, pressed_keys):
         # note: this function should only be called once per tick for all regular players
         if pressed_keys[self.steer_left_key]:
@@ -126,15 +148,23 @@ class Player(pygame.sprite.Sprite):
             logger.debug(f"{self} steering to the right")
             self.angle += self.dphi_per_tick
 
+    def apply_action(self, action):
+        """ Steer according to `action` (PlayerAction or its integer value), e.g. computed by an AI player"""
+        if action == PlayerAction.SteerLeft:
+            self.angle -= self.dphi_per_tick
+        elif action == PlayerAction.SteerRight:
+            self.angle += self.dphi_per_tick
+
     def _roll_dist_to_next_hole(self):
         if np.isinf(self.startblock_length):
             # Switch off holes
             return np.inf
+        self.num_hole_rolls += 1
         if self.dist_travelled < self.startblock_length:
-            dist = self.startblock_length + self.max_dist_between_holes * np.random.random()
+            dist = self.startblock_length + self.max_dist_between_holes * self.rng.random()
         else:
             width = self.max_dist_between_holes - self.min_dist_between_holes
-            dist = self.min_dist_between_holes + width * np.random.random()
+            dist = self.min_dist_between_holes + width * self.rng.random()
 
         logger.debug(f"Next hole for {self} in {int(dist / self.dist_per_tick)} ticks")
         return dist
@@ -152,10 +182,18 @@ class Player(pygame.sprite.Sprite):
         if self.active_hole:
             if log:
                 logger.debug(f"active hole for Player {self.idx}")
-            self.trail.append(np.array([np.nan] * 2))
+            if isinstance(self.trail, CompactTrail):
+                self.trail.append_hole()
+            elif isinstance(self.trail, SegmentTrail):
+                # Hole ticks keep their position (not drawn), segments are continued from it
+                self.trail.append(self.pos, self.angle, drawn=False)
+            else:
+                self.trail.append(np.array([np.nan] * 2))
             if self.dist_to_next_hole < -self.hole_width:
                 # Hole ends with this tick, roll distance to next hole
                 self.dist_to_next_hole = self._roll_dist_to_next_hole()
+        elif isinstance(self.trail, SegmentTrail):
+            self.trail.append(self.pos, self.angle)
         else:
             self.trail.append(self.pos.copy())  # save updated position in history
 
@@ -185,7 +223,16 @@ class Player(pygame.sprite.Sprite):
         if len(self.trail) <= num_recent_frames_to_skip:
             return False
 
-        sq_dist = np.sum((np.asarray(self.trail[:-num_recent_frames_to_skip]) - self.pos) ** 2, axis=1)
+        if isinstance(self.trail, SegmentTrail):
+            if self.trail.collides(self.pos, 2 * self.radius, stop=-num_recent_frames_to_skip, inclusive=True):
+                logger.debug("Collided with own history")
+                return True
+            return False
+        if isinstance(self.trail, CompactTrail):
+            points = self.trail.drawn(stop=-num_recent_frames_to_skip)
+        else:
+            points = np.asarray(self.trail[:-num_recent_frames_to_skip])
+        sq_dist = np.sum((points - self.pos) ** 2, axis=1)
         frame_collides = sq_dist <= (2 * self.radius) ** 2
         num_colliding_frames = np.sum(frame_collides)
         if num_colliding_frames > 0:
@@ -195,7 +242,13 @@ class Player(pygame.sprite.Sprite):
             return False
 
     def check_player_collision(self, other):
-        sq_dist = np.sum((np.asarray(other.trail) - self.pos) ** 2, axis=1)
+        if isinstance(other.trail, SegmentTrail):
+            if other.trail.collides(self.pos, self.radius):
+                logger.debug(f"{self} collided with the trail of player {other.idx}")
+                return True
+            return False
+        points = other.trail.points if isinstance(other.trail, CompactTrail) else np.asarray(other.trail)
+        sq_dist = np.sum((points - self.pos) ** 2, axis=1)
         frame_collides = sq_dist < self.radius ** 2
         num_colliding_frames = np.sum(frame_collides)
         if num_colliding_frames > 0:
@@ -0,0 +1,287 @@
+"""Online compression of trails into line and arc segments
+
+Players move a fixed distance per tick and turn by exactly +-dphi_per_tick, so the ticks between two steering changes
+lie on a straight line or on an arc of the minimum turn radius. A SegmentTrail stores one record per such segment
+(first tick, number of ticks, start position and angle, turn direction, drawn or hole, bounding box) instead of one
+point per tick.
+
+Before a tick is merged into the current segment, the position that the segment predicts for it is compared with the
+actual position of the player, with the same floating point operations as Player.move(). Only bit-identical ticks are
+merged, so `reconstruct()` returns exactly the points of the list format, and anything else that moves a player
+(e.g. other steering amounts) simply starts a new segment.
+
+Collision queries (`collides()`) first select the segments whose bounding box is in reach and only reconstruct their
+points, so they scale with the number of segments. Planners can use `segments()`, which returns the drawn parts as
+sparse polylines (two points per line segment, arcs sampled within a given tolerance).
+"""
+import copy
+from math import cos, sin, asin
+
+import numpy as np
+
+
+class SegmentTrail:
+    """ Trail of a player as sequence of line and arc segments"""
+
+    def __init__(self, init_pos, init_angle, dist_per_tick, dphi_per_tick, capacity=64):
+        self.dist_per_tick = dist_per_tick
+        self.dphi_per_tick = dphi_per_tick
+        self.turn_radius = dist_per_tick / (2 * sin(0.5 * dphi_per_tick))
+
+        self._num_segments = 0
+        self._start = np.empty(capacity, dtype=np.int64)        # first tick
+        self._length = np.empty(capacity, dtype=np.int64)       # number of ticks
+        self._turn = np.empty(capacity, dtype=np.int8)          # -1: left, 0: straight, 1: right
+        self._drawn = np.empty(capacity, dtype=bool)            # False for holes
+        self._origin = np.empty((capacity, 3), dtype=float)     # x, y, angle of the first tick
+        self._bbox = np.empty((capacity, 4), dtype=float)       # xmin, ymin, xmax, ymax of the points
+        self._num_ticks = 0
+
+        # Points of the last segment (its points are queried every tick, e.g. for self-collision checks)
+        self._open_points = np.empty((capacity, 2), dtype=float)
+        self._last_angle = None
+        # Polylines of the closed segments (they do not change), per tolerance
+        self._samples = {}
+        self._new_segment(np.asarray(init_pos, dtype=float), init_angle, True)
+
+    @classmethod
+    def from_points(cls, points, dist_per_tick, dphi_per_tick, angles=None):
+        """ SegmentTrail of a trail in list format (N x 2, NaN rows are holes). `angles` are the headings at the points
+        (by default the directions between consecutive points). Points that were not created by player moves are
+        stored as segments of their own."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if angles is None:
+            diff = np.diff(points, axis=0)
+            angles = np.arctan2(diff[:, 1], diff[:, 0])
+            angles = np.concatenate([angles[:1], angles]) if len(angles) > 0 else np.zeros(len(points))
+        trail = cls(points[0], float(angles[0]), dist_per_tick, dphi_per_tick, capacity=16)
+        for point, angle in zip(points[1:], angles[1:]):
+            trail.append(point, float(angle), drawn=not np.isnan(point[0]))
+        return trail
+
+    # Storage ------------------------------
+    @property
+    def num_segments(self):
+        return self._num_segments
+
+    @property
+    def nbytes(self):
+        n = self._num_segments
+        return n * (8 + 8 + 1 + 1 + 3 * 8 + 4 * 8) + self._num_open * 16
+
+    @property
+    def _num_open(self):
+        return int(self._length[self._num_segments - 1])
+
+    def __len__(self):
+        """ Number of ticks"""
+        return self._num_ticks
+
+    def _grow(self):
+        for name in ('_start', '_length', '_turn', '_drawn', '_origin', '_bbox'):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.empty_like(array)]))
+
+    def _new_segment(self, pos, angle, drawn):
+        if self._num_segments == len(self._start):
+            self._grow()
+        k = self._num_segments
+        self._start[k] = self._num_ticks
+        self._length[k] = 1
+        self._turn[k] = 0
+        self._drawn[k] = drawn
+        self._origin[k] = pos[0], pos[1], angle
+        self._bbox[k] = pos[0], pos[1], pos[0], pos[1]
+        self._num_segments += 1
+        self._num_ticks += 1
+        self._open_points[0] = pos
+        self._last_angle = angle
+
+    def append(self, pos, angle, drawn=True):
+        """ Add the position and angle of the player after a tick. `drawn` is False for the ticks of a hole."""
+        k = self._num_segments - 1
+        n = int(self._length[k])
+        last_angle = self._last_angle
+        if angle == last_angle:
+            turn = 0
+        elif angle == last_angle + self.dphi_per_tick:
+            turn = 1
+        elif angle == last_angle - self.dphi_per_tick:
+            turn = -1
+        else:
+            turn = None
+
+        if turn is not None and drawn == self._drawn[k] and (n == 1 or turn == self._turn[k]):
+            # Same operations as Player.move()
+            expected = self._open_points[n - 1] + self.dist_per_tick * np.asarray([cos(angle), sin(angle)])
+            if expected[0] == pos[0] and expected[1] == pos[1]:
+                if n == len(self._open_points):
+                    self._open_points = np.concatenate([self._open_points, np.empty_like(self._open_points)])
+                self._open_points[n] = pos
+                self._length[k] = n + 1
+                self._turn[k] = turn
+                bbox = self._bbox[k]
+                bbox[0], bbox[1] = min(bbox[0], pos[0]), min(bbox[1], pos[1])
+                bbox[2], bbox[3] = max(bbox[2], pos[0]), max(bbox[3], pos[1])
+                self._num_ticks += 1
+                self._last_angle = angle
+                return
+        self._new_segment(np.asarray(pos, dtype=float), angle, drawn)
+
+    def pop(self, index=-1):
+        """ Remove the last tick. Returns its point (NaN for a hole tick)."""
+        if index not in (-1, len(self) - 1):
+            raise ValueError("Only the last tick of a SegmentTrail can be removed")
+        if self._num_ticks == 1:
+            raise ValueError("The first tick of a SegmentTrail can not be removed")
+        k = self._num_segments - 1
+        n = int(self._length[k])
+        point = self._open_points[n - 1].copy() if self._drawn[k] else np.full(2, np.nan)
+        self._num_ticks -= 1
+        if n > 1:
+            # The bounding box is not shrunk, it stays a valid (slightly larger) bound
+            self._length[k] = n - 1
+            self._last_angle = self._angles(k, n - 1)[-1]
+        else:
+            # The previous segment becomes the last one again, its points are reconstructed into the buffer
+            self._open_points = self._exact_points(k - 1).copy()
+            self._last_angle = self._angles(k - 1, int(self._length[k - 1]))[-1]
+            self._num_segments -= 1
+            for samples in self._samples.values():
+                del samples[self._num_segments - 1:]
+        return point
+
+    def truncated(self, num_ticks):
+        """ Copy of the trail of the first `num_ticks` ticks (at least one)"""
+        num_ticks = min(max(int(num_ticks), 1), len(self))
+        k = int(self._segment_index(num_ticks - 1))
+        n = num_ticks - int(self._start[k])
+        trail = copy.copy(self)
+        for name in ('_start', '_length', '_turn', '_drawn', '_origin', '_bbox'):
+            setattr(trail, name, getattr(self, name)[:k + 1].copy())
+        # The bounding box of the last segment is not shrunk, it stays a valid (slightly larger) bound
+        trail._length[k] = n
+        trail._num_segments = k + 1
+        trail._num_ticks = num_ticks
+        trail._open_points = self._exact_points(k, n).copy()
+        trail._last_angle = self._angles(k, n)[-1]
+        trail._samples = {tolerance: samples[:k] for tolerance, samples in self._samples.items()}
+        return trail
+
+    # Reconstruction ------------------------------
+    def _angles(self, k, n):
+        """ Angles of the first `n` ticks of segment `k` (sequence of additions, as in Player.apply_steering)"""
+        steps = np.full(n, self._turn[k] * self.dphi_per_tick)
+        steps[0] = self._origin[k, 2]
+        return np.cumsum(steps)
+
+    def _exact_points(self, k, n=None):
+        """ Points of the first `n` ticks of segment `k`, bit-identical to the positions of the player"""
+        length = int(self._length[k])
+        n = length if n is None else min(n, length)
+        if k == self._num_segments - 1:
+            return self._open_points[:n]
+        if self._turn[k] == 0:
+            angle = self._origin[k, 2]
+            steps = np.empty((n, 2))
+            steps[1:] = self.dist_per_tick * np.asarray([cos(angle), sin(angle)])
+        else:
+            angles = self._angles(k, n)[1:]
+            steps = np.empty((n, 2))
+            steps[1:, 0] = self.dist_per_tick * np.array([cos(a) for a in angles])
+            steps[1:, 1] = self.dist_per_tick * np.array([sin(a) for a in angles])
+        steps[0] = self._origin[k, :2]
+        # cumsum adds up sequentially, like `pos += vel_vec`
+        return np.cumsum(steps, axis=0)
+
+    def _segment_index(self, ticks):
+        return np.searchsorted(self._start[:self._num_segments], ticks, side='right') - 1
+
+    def reconstruct(self, start=0, stop=None):
+        """ Points of the ticks [start, stop) in list format: float64, NaN rows for holes"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        rows = np.full((max(stop - start, 0), 2), np.nan)
+        if stop <= start:
+            return rows
+        for k in range(int(self._segment_index(start)), int(self._segment_index(stop - 1)) + 1):
+            if not self._drawn[k]:
+                continue
+            s = int(self._start[k])
+            i0, i1 = max(start, s), min(stop, s + int(self._length[k]))
+            rows[i0 - start:i1 - start] = self._exact_points(k, i1 - s)[i0 - s:]
+        return rows
+
+    # Queries ------------------------------
+    def collides(self, pos, radius, stop=None, inclusive=False):
+        """ True if a drawn point of the ticks before `stop` (negative: counted from the end) is closer than `radius`
+        to `pos` (or at distance `radius`, if `inclusive`). Same result as checking all points of the trail."""
+        n = self._num_segments
+        stop = len(self) if stop is None else (max(len(self) + stop, 0) if stop < 0 else min(stop, len(self)))
+        bbox = self._bbox[:n]
+        candidates = np.flatnonzero(self._drawn[:n] & (self._start[:n] < stop) &
+                                    (bbox[:, 0] - radius <= pos[0]) & (pos[0] <= bbox[:, 2] + radius) &
+                                    (bbox[:, 1] - radius <= pos[1]) & (pos[1] <= bbox[:, 3] + radius))
+        r2 = radius ** 2
+        for k in candidates:
+            points = self._exact_points(k, stop - int(self._start[k]))
+            sq_dist = np.sum((points - pos) ** 2, axis=1)
+            if np.any(sq_dist <= r2 if inclusive else sq_dist < r2):
+                return True
+        return False
+
+    def _sample(self, k, tolerance):
+        """ Sparse polyline of segment `k`: end points of lines, arc points with a maximum deviation of `tolerance`"""
+        n = int(self._length[k])
+        if self._turn[k] == 0 or n <= 2:
+            return self._exact_points(k)[[0, n - 1]] if n > 1 else self._exact_points(k)
+        # Sagitta of a chord that spans m ticks: R * (1 - cos(m * dphi / 2))
+        max_span = 2 * asin(min(1., np.sqrt(2 * tolerance / self.turn_radius))) / self.dphi_per_tick
+        idx = np.unique(np.append(np.arange(0, n, max(int(max_span), 1)), n - 1))
+        return self._exact_points(k)[idx]
+
+    def segments(self, stop=None, tolerance=0.25):
+        """ Drawn parts of the ticks before `stop` (negative: counted from the end) as polylines. Consecutive drawn
+        segments are joined, lines only contribute their end points and arcs are sampled (max. deviation
+        `tolerance`)."""
+        stop = len(self) if stop is None else (max(len(self) + stop, 0) if stop < 0 else min(stop, len(self)))
+        samples = self._samples.setdefault(tolerance, [])
+        for k in range(len(samples), self._num_segments - 1):
+            samples.append(self._sample(k, tolerance) if self._drawn[k] else None)
+        parts, current = [], []
+        for k in range(self._num_segments):
+            s = int(self._start[k])
+            if s >= stop:
+                break
+            if not self._drawn[k]:
+                if current:
+                    parts.append(np.concatenate(current))
+                current = []
+            elif s + int(self._length[k]) > stop:
+                current.append(self._exact_points(k, stop - s))
+            elif k < len(samples):
+                current.append(samples[k])
+            else:
+                current.append(self._sample(k, tolerance))
+        if current:
+            parts.append(np.concatenate(current))
+        return parts
+
+    # List format ------------------------------
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return self.reconstruct()[item]
+            return self.reconstruct(start, stop)
+        tick = range(len(self))[item]
+        return self.reconstruct(tick, tick + 1)[0]
+
+    def __iter__(self):
+        return iter(self.reconstruct())
+
+    def __array__(self, dtype=None, copy=None):
+        rows = self.reconstruct()
+        return rows if dtype is None else rows.astype(dtype)
+
+    def __repr__(self):
+        return f"SegmentTrail({len(self)} ticks, {self._num_segments} segments)"
@@ -0,0 +1,185 @@
+"""Compact trail representation
+
+By default, a player's trail is a list with one float64 point (numpy array) per tick, holes are NaN points. A
+CompactTrail stores the drawn points contiguously as float32 and the holes as a sorted array of [start, end) tick
+ranges. Collision checks and planners use `drawn()` and `segments()` directly, without scanning for NaNs.
+
+For code that expects the list format, a CompactTrail can be indexed and sliced by tick, iterated and converted with
+np.asarray(); these return float64 points with NaN rows for the hole ticks.
+"""
+import numpy as np
+
+from players.trail_segments import SegmentTrail
+
+
+class CompactTrail:
+    """ Trail of a player: drawn points (float32, contiguous) and hole tick ranges"""
+
+    def __init__(self, init_pos=None, capacity=256, dtype=np.float32):
+        self._points = np.empty((capacity, 2), dtype=dtype)
+        self._num_points = 0
+        self._holes = np.empty((16, 2), dtype=np.int64)    # [start, end) tick ranges, sorted
+        self._num_holes = 0
+        self._num_hole_ticks = 0
+        self._hole_ticks_before = None      # cache: number of hole ticks before each hole
+        if init_pos is not None:
+            self.append(init_pos)
+
+    @classmethod
+    def from_points(cls, points, dtype=np.float32):
+        """ CompactTrail of a trail in list format (N x 2, NaN rows are holes)"""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        trail = cls(capacity=max(len(points), 16), dtype=dtype)
+        is_hole = np.isnan(points[:, 0])
+        drawn = points[~is_hole]
+        trail._points[:len(drawn)] = drawn
+        trail._num_points = len(drawn)
+        edges = np.diff(np.concatenate([[0], is_hole.astype(np.int8), [0]]))
+        for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+            trail._add_hole(start, end)
+        return trail
+
+    # Storage ------------------------------
+    @property
+    def points(self):
+        """ All drawn points (view)"""
+        return self._points[:self._num_points]
+
+    @property
+    def holes(self):
+        """ [start, end) tick ranges of the holes (view). The last hole is open while the player leaves a hole."""
+        return self._holes[:self._num_holes]
+
+    @property
+    def nbytes(self):
+        return self.points.nbytes + self.holes.nbytes
+
+    def __len__(self):
+        """ Number of ticks (drawn points and holes)"""
+        return self._num_points + self._num_hole_ticks
+
+    def _add_hole(self, start, end):
+        if self._num_holes == len(self._holes):
+            self._holes = np.concatenate([self._holes, np.empty_like(self._holes)])
+        self._holes[self._num_holes] = start, end
+        self._num_holes += 1
+        self._num_hole_ticks += end - start
+        self._hole_ticks_before = None
+
+    def append(self, pos):
+        if self._num_points == len(self._points):
+            self._points = np.concatenate([self._points, np.empty_like(self._points)])
+        self._points[self._num_points] = pos
+        self._num_points += 1
+
+    def append_hole(self):
+        """ Append a tick without a drawn point"""
+        n = len(self)
+        if self._num_holes > 0 and self._holes[self._num_holes - 1, 1] == n:
+            self._holes[self._num_holes - 1, 1] += 1
+            self._num_hole_ticks += 1
+        else:
+            self._add_hole(n, n + 1)
+
+    def pop(self, index=-1):
+        """ Remove the last tick. Returns its point (NaN for a hole tick)."""
+        if index not in (-1, len(self) - 1):
+            raise ValueError("Only the last tick of a CompactTrail can be removed")
+        if self._num_holes > 0 and self._holes[self._num_holes - 1, 1] == len(self):
+            last = self._holes[self._num_holes - 1]
+            last[1] -= 1
+            self._num_hole_ticks -= 1
+            if last[1] == last[0]:
+                self._num_holes -= 1
+                self._hole_ticks_before = None
+            return np.full(2, np.nan)
+        self._num_points -= 1
+        return self._points[self._num_points].astype(float)
+
+    def truncated(self, num_ticks):
+        """ Copy of the trail of the first `num_ticks` ticks"""
+        num_ticks = min(int(num_ticks), len(self))
+        n, _ = self.point_index(num_ticks)
+        trail = CompactTrail(capacity=max(int(n), 16), dtype=self._points.dtype)
+        trail._points[:n] = self._points[:n]
+        trail._num_points = int(n)
+        for start, end in self.holes:
+            if start >= num_ticks:
+                break
+            trail._add_hole(int(start), min(int(end), num_ticks))
+        return trail
+
+    # Tick <-> point index ------------------------------
+    def _hole_ticks_before_each_hole(self):
+        if self._hole_ticks_before is None or len(self._hole_ticks_before) != self._num_holes:
+            lengths = self.holes[:, 1] - self.holes[:, 0]
+            self._hole_ticks_before = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        return self._hole_ticks_before
+
+    def point_index(self, ticks):
+        """ Number of drawn points before tick(s) `ticks` and whether the tick(s) are hole ticks"""
+        ticks = np.asarray(ticks)
+        if self._num_holes == 0:
+            return ticks, np.zeros(ticks.shape, dtype=bool)
+        holes = self.holes
+        # last hole that starts at or before each tick
+        j = np.searchsorted(holes[:, 0], ticks, side='right') - 1
+        jc = np.maximum(j, 0)
+        before = self._hole_ticks_before_each_hole()[jc] + np.clip(ticks - holes[jc, 0], 0,
+                                                                   holes[jc, 1] - holes[jc, 0])
+        before = np.where(j >= 0, before, 0)
+        in_hole = (j >= 0) & (ticks < holes[jc, 1])
+        return ticks - before, in_hole
+
+    def drawn(self, stop=None):
+        """ Drawn points of the ticks before `stop` (all by default, negative values count from the end), a view"""
+        if stop is None:
+            return self.points
+        if stop < 0:
+            stop = max(len(self) + stop, 0)
+        n, _ = self.point_index(min(stop, len(self)))
+        return self._points[:int(n)]
+
+    def segments(self, stop=None):
+        """ Drawn parts of the trail (split at the holes) of the ticks before `stop`, as views"""
+        points = self.drawn(stop)
+        if self._num_holes == 0:
+            return [points] if len(points) > 0 else []
+        breaks = self.holes[:, 0] - self._hole_ticks_before_each_hole()
+        breaks = breaks[(breaks > 0) & (breaks < len(points))]
+        return [s for s in np.split(points, breaks) if len(s) > 0]
+
+    # List format ------------------------------
+    def _rows(self, ticks):
+        n, in_hole = self.point_index(ticks)
+        rows = np.full((len(ticks), 2), np.nan)
+        rows[~in_hole] = self._points[n[~in_hole]]
+        return rows
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self._rows(np.arange(len(self))[item])
+        tick = range(len(self))[item]
+        return self._rows(np.array([tick]))[0]
+
+    def __iter__(self):
+        return iter(self._rows(np.arange(len(self))))
+
+    def __array__(self, dtype=None, copy=None):
+        rows = self._rows(np.arange(len(self)))
+        return rows if dtype is None else rows.astype(dtype)
+
+    def __repr__(self):
+        return f"CompactTrail({len(self)} ticks, {self._num_points} points, {self._num_holes} holes)"
+
+
+def make_trail(init_pos, trail_format='list', init_angle=0., dist_per_tick=None, dphi_per_tick=None):
+    """ Initial trail of a player in format 'list' (one float64 point per tick, NaN for holes), 'compact' or
+    'segments' (see players.trail_segments, needs the angle and movement per tick of the player)"""
+    if trail_format == 'list':
+        return [np.array(init_pos, dtype=float)]
+    if trail_format == 'compact':
+        return CompactTrail(init_pos)
+    if trail_format == 'segments':
+        return SegmentTrail(init_pos, init_angle, dist_per_tick, dphi_per_tick)
+    raise ValueError(f"Invalid trail format '{trail_format}'")
@@ -0,0 +1,209 @@
+"""Tick profiler for AchtungDieKurveGame
+
+Profiles a window of ticks or keeps only the N slowest ticks of a game and writes the result as collapsed stacks
+("folded" format), which can be turned into a flamegraph with flamegraph.pl, speedscope or inferno:
+
+    tick;ai;player 3;game.py:tick_forward;game.py:AchtungDieKurveGame.apply_ai_actions;... 1234
+
+The first frames of every stack are tags: the phase of the tick the game was in (state, ai, move, draw, collision,
+observers) and the player it was processing.
+
+Two modes are supported:
+    sampling        a background thread samples the stack of the game thread every `interval` seconds. Low overhead,
+                    weights are numbers of samples.
+    deterministic   every Python and C function call is traced (sys.setprofile). Exact, but slows down the game
+                    considerably. Weights are microseconds (own time of the innermost frame).
+
+Usage:
+    profiler = game.enable_profiling(mode='sampling', slowest=20)
+    game.run_game_loop()
+    profiler.save("game.folded")
+"""
+import heapq
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('state', 'ai', 'move', 'draw', 'collision', 'observers')
+
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _c_function_name(func):
+    module = getattr(func, '__module__', None) or type(getattr(func, '__self__', None)).__name__
+    return f"{module}:{getattr(func, '__qualname__', getattr(func, '__name__', repr(func)))}"
+
+
+class TickProfiler:
+    """ Collects collapsed stacks per tick. The game calls begin_tick(), set_phase() and end_tick()."""
+
+    def __init__(self, mode='sampling', ticks=None, slowest=None, interval=0.001):
+        """
+
+        Args:
+            mode (str): 'sampling' or 'deterministic'
+            ticks (tuple): only profile ticks in [ticks[0], ticks[1]) (all ticks by default)
+            slowest (int): only keep the stacks of the `slowest` slowest of the profiled ticks (all by default)
+            interval (float): sampling interval in seconds (mode 'sampling')
+        """
+        if mode not in ('sampling', 'deterministic'):
+            raise ValueError(f"Invalid profiling mode '{mode}'")
+        self.mode = mode
+        self.ticks = ticks
+        self.slowest = slowest
+        self.interval = interval
+
+        self.phase = 'state'
+        self.player = None
+        self.stacks = Counter()         # collapsed stack -> weight, ticks that were kept
+        self.tick_durations = {}        # tick -> duration in seconds, ticks that were kept
+        self._slowest_heap = []         # (duration, tick, stacks) of the slowest ticks
+        self._tick_stacks = None
+        self._tick = None
+        self._tick_t0 = None
+
+        # sampling
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._game_thread_id = None
+        self._switch_interval = None
+        # deterministic
+        self._root = None
+        self._call_stack = []
+
+    # Hooks called by the game ------------------------------
+    def begin_tick(self, tick):
+        if self.ticks is not None and not self.ticks[0] <= tick < self.ticks[1]:
+            return
+        self._tick = tick
+        self._tick_stacks = Counter()
+        self.phase, self.player = 'state', None
+        if self.mode == 'sampling':
+            self._ensure_sampler()
+        else:
+            # root frame of all stacks: the function that called begin_tick() (i.e. tick_forward)
+            self._root = _frame_name(sys._getframe(1).f_code)
+            self._call_stack = []
+            sys.setprofile(self._trace)
+        self._tick_t0 = time.perf_counter()
+
+    def set_phase(self, phase, player=None):
+        self.phase = phase
+        self.player = player
+
+    def end_tick(self):
+        if self._tick is None:
+            return
+        if self.mode == 'deterministic':
+            sys.setprofile(None)
+        duration = time.perf_counter() - self._tick_t0
+        tick, stacks = self._tick, self._tick_stacks
+        self._tick, self._tick_stacks = None, None
+
+        if self.slowest is None:
+            self.stacks.update(stacks)
+            self.tick_durations[tick] = duration
+        elif len(self._slowest_heap) < self.slowest:
+            heapq.heappush(self._slowest_heap, (duration, tick, stacks))
+        else:
+            heapq.heappushpop(self._slowest_heap, (duration, tick, stacks))
+
+    # Sampling ------------------------------
+    def _ensure_sampler(self):
+        if self._thread is not None:
+            return
+        self._game_thread_id = threading.get_ident()
+        # The sampler needs the GIL to take a sample, let the game thread release it more often
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval / 2))
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="TickProfiler", daemon=True)
+        self._thread.start()
+
+    def _sample_loop(self):
+        while not self._stop_event.wait(self.interval):
+            stacks = self._tick_stacks
+            if stacks is None:
+                continue
+            frame = sys._current_frames().get(self._game_thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                if frame.f_code.co_name == 'tick_forward':
+                    break
+                frame = frame.f_back
+            stacks[self._tags() + ";".join(reversed(names))] += 1
+
+    # Deterministic ------------------------------
+    def _trace(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call' or event == 'c_call':
+            name = _frame_name(frame.f_code) if event == 'call' else _c_function_name(arg)
+            parent = self._call_stack[-1][0] if self._call_stack else self._root
+            self._call_stack.append([parent + ";" + name, now, 0.])
+        elif event in ('return', 'c_return', 'c_exception'):
+            if not self._call_stack:
+                return
+            path, t0, child_time = self._call_stack.pop()
+            total = now - t0
+            # tags of the moment the frame returns, the phase may have changed while it was running
+            if self._tick_stacks is not None:
+                self._tick_stacks[self._tags() + path] += (total - child_time) * 1e6
+            if self._call_stack:
+                self._call_stack[-1][2] += total
+
+    # Results ------------------------------
+    def _tags(self):
+        player = "-" if self.player is None else f"player {self.player}"
+        return f"tick;{self.phase};{player};"
+
+    def stop(self):
+        """ Stop profiling (the collected stacks are kept)"""
+        if self._tick is not None:
+            self.end_tick()
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+            sys.setswitchinterval(self._switch_interval)
+        if self.mode == 'deterministic':
+            sys.setprofile(None)
+
+    def collapsed_stacks(self):
+        """ Collapsed stack -> weight (samples or microseconds) of all kept ticks"""
+        stacks = Counter(self.stacks)
+        for _, _, tick_stacks in self._slowest_heap:
+            stacks.update(tick_stacks)
+        return stacks
+
+    def kept_ticks(self):
+        """ Tick -> duration in seconds of all ticks whose stacks were kept"""
+        durations = dict(self.tick_durations)
+        durations.update({tick: duration for duration, tick, _ in self._slowest_heap})
+        return dict(sorted(durations.items()))
+
+    def phase_totals(self):
+        """ Weight per phase"""
+        totals = Counter()
+        for stack, weight in self.collapsed_stacks().items():
+            totals[stack.split(";")[1]] += weight
+        return dict(totals)
+
+    def save(self, fp):
+        """ Write the collapsed stacks to `fp` (one "stack weight" line per stack)"""
+        self.stop()
+        stacks = self.collapsed_stacks()
+        os.makedirs(os.path.dirname(os.path.abspath(fp)), exist_ok=True)
+        with open(fp, "w") as f:
+            for stack, weight in sorted(stacks.items()):
+                if int(round(weight)) > 0:
+                    f.write(f"{stack} {int(round(weight))}\n")
+        logger.info(f"Wrote {len(stacks)} collapsed stacks of {len(self.kept_ticks())} ticks to {fp}")
+        return fp
@@ -0,0 +1,4 @@
+from remote.server import GameServer
+from remote.client import RemoteAgent
+from remote.protocol import ClientGameState
+from remote.shared_state import SharedStatePublisher, SharedStateSubscriber
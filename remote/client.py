@@ -0,0 +1,117 @@
+"""Client side of the game server: connects an agent (a policy function) to a remote player
+
+    def policy(state, info):
+        # state: remote.protocol.ClientGameState, info: WELCOME message (own player index, arena size, ...)
+        return PlayerAction.KeepStraight
+
+    result = RemoteAgent(policy, name="my agent").run(port=5600)
+
+Run `python -m remote.client --port 5600` to connect an agent that steers randomly.
+"""
+import argparse
+import asyncio
+import logging
+import random
+
+from players.player_base import PlayerAction
+from remote import protocol
+from remote.protocol import ClientGameState, MessageType
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteAgent:
+    """ Plays a RemotePlayer of a GameServer with `policy(state, info) -> PlayerAction`"""
+
+    def __init__(self, policy, player_idx=protocol.ANY_PLAYER, name=""):
+        """
+
+        Args:
+            policy: function(ClientGameState, info dict) -> PlayerAction, called once per tick
+            player_idx (int): index of the remote player to control (default: any free one)
+            name (str): name of the player (shown in the scoreboard)
+        """
+        self.policy = policy
+        self.player_idx = player_idx
+        self.name = name
+        self.state = ClientGameState()
+        self.info = None
+        self.num_actions = 0
+
+    def run(self, host="127.0.0.1", port=None, path=None):
+        return asyncio.run(self.play(host, port, path))
+
+    async def play(self, host="127.0.0.1", port=None, path=None):
+        """ Play until the game is over. Returns the GAME_OVER message (winner and scoreboard)."""
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+
+        receiver = None
+        try:
+            writer.write(protocol.encode_join(self.player_idx, self.name))
+            msg_type, self.info = await protocol.read_message(reader)
+            if msg_type == MessageType.ERROR:
+                raise RuntimeError(f"Game server refused to join: {self.info['message']}")
+            logger.info(f"Joined as player {self.info['player_idx']}")
+
+            messages = asyncio.Queue()
+            receiver = asyncio.create_task(self._receive(reader, messages))
+            while True:
+                msg_type, msg = await messages.get()
+                # Let the receiver catch up, if the policy was slow: all deltas are applied, only the most recent
+                # state is answered
+                await asyncio.sleep(0)
+                while True:
+                    if msg_type == MessageType.GAME_OVER:
+                        return msg
+                    if msg_type == MessageType.ERROR:
+                        raise RuntimeError(f"Game server: {msg['message']}")
+                    if msg_type != MessageType.STATE:
+                        raise RuntimeError(f"Unexpected message {msg_type.name}")
+                    self.state.apply(msg)
+                    if messages.empty():
+                        break
+                    msg_type, msg = messages.get_nowait()
+
+                if not self.state.alive.get(self.info['player_idx'], False):
+                    continue
+                action = self.policy(self.state, self.info)
+                writer.write(protocol.encode_action(msg['tick'], action))
+                self.num_actions += 1
+        finally:
+            if receiver is not None:
+                receiver.cancel()
+            writer.close()
+
+    @staticmethod
+    async def _receive(reader, messages):
+        try:
+            while True:
+                msg_type, msg = await protocol.read_message(reader)
+                messages.put_nowait((msg_type, msg))
+                if msg_type == MessageType.GAME_OVER:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            messages.put_nowait((MessageType.ERROR, dict(message=f"connection lost ({e!r})")))
+
+
+def random_policy(state, info):
+    return random.choice(list(PlayerAction))
+
+
+if __name__ == "__main__":
+    from log import setup_colored_logs
+
+    parser = argparse.ArgumentParser(description="Connect a randomly steering agent to a game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--path", default=None, help="Unix domain socket of the server")
+    parser.add_argument("--player", type=int, default=protocol.ANY_PLAYER)
+    args = parser.parse_args()
+
+    setup_colored_logs(logging.INFO)
+    result = RemoteAgent(random_policy, player_idx=args.player, name="random agent").run(args.host, args.port,
+                                                                                          args.path)
+    print(result)
@@ -0,0 +1,165 @@
+"""Binary protocol between the game server and remote agents
+
+Every message is a frame: <u32 payload length> <u8 message type> <payload>, all numbers little endian.
+
+    client -> server
+        JOIN        u8 requested player index (255: any free remote player), utf-8 name
+        ACTION      u32 tick, i8 action (-1: left, 0: straight, 1: right)
+
+    server -> client
+        WELCOME     u8 player index, u16 action deadline [ms], f32 arena width, f32 arena height,
+                    f32 dist_per_tick, f32 dphi_per_tick, f32 player radius
+        STATE       u32 tick for which an action is requested, u8 number of player records, then per player:
+                    u8 idx, u8 alive, f32 x, f32 y, f32 angle, u32 index of the first new trail point,
+                    u16 number of new points n, n * (f32 x, f32 y)
+        GAME_OVER   u8 winner (255: none), u8 number of players, then per player: u8 idx, i32 score
+        ERROR       utf-8 message
+
+STATE messages are deltas: they only contain the trail points that were added since the last STATE the client
+received (holes are NaN points, as in Player.trail), plus head position and angle of every player. ClientGameState
+applies them and keeps the full trails.
+"""
+import struct
+from enum import IntEnum
+
+import numpy as np
+
+from players.player_base import PlayerAction
+
+
+class MessageType(IntEnum):
+    JOIN = 1
+    ACTION = 2
+    WELCOME = 16
+    STATE = 17
+    GAME_OVER = 18
+    ERROR = 19
+
+
+HEADER = struct.Struct("<IB")
+_JOIN = struct.Struct("<B")
+_ACTION = struct.Struct("<Ib")
+_WELCOME = struct.Struct("<BHfffff")
+_STATE = struct.Struct("<IB")
+_PLAYER_DELTA = struct.Struct("<BBfffIH")
+_GAME_OVER = struct.Struct("<BB")
+_SCORE = struct.Struct("<Bi")
+
+NO_WINNER = 255
+ANY_PLAYER = 255
+MAX_POINTS_PER_MESSAGE = 2**16 - 1
+
+
+def _frame(msg_type, payload):
+    return HEADER.pack(len(payload) + 1, msg_type) + payload
+
+
+def encode_join(player_idx=ANY_PLAYER, name=""):
+    return _frame(MessageType.JOIN, _JOIN.pack(player_idx) + name.encode())
+
+
+def encode_action(tick, action):
+    return _frame(MessageType.ACTION, _ACTION.pack(tick, int(action)))
+
+
+def encode_welcome(player_idx, deadline, width, height, dist_per_tick, dphi_per_tick, radius):
+    return _frame(MessageType.WELCOME, _WELCOME.pack(player_idx, int(round(deadline * 1000)), width, height,
+                                                     dist_per_tick, dphi_per_tick, radius))
+
+
+def encode_state(tick, player_deltas):
+    """
+
+    Args:
+        tick (int): tick for which the actions are requested
+        player_deltas: list of (idx, alive, pos, angle, start, points), `points` is a float32 array of shape (n, 2) with
+                       the trail points from index `start` on
+    """
+    parts = [_STATE.pack(tick, len(player_deltas))]
+    for idx, alive, pos, angle, start, points in player_deltas:
+        parts.append(_PLAYER_DELTA.pack(idx, alive, pos[0], pos[1], angle, start, len(points)))
+        parts.append(points.tobytes())
+    return _frame(MessageType.STATE, b"".join(parts))
+
+
+def encode_game_over(winner, scoreboard:dict):
+    payload = _GAME_OVER.pack(NO_WINNER if winner is None else winner, len(scoreboard))
+    payload += b"".join(_SCORE.pack(idx, score) for idx, score in scoreboard.items())
+    return _frame(MessageType.GAME_OVER, payload)
+
+
+def encode_error(message):
+    return _frame(MessageType.ERROR, message.encode())
+
+
+def decode(msg_type, payload):
+    """ Payload of a message as dict"""
+    if msg_type == MessageType.JOIN:
+        return dict(player_idx=payload[0], name=payload[_JOIN.size:].decode())
+    if msg_type == MessageType.ACTION:
+        tick, action = _ACTION.unpack(payload)
+        return dict(tick=tick, action=PlayerAction(action))
+    if msg_type == MessageType.WELCOME:
+        idx, deadline_ms, width, height, dist_per_tick, dphi_per_tick, radius = _WELCOME.unpack(payload)
+        return dict(player_idx=idx, deadline=deadline_ms / 1000, width=width, height=height,
+                    dist_per_tick=dist_per_tick, dphi_per_tick=dphi_per_tick, radius=radius)
+    if msg_type == MessageType.STATE:
+        tick, num_players = _STATE.unpack_from(payload)
+        offset = _STATE.size
+        players = []
+        for _ in range(num_players):
+            idx, alive, x, y, angle, start, n = _PLAYER_DELTA.unpack_from(payload, offset)
+            offset += _PLAYER_DELTA.size
+            points = np.frombuffer(payload, dtype='<f4', count=2 * n, offset=offset).reshape(n, 2)
+            offset += points.nbytes
+            players.append((idx, bool(alive), np.array([x, y]), angle, start, points))
+        return dict(tick=tick, players=players)
+    if msg_type == MessageType.GAME_OVER:
+        winner, num_players = _GAME_OVER.unpack_from(payload)
+        scores = dict(_SCORE.unpack_from(payload, _GAME_OVER.size + k * _SCORE.size) for k in range(num_players))
+        return dict(winner=None if winner == NO_WINNER else winner, scoreboard=scores)
+    if msg_type == MessageType.ERROR:
+        return dict(message=payload.decode())
+    raise ValueError(f"Unknown message type {msg_type}")
+
+
+async def read_message(reader):
+    """ (MessageType, payload dict) of the next message of an asyncio StreamReader"""
+    length, msg_type = HEADER.unpack(await reader.readexactly(HEADER.size))
+    payload = await reader.readexactly(length - 1)
+    return MessageType(msg_type), decode(msg_type, payload)
+
+
+class ClientGameState:
+    """ Game state on the client side, assembled from STATE deltas. `game_state()` has the format of
+    AchtungDieKurveGame.get_game_state() (without the angle history)."""
+
+    def __init__(self):
+        self.tick = None
+        self.alive = {}
+        self.positions = {}
+        self.angles = {}
+        self._trails = {}       # idx -> float32 array (capacity doubles when full)
+        self._lengths = {}
+
+    def apply(self, state:dict):
+        self.tick = state['tick']
+        for idx, alive, pos, angle, start, points in state['players']:
+            self.alive[idx] = alive
+            self.positions[idx] = pos
+            self.angles[idx] = angle
+            trail = self._trails.get(idx)
+            if trail is None:
+                trail = self._trails[idx] = np.empty((max(256, start + len(points)), 2), dtype=np.float32)
+            end = start + len(points)
+            if end > len(trail):
+                trail = self._trails[idx] = np.concatenate([trail, np.empty((max(len(trail), end - len(trail)), 2),
+                                                                            dtype=np.float32)])
+            trail[start:end] = points
+            self._lengths[idx] = max(self._lengths.get(idx, 0), end)
+
+    def trail(self, idx):
+        return self._trails[idx][:self._lengths[idx]]
+
+    def game_state(self):
+        return {idx: {'alive': self.alive[idx], 'trail': self.trail(idx)} for idx in self._trails}
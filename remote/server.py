@@ -0,0 +1,252 @@
+"""Asyncio game server for agents in other processes
+
+The game is spawned as usual, with RemotePlayers for the agents that connect over a local socket (TCP or Unix domain
+socket). Every tick, the server
+
+    1. sends a STATE delta (see remote.protocol) to every client,
+    2. waits until all connected remote players have sent their action, but at most `action_deadline` seconds,
+    3. advances the game. Remote players without an action carry out their default action.
+
+The tick loop never waits for a slow client: states are written to the socket buffers without waiting for them to be
+flushed, and clients whose buffer is full skip states (the next delta contains all trail points they missed).
+
+Usage:
+    game = AchtungDieKurveGame(mode="headless", rng_seed=0)
+    game.spawn_player(1, player_type=RemotePlayer)
+    game.spawn_player(2, player_type=NStepPlanPlayer)
+    GameServer(game, port=5600).run()
+"""
+import asyncio
+import logging
+
+import numpy as np
+
+from players.aiplayers import RemotePlayer
+from remote import protocol
+from remote.protocol import MessageType
+
+logger = logging.getLogger(__name__)
+
+
+class _Client:
+    def __init__(self, reader, writer, player):
+        self.reader = reader
+        self.writer = writer
+        self.player = player
+        self.num_sent_points = {}   # idx -> number of trail points of that player the client has received
+        self.num_skipped_states = 0
+
+
+class GameServer:
+    """ Runs a game whose RemotePlayers are controlled by clients (see remote.client.RemoteAgent)"""
+
+    def __init__(self, game, host="127.0.0.1", port=0, path=None, action_deadline=0.05, join_timeout=30.,
+                 realtime=False, max_buffer_size=2**20):
+        """
+
+        Args:
+            game (AchtungDieKurveGame): game with spawned players, at least one of them a RemotePlayer
+            host (str): interface to listen on
+            port (int): TCP port (0: any free port, see `address`)
+            path (str): listen on this Unix domain socket instead of TCP
+            action_deadline (float): maximum time in seconds to wait for the actions of a tick
+            join_timeout (float): time in seconds to wait for all remote players to join before the game starts.
+                                  Players that did not join carry out their default action.
+            realtime (bool): advance the game at most at its tick rate (otherwise as fast as the agents respond)
+            max_buffer_size (int): states are skipped for clients with more bytes than this waiting to be sent
+        """
+        self.game = game
+        self.host = host
+        self.port = port
+        self.path = path
+        self.action_deadline = action_deadline
+        self.join_timeout = join_timeout
+        self.realtime = realtime
+        self.max_buffer_size = max_buffer_size
+
+        self.remote_players = [p for p in game.players if isinstance(p, RemotePlayer)]
+        if len(self.remote_players) == 0:
+            raise ValueError("The game has no RemotePlayers")
+        self.clients = []
+        self.address = None
+        self.action_wait_times = []     # seconds waited for the actions of each tick
+        self._actions_ready = None
+        self._all_joined = None
+        self._handlers = set()
+
+    def run(self):
+        """ Serve the game until it is finished. Returns the game."""
+        return asyncio.run(self.serve())
+
+    async def serve(self):
+        self._actions_ready = asyncio.Event()
+        self._all_joined = asyncio.Event()
+        if self.path is not None:
+            server = await asyncio.start_unix_server(self._handle_client, path=self.path)
+            self.address = self.path
+        else:
+            server = await asyncio.start_server(self._handle_client, host=self.host, port=self.port)
+            self.address = server.sockets[0].getsockname()[:2]
+        logger.info(f"Game server listening on {self.address}, waiting for {len(self.remote_players)} remote players")
+
+        try:
+            try:
+                await asyncio.wait_for(self._all_joined.wait(), self.join_timeout)
+            except asyncio.TimeoutError:
+                missing = [p.idx for p in self.remote_players if not p.connected]
+                logger.warning(f"Remote players {missing} did not join within {self.join_timeout} s")
+            await self._play()
+        finally:
+            server.close()
+            await self._disconnect_clients()
+        return self.game
+
+    async def _disconnect_clients(self, timeout=1.):
+        # Clients disconnect after GAME_OVER. Closing their sockets first would discard unread data (e.g. GAME_OVER).
+        if self._handlers:
+            await asyncio.wait(self._handlers, timeout=timeout)
+        for client in self.clients:
+            client.writer.close()
+        if self._handlers:
+            await asyncio.wait(self._handlers, timeout=timeout)
+
+    async def _play(self):
+        game = self.game
+        loop = asyncio.get_running_loop()
+        game.running = True
+        while game.running:
+            t0 = loop.time()
+            tick = game.current_frame + 1
+            for p in self.remote_players:
+                p.expect_action(tick)
+            self._actions_ready.clear()
+            self._broadcast_state(tick)
+
+            if self._waiting_for_actions():
+                try:
+                    await asyncio.wait_for(self._actions_ready.wait(), self.action_deadline)
+                except asyncio.TimeoutError:
+                    pass
+            self.action_wait_times.append(loop.time() - t0)
+
+            game._timed_tick()
+
+            # Give the clients the chance to read (and the reader tasks to run) before the next tick
+            delay = game.dt_per_tick - (loop.time() - t0) if self.realtime else 0.
+            await asyncio.sleep(max(delay, 0.))
+
+        # Final state (trails including the last tick), then the result
+        self._broadcast_state(game.current_frame + 1)
+        message = protocol.encode_game_over(None if game.winner is None else game.winner.idx,
+                                            {p.idx: game.scoreboard[p.idx] for p in game.players})
+        for client in self.clients:
+            if not client.writer.is_closing():
+                client.writer.write(message)
+        late = {p.idx: p.num_late_actions for p in self.remote_players}
+        logger.info(f"Game finished after {game.current_frame + 1} ticks, late actions per remote player: {late}")
+
+    def _waiting_for_actions(self):
+        return any(p.connected and not p.has_action for p in self.remote_players if p in self.game.active_players)
+
+    def _broadcast_state(self, tick):
+        """ Write the state delta of every client to its socket without waiting"""
+        players = self.game.players
+        encoded = {}    # identical deltas are only encoded once
+        for client in self.clients:
+            if client.writer.is_closing():
+                continue
+            if client.writer.transport.get_write_buffer_size() > self.max_buffer_size:
+                client.num_skipped_states += 1
+                continue
+
+            starts = tuple(client.num_sent_points.get(p.idx, 0) for p in players)
+            if starts not in encoded:
+                deltas = []
+                for p, start in zip(players, starts):
+                    end = min(len(p.trail), start + protocol.MAX_POINTS_PER_MESSAGE)
+                    points = np.asarray(p.trail[start:end], dtype='<f4').reshape(-1, 2)
+                    deltas.append((p.idx, p in self.game.active_players, p.pos, p.angle, start, points))
+                encoded[starts] = (protocol.encode_state(tick, deltas),
+                                   {idx: start + len(points) for idx, _, _, _, start, points in deltas})
+            message, num_sent_points = encoded[starts]
+            client.writer.write(message)
+            client.num_sent_points = num_sent_points
+
+    def _free_player(self, requested_idx):
+        free = [p for p in self.remote_players if not p.connected]
+        if requested_idx != protocol.ANY_PLAYER:
+            free = [p for p in free if p.idx == requested_idx]
+        return free[0] if len(free) > 0 else None
+
+    async def _handle_client(self, reader, writer):
+        player = None
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            msg_type, join = await protocol.read_message(reader)
+            if msg_type != MessageType.JOIN:
+                raise ValueError(f"Expected JOIN, got {msg_type.name}")
+            player = self._free_player(join['player_idx'])
+            if player is None:
+                writer.write(protocol.encode_error(f"No free remote player (requested: {join['player_idx']})"))
+                writer.close()
+                return
+
+            player.connected = True
+            if join['name']:
+                player.name = join['name']
+            game = self.game
+            writer.write(protocol.encode_welcome(player.idx, self.action_deadline, game.screen_width,
+                                                 game.screen_height, player.dist_per_tick, player.dphi_per_tick,
+                                                 player.radius))
+            self.clients.append(_Client(reader, writer, player))
+            logger.info(f"{player} joined")
+            if all(p.connected for p in self.remote_players):
+                self._all_joined.set()
+
+            while True:
+                msg_type, msg = await protocol.read_message(reader)
+                if msg_type != MessageType.ACTION:
+                    raise ValueError(f"Expected ACTION, got {msg_type.name}")
+                if player.set_action(msg['tick'], msg['action']) and not self._waiting_for_actions():
+                    self._actions_ready.set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as e:
+            logger.warning(f"Invalid message from {'client' if player is None else player}: {e}")
+        finally:
+            if player is not None:
+                player.connected = False
+                logger.info(f"{player} disconnected")
+                # Do not wait for the actions of this player any longer
+                if not self._waiting_for_actions():
+                    self._actions_ready.set()
+            writer.close()
+            self._handlers.discard(task)
+
+
+if __name__ == "__main__":
+    import argparse
+    from game import AchtungDieKurveGame
+    from log import setup_colored_logs
+    from players.aiplayers import RandomSteeringAIPlayer
+
+    parser = argparse.ArgumentParser(description="Serve a game with remote players and randomly steering opponents")
+    parser.add_argument("--port", type=int, default=5600)
+    parser.add_argument("--path", default=None, help="Unix domain socket to listen on (instead of TCP)")
+    parser.add_argument("--remote", type=int, default=1, help="number of remote players")
+    parser.add_argument("--opponents", type=int, default=2, help="number of RandomSteeringAIPlayers")
+    parser.add_argument("--deadline", type=float, default=0.05, help="action deadline in seconds")
+    parser.add_argument("--realtime", action="store_true", help="advance the game at most at its tick rate")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    setup_colored_logs(logging.INFO)
+    game = AchtungDieKurveGame(mode="headless", rng_seed=args.seed)
+    for idx in range(1, args.remote + 1):
+        game.spawn_player(idx, player_type=RemotePlayer)
+    for idx in range(args.remote + 1, args.remote + args.opponents + 1):
+        game.spawn_player(idx, player_type=RandomSteeringAIPlayer)
+
+    GameServer(game, port=args.port, path=args.path, action_deadline=args.deadline, realtime=args.realtime).run()
+    game.print_scoreboard()
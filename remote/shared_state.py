@@ -0,0 +1,214 @@
+"""Game state in shared memory, for agents that run in other processes on the same machine
+
+The publisher is a tick observer of the game. After every tick it appends the new trail points of all players to
+per-player ring buffers in a `multiprocessing.shared_memory` block and updates a small header (tick, trail lengths,
+head positions, angles, alive flags). Subscribers map the same block read-only: trails are numpy views of the shared
+buffer (no copy, as long as the ring buffer has not wrapped around), and per tick only the header is read.
+
+Consistency: the header is protected by a seqlock. The publisher makes the sequence counter odd before it writes and
+even again when it is done; readers retry if the counter was odd or changed while they read. Trail points are only
+appended, so the points below a trail length read from a consistent header stay valid until the ring buffer wraps
+around (after `capacity` more points of that player).
+
+Layout of the shared block (one slot per valid player index):
+
+    header      int64[8]                        seq, tick, capacity, num_slots
+    lengths     int64[num_slots]                number of trail points written per player (including overwritten)
+    heads       float64[num_slots, 4]           x, y, angle, alive
+    trails      float64[num_slots, capacity, 2] trail point k of a player is stored at k % capacity (holes are NaN)
+
+Usage:
+    # game process
+    publisher = game.publish_shared_state()
+    # agent process
+    state = SharedStateSubscriber(publisher.name)
+    tick = state.wait_for_tick(tick + 1)
+    action = planner.find_best_plan(state.game_state())
+"""
+import logging
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_HEADER_SIZE = 8
+_SEQ, _TICK, _CAPACITY, _NUM_SLOTS = range(4)
+_ANGLE, _ALIVE = 2, 3
+
+
+def _layout(buffer, num_slots, capacity):
+    """ Arrays of the shared block (see module docstring)"""
+    offset = 0
+    arrays = []
+    for dtype, shape in [(np.int64, (_HEADER_SIZE,)), (np.int64, (num_slots,)), (np.float64, (num_slots, 4)),
+                         (np.float64, (num_slots, capacity, 2))]:
+        arrays.append(np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset))
+        offset += arrays[-1].nbytes
+    return arrays
+
+
+def _shared_size(num_slots, capacity):
+    return 8 * (_HEADER_SIZE + num_slots + 4 * num_slots + 2 * num_slots * capacity)
+
+
+class SharedStatePublisher:
+    """ Tick observer that publishes the state of a game in shared memory"""
+
+    def __init__(self, game, capacity=2**16, name=None):
+        """
+
+        Args:
+            game (AchtungDieKurveGame): game to publish
+            capacity (int): size of the trail ring buffer of each player (in points). Trails that are longer are only
+                            available partially (the most recent `capacity` points).
+            name (str): name of the shared memory block (random by default, see `name`)
+        """
+        self.num_slots = max(game.valid_player_indices) + 1
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=_shared_size(self.num_slots, capacity))
+        self.header, self.lengths, self.heads, self.trails = _layout(self.shm.buf, self.num_slots, capacity)
+        self.header[:] = 0
+        self.lengths[:] = 0
+        self.heads[:] = np.nan
+        self.header[_CAPACITY] = capacity
+        self.header[_NUM_SLOTS] = self.num_slots
+        self.header[_TICK] = -1
+        self.on_tick(game)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ Release and remove the shared memory block. Subscribers keep their mapping until they close it."""
+        self.header = self.lengths = self.heads = self.trails = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def on_tick(self, game):
+        header = self.header
+        header[_SEQ] += 1   # odd: write in progress
+        for p in game.players:
+            num_written, length = self.lengths[p.idx], len(p.trail)
+            # Only new points are written (a reverse tick only shortens the trail)
+            if length > num_written:
+                start = max(num_written, length - self.capacity)
+                self.trails[p.idx, np.arange(start, length) % self.capacity] = p.trail[start:length]
+            self.lengths[p.idx] = length
+            self.heads[p.idx] = p.pos[0], p.pos[1], p.angle, p in game.active_players
+        header[_TICK] = game.current_frame
+        header[_SEQ] += 1   # even: consistent
+
+
+def _attach(name):
+    """ Map an existing block without registering it at the resource tracker: only the publisher removes the block,
+    the tracker would otherwise unlink it when the subscriber process exits."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, create=False, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=name, create=False)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedStateSubscriber:
+    """ Read-only view of a game state published by a SharedStatePublisher (in this or another process)"""
+
+    def __init__(self, name):
+        self.shm = _attach(name)
+        header = np.ndarray((_HEADER_SIZE,), dtype=np.int64, buffer=self.shm.buf)
+        self.num_slots, self.capacity = int(header[_NUM_SLOTS]), int(header[_CAPACITY])
+        self.header, self.lengths, self.heads, self.trails = _layout(self.shm.buf, self.num_slots, self.capacity)
+        for array in (self.header, self.lengths, self.heads, self.trails):
+            array.flags.writeable = False
+
+        self.tick = None
+        self.num_retries = 0
+        self._lengths = None
+        self._heads = None
+        self._cursors = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.header = self.lengths = self.heads = self.trails = None
+        self._lengths = self._heads = None
+        self.shm.close()
+
+    def refresh(self):
+        """ Read a consistent copy of the header (tick, trail lengths, heads). Returns the tick."""
+        header = self.header
+        while True:
+            seq = header[_SEQ]
+            if seq % 2 == 0:
+                tick, lengths, heads = int(header[_TICK]), self.lengths.copy(), self.heads.copy()
+                if header[_SEQ] == seq:
+                    break
+            self.num_retries += 1
+            # let the publisher finish its write
+            time.sleep(0)
+        self.tick, self._lengths, self._heads = tick, lengths, heads
+        return tick
+
+    def wait_for_tick(self, tick, timeout=None, poll_interval=0.0002):
+        """ Wait until the game has reached tick `tick` (or a later one). Returns the current tick.
+
+        Raises:
+            TimeoutError: if the tick was not reached within `timeout` seconds
+        """
+        t0 = time.perf_counter()
+        while self.header[_TICK] < tick:
+            if timeout is not None and time.perf_counter() - t0 > timeout:
+                raise TimeoutError(f"Tick {tick} not reached within {timeout} s")
+            time.sleep(poll_interval)
+        return self.refresh()
+
+    @property
+    def player_indices(self):
+        return [idx for idx in range(self.num_slots) if self._lengths[idx] > 0]
+
+    def alive(self, idx):
+        return bool(self._heads[idx, _ALIVE])
+
+    def pos(self, idx):
+        return self._heads[idx, :2]
+
+    def angle(self, idx):
+        return self._heads[idx, _ANGLE]
+
+    def trail(self, idx, start=0):
+        """ Trail points [start, length) of player `idx` as of the last refresh(). A view of the shared buffer if the
+        points are stored contiguously, otherwise a copy. Points that were already overwritten are left out."""
+        length = int(self._lengths[idx])
+        start = max(start, length - self.capacity)
+        i0, i1 = start % self.capacity, length % self.capacity
+        if start >= length:
+            return self.trails[idx, :0]
+        if i0 < i1 or i1 == 0:
+            return self.trails[idx, i0:i1 if i1 > 0 else self.capacity]
+        return np.concatenate([self.trails[idx, i0:], self.trails[idx, :i1]])
+
+    def new_points(self, idx):
+        """ Trail points of player `idx` that were added since the last call"""
+        points = self.trail(idx, start=self._cursors.get(idx, 0))
+        self._cursors[idx] = int(self._lengths[idx])
+        return points
+
+    def game_state(self):
+        """ Game state in the format of AchtungDieKurveGame.get_game_state() (without the angle history)"""
+        return {idx: {'alive': self.alive(idx), 'trail': self.trail(idx)} for idx in self.player_indices}
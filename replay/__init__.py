@@ -0,0 +1,2 @@
+from replay.replay_format import Replay, ReplayRecorder
+from replay.replay_viewer import ReplayViewer
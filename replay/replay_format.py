@@ -0,0 +1,355 @@
+"""Compact binary replays: game settings, RNG seed, spawn positions and one PlayerAction per player and tick
+
+File layout (all integers little endian):
+
+    magic (4 bytes) | format version (uint16) | header length (uint32) | header (utf-8 JSON) | sections...
+
+The header describes the game and the byte lengths of the following sections:
+    - actions:        zlib-compressed action codes, bit-packed with 2 bits per player and tick
+    - keyframe ticks: int32 array (optional)
+    - keyframes:      float64 array (num_keyframes x num_players x num_keyframe_fields) (optional)
+    - debug trails:   int32 index (num_debug_trails x [tick, player idx, start, stop]) and float32 points (optional)
+"""
+import json
+import logging
+import struct
+import zlib
+
+import numpy as np
+
+from players.player_base import ReasonOfDeath
+from players.misc_players import ReplayPlayer
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ADKR"
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct("<4sHI")
+
+# Action codes: PlayerAction value + 1. The 4th code marks ticks in which a player was not active (anymore).
+INACTIVE_CODE = 3
+
+# Per-player state stored in keyframes
+KEYFRAME_FIELDS = ("x", "y", "angle", "dist_travelled", "total_reward", "dist_to_next_hole", "alive",
+                   "trail_length", "num_hole_rolls", "score")
+
+
+def pack_actions(codes):
+    """ Pack a (num_ticks x num_players) array of action codes (0..3) into bytes, 2 bits per code"""
+    flat = np.asarray(codes, dtype=np.uint8).ravel()
+    padded = np.zeros(4 * int(np.ceil(flat.size / 4)), dtype=np.uint8)
+    padded[:flat.size] = flat
+    quads = padded.reshape(-1, 4)
+    packed = quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)
+    return packed.astype(np.uint8).tobytes()
+
+
+def unpack_actions(data, num_ticks, num_players):
+    """ Inverse of pack_actions()"""
+    packed = np.frombuffer(data, dtype=np.uint8)
+    quads = np.stack([packed & 3, (packed >> 2) & 3, (packed >> 4) & 3, (packed >> 6) & 3], axis=1)
+    return quads.ravel()[:num_ticks * num_players].reshape(num_ticks, num_players)
+
+
+def _to_json_compatible(value):
+    if isinstance(value, dict):
+        return {k: _to_json_compatible(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_json_compatible(v) for v in value]
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+
+def infer_actions(players, last_angles):
+    """ Infer the actions (PlayerAction values) that `players` took in the last tick from their change in heading
+
+    Returns: (actions, angles) where `angles` are the current headings (pass them as `last_angles` in the next tick)
+    """
+    angles = np.array([p.angle for p in players])
+    dphi = np.array([p.dphi_per_tick for p in players])
+    actions = np.clip(np.rint((angles - last_angles) / dphi), -1, 1).astype(np.int8)
+    return actions, angles
+
+
+def capture_keyframe(game, players):
+    """ Snapshot of the per-player state of `game` as array (num_players x num_keyframe_fields)"""
+    kf = np.empty((len(players), len(KEYFRAME_FIELDS)), dtype=np.float64)
+    for k, p in enumerate(players):
+        kf[k] = (p.pos[0], p.pos[1], p.angle, p.dist_travelled, p.total_reward, p.dist_to_next_hole,
+                 p in game.active_players, len(p.trail), p.num_hole_rolls, game.scoreboard[p.idx])
+    return kf
+
+
+class Replay:
+    """ A recorded game that can be saved, loaded and re-simulated deterministically """
+
+    def __init__(self, header:dict, action_codes:np.ndarray, keyframe_ticks=None, keyframes=None,
+                 debug_trail_index=None, debug_trail_points=None):
+        self.header = header
+        self.action_codes = np.asarray(action_codes, dtype=np.uint8)
+        self.keyframe_ticks = np.zeros(0, dtype=np.int32) if keyframe_ticks is None else np.asarray(keyframe_ticks)
+        if keyframes is None:
+            keyframes = np.zeros((0, len(self.player_indices), len(KEYFRAME_FIELDS)))
+        self.keyframes = keyframes
+        self.debug_trail_index = np.zeros((0, 4), dtype=np.int32) if debug_trail_index is None else debug_trail_index
+        self.debug_trail_points = np.zeros((0, 2), dtype=np.float32) if debug_trail_points is None \
+            else debug_trail_points
+
+    def __str__(self):
+        return f"Replay ({self.num_ticks} ticks, players {self.player_indices}, seed {self.rng_seed})"
+
+    @property
+    def num_ticks(self):
+        return self.action_codes.shape[0]
+
+    @property
+    def rng_seed(self):
+        return self.header['rng_seed']
+
+    @property
+    def players(self):
+        return self.header['players']
+
+    @property
+    def player_indices(self):
+        return [p['idx'] for p in self.header['players']]
+
+    def player_actions(self, idx):
+        """ Actions of player `idx` (as PlayerAction values) up to the tick in which it died"""
+        codes = self.action_codes[:, self.player_indices.index(idx)]
+        inactive = np.flatnonzero(codes == INACTIVE_CODE)
+        if inactive.size > 0:
+            codes = codes[:inactive[0]]
+        return codes.astype(np.int8) - 1
+
+    def keyframe(self, tick):
+        """ Returns the latest keyframe at or before `tick` as (keyframe tick, dict of field -> per-player values)"""
+        k = np.searchsorted(self.keyframe_ticks, tick, side='right') - 1
+        if k < 0:
+            return None, None
+        return int(self.keyframe_ticks[k]), {f: self.keyframes[k, :, n] for n, f in enumerate(KEYFRAME_FIELDS)}
+
+    def death(self, idx):
+        """ Returns (tick, ReasonOfDeath) of player `idx` or (None, None) if it survived"""
+        p = self.players[self.player_indices.index(idx)]
+        if p['death_tick'] is None:
+            return None, None
+        return p['death_tick'], ReasonOfDeath[p['reason_of_death']]
+
+    def debug_trails_at(self, tick):
+        """ Planned trails (list of N x 2 arrays) per player, from each player's latest planning tick <= `tick`"""
+        trails = {}
+        rows = self.debug_trail_index[self.debug_trail_index[:, 0] <= tick]
+        for idx in np.unique(rows[:, 1]):
+            player_rows = rows[rows[:, 1] == idx]
+            latest = player_rows[player_rows[:, 0] == player_rows[:, 0].max()]
+            trails[int(idx)] = [self.debug_trail_points[start:stop] for _, _, start, stop in latest]
+        return trails
+
+    # Serialization ------------------------------
+    def to_bytes(self):
+        action_bytes = zlib.compress(pack_actions(self.action_codes), 9)
+        kf_tick_bytes = self.keyframe_ticks.astype('<i4').tobytes()
+        kf_bytes = np.ascontiguousarray(self.keyframes, dtype='<f8').tobytes()
+        dbg_index_bytes = np.ascontiguousarray(self.debug_trail_index, dtype='<i4').tobytes()
+        dbg_points_bytes = np.ascontiguousarray(self.debug_trail_points, dtype='<f4').tobytes()
+
+        header = dict(self.header)
+        header.update(num_ticks=self.num_ticks, action_bytes=len(action_bytes),
+                      num_keyframes=int(self.keyframe_ticks.size), keyframe_fields=list(KEYFRAME_FIELDS),
+                      num_debug_trails=int(self.debug_trail_index.shape[0]),
+                      num_debug_points=int(self.debug_trail_points.shape[0]))
+        header_bytes = json.dumps(_to_json_compatible(header)).encode('utf-8')
+
+        return b"".join([_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)), header_bytes,
+                         action_bytes, kf_tick_bytes, kf_bytes, dbg_index_bytes, dbg_points_bytes])
+
+    @classmethod
+    def from_bytes(cls, data:bytes):
+        magic, version, header_len = _PREAMBLE.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("Data is not an Achtung-die-Kurve replay (invalid magic bytes)")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Unsupported replay format version {version} (supported: <= {FORMAT_VERSION})")
+
+        offset = _PREAMBLE.size
+        header = json.loads(data[offset:offset + header_len].decode('utf-8'))
+        offset += header_len
+
+        num_ticks = header['num_ticks']
+        num_players = len(header['players'])
+        action_data = zlib.decompress(data[offset:offset + header['action_bytes']])
+        offset += header['action_bytes']
+        action_codes = unpack_actions(action_data, num_ticks, num_players)
+
+        num_kf = header['num_keyframes']
+        num_fields = len(header['keyframe_fields'])
+        keyframe_ticks = np.frombuffer(data, dtype='<i4', count=num_kf, offset=offset)
+        offset += 4 * num_kf
+        keyframes = np.frombuffer(data, dtype='<f8', count=num_kf * num_players * num_fields, offset=offset)
+        keyframes = keyframes.reshape(num_kf, num_players, num_fields)
+        offset += 8 * keyframes.size
+
+        num_dbg_trails = header.get('num_debug_trails', 0)
+        num_dbg_points = header.get('num_debug_points', 0)
+        dbg_index = np.frombuffer(data, dtype='<i4', count=4 * num_dbg_trails, offset=offset).reshape(-1, 4)
+        offset += 16 * num_dbg_trails
+        dbg_points = np.frombuffer(data, dtype='<f4', count=2 * num_dbg_points, offset=offset).reshape(-1, 2)
+
+        return cls(header, action_codes, keyframe_ticks, keyframes, dbg_index, dbg_points)
+
+    def save(self, fp:str):
+        data = self.to_bytes()
+        with open(fp, 'wb') as f:
+            f.write(data)
+        return len(data)
+
+    @classmethod
+    def load(cls, fp:str):
+        with open(fp, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+    # Re-simulation ------------------------------
+    def create_game(self, mode='headless', **game_kwargs):
+        """ Set up a new game with the recorded settings, spawn positions and ReplayPlayers"""
+        from game import AchtungDieKurveGame
+
+        settings = dict(self.header['game_settings'])
+        settings['rng_seed'] = self.rng_seed
+        settings.update(game_kwargs)
+        game = AchtungDieKurveGame(mode=mode, **settings)
+
+        for p in self.players:
+            game.spawn_player(p['idx'], init_pos=tuple(p['init_pos']), init_angle=p['init_angle'],
+                              player_type=ReplayPlayer, actions=self.player_actions(p['idx']), name=p['name'],
+                              **p['hole_settings'])
+        return game
+
+    def resimulate(self, mode='headless', verify=True, close_when_finished=True, **game_kwargs):
+        """ Play the replay with the game engine (at full speed if headless).
+
+        Args:
+            verify (bool): check the re-simulated state against the recorded keyframes and outcome
+
+        Returns: the finished game
+        """
+        game = self.create_game(mode=mode, **game_kwargs)
+        if verify and self.keyframe_ticks.size > 0:
+            game.add_tick_observer(_KeyframeVerifier(self))
+
+        game.run_game_loop(close_when_finished=close_when_finished)
+
+        if verify:
+            if game.current_frame + 1 != self.num_ticks:
+                raise RuntimeError(f"Re-simulation diverged: game lasted {game.current_frame + 1} ticks instead "
+                                   f"of {self.num_ticks}")
+            winner = None if game.winner is None else game.winner.idx
+            if winner != self.header['winner']:
+                raise RuntimeError(f"Re-simulation diverged: winner is {winner} instead of {self.header['winner']}")
+
+        return game
+
+
+class _KeyframeVerifier:
+    """ Tick observer that compares the state of a re-simulated game with the keyframes of a replay"""
+    def __init__(self, replay:Replay):
+        self.replay = replay
+        self._kf_index = {int(t): k for k, t in enumerate(replay.keyframe_ticks)}
+
+    def on_tick(self, game):
+        k = self._kf_index.get(game.current_frame)
+        if k is None:
+            return
+        players = sorted(game.players, key=lambda p: self.replay.player_indices.index(p.idx))
+        state = capture_keyframe(game, players)
+        if not np.array_equal(state, self.replay.keyframes[k]):
+            raise RuntimeError(f"Re-simulation diverged from recorded keyframe at tick {game.current_frame}")
+
+
+class ReplayRecorder:
+    """ Tick observer that records the actions of all players of a game """
+
+    def __init__(self, game, keyframe_interval=None, record_debug_trails=False):
+        if game.current_frame >= 0:
+            raise RuntimeError("Replay recording has to start before the first tick of the game")
+
+        self.game = game
+        self.keyframe_interval = keyframe_interval
+        self.record_debug_trails = record_debug_trails
+        self.players = None
+        self._last_angles = None
+        self._action_rows = []
+        self._keyframe_ticks = []
+        self._keyframes = []
+        self._debug_trail_index = []
+        self._debug_trail_points = []
+        self._num_debug_points = 0
+
+    def _start(self, game):
+        self.players = list(game.players)
+        self._last_angles = np.array([p.angle_history[0] for p in self.players])
+
+    def on_tick(self, game):
+        if self.players is None:
+            self._start(game)
+
+        tick = game.current_frame
+        actions, self._last_angles = infer_actions(self.players, self._last_angles)
+        codes = (actions + 1).astype(np.uint8)
+        for k, p in enumerate(self.players):
+            if p.death_tick is not None and p.death_tick < tick:
+                codes[k] = INACTIVE_CODE
+        self._action_rows.append(codes)
+
+        if self.keyframe_interval is not None and tick % self.keyframe_interval == 0:
+            self._keyframe_ticks.append(tick)
+            self._keyframes.append(capture_keyframe(game, self.players))
+
+        if self.record_debug_trails:
+            self._record_debug_trails(game)
+
+    def _record_debug_trails(self, game):
+        # Planned trails of NStepPlanPlayers, recorded in the ticks in which they update their plan
+        for p in game.active_players:
+            if not getattr(p, 'in_planning_tick', False):
+                continue
+            for trail in p.best_trails:
+                coords = np.asarray(trail.coords, dtype=np.float32)
+                self._debug_trail_index.append((game.current_frame, p.idx, self._num_debug_points,
+                                                self._num_debug_points + coords.shape[0]))
+                self._debug_trail_points.append(coords)
+                self._num_debug_points += coords.shape[0]
+
+    def to_replay(self):
+        game = self.game
+        players = self.players if self.players is not None else list(game.players)
+
+        header = dict(game_settings=dict(game.game_settings), rng_seed=game._rng_seed,
+                      keyframe_interval=self.keyframe_interval,
+                      winner=None if game.winner is None else game.winner.idx,
+                      scoreboard={str(p.idx): game.scoreboard[p.idx] for p in players},
+                      players=[dict(idx=p.idx, name=p.name, type=type(p).__name__,
+                                    init_pos=[float(c) for c in p.init_pos], init_angle=float(p.angle_history[0]),
+                                    hole_settings=p.hole_settings(), death_tick=p.death_tick,
+                                    reason_of_death=None if p.reason_of_death is None else
+                                    ReasonOfDeath(p.reason_of_death).name)
+                               for p in players])
+        header['game_settings'].pop('rng_seed', None)
+
+        if len(self._action_rows) > 0:
+            action_codes = np.stack(self._action_rows)
+        else:
+            action_codes = np.zeros((0, len(players)), dtype=np.uint8)
+
+        keyframes = np.stack(self._keyframes) if len(self._keyframes) > 0 else None
+        dbg_index = np.asarray(self._debug_trail_index, dtype=np.int32).reshape(-1, 4)
+        dbg_points = np.concatenate(self._debug_trail_points) if len(self._debug_trail_points) > 0 else None
+        return Replay(header, action_codes, np.asarray(self._keyframe_ticks, dtype=np.int32), keyframes,
+                      dbg_index, dbg_points)
+
+    def save(self, fp:str):
+        """ Save the recorded replay to file `fp`. Returns the file size in bytes"""
+        return self.to_replay().save(fp)
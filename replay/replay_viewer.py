@@ -0,0 +1,269 @@
+import logging
+import time
+
+import numpy as np
+import pygame
+
+from replay.replay_format import Replay, KEYFRAME_FIELDS, capture_keyframe
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayViewer:
+    """ Seekable viewer for recorded games.
+
+    When a replay is loaded, it is fast-forwarded once from start to end. This builds the trails of all players and
+    a keyframe of the per-player state every `keyframe_interval` ticks. Seeking to a tick restores the nearest
+    keyframe before it and fast-forwards the remaining ticks headless.
+
+    Fast-forwarding does not run the collision checks of the engine: the players move according to their recorded
+    actions and are disabled in their recorded death ticks. Keyframes stored in the replay file are used to
+    validate this.
+
+    Controls:
+        SPACE               play / pause
+        LEFT / RIGHT        step one tick backwards / forwards
+        DOWN / UP           jump one keyframe interval backwards / forwards
+        HOME / END          jump to start / end
+        + / -               increase / decrease playback speed
+        R                   toggle playback direction
+        D                   toggle planned trails of NStepPlanPlayers (if they were recorded)
+        mouse on timeline   scrub
+        ESC                 close viewer
+    """
+
+    timeline_height = 14
+
+    def __init__(self, replay, keyframe_interval=100, mode="gui"):
+        """
+
+        Args:
+            replay (Replay or str): replay or path to a replay file
+            keyframe_interval (int): number of ticks between two keyframes
+            mode (str): game mode used for the viewer, use 'headless' to seek without a window
+        """
+        if isinstance(replay, str):
+            replay = Replay.load(replay)
+        self.replay = replay
+        self.keyframe_interval = keyframe_interval
+        self.game = replay.create_game(mode=mode)
+        self.game.running = False
+
+        self._deaths = {idx: replay.death(idx) for idx in replay.player_indices}
+        self._player_order = {p.idx: k for k, p in enumerate(self.game.players)}
+
+        self.playing = False
+        self.playback_speed = 1.0
+        self.playback_direction = 1
+        self.show_debug_trails = True
+        self._scrubbing = False
+
+        t0 = time.perf_counter()
+        self._build_keyframes()
+        logger.info(f"Loaded {replay} and built {len(self._keyframe_ticks)} keyframes in "
+                    f"{time.perf_counter() - t0:.3f} seconds")
+
+    @property
+    def tick(self):
+        """ Current tick (-1 before the first tick)"""
+        return self.game.current_frame
+
+    @property
+    def last_tick(self):
+        return self.replay.num_ticks - 1
+
+    # Simulation ------------------------------
+    def _build_keyframes(self):
+        """ Fast-forward the whole replay once, keeping all trails and a keyframe every `keyframe_interval` ticks"""
+        game = self.game
+        file_keyframes = {int(t): k for k, t in enumerate(self.replay.keyframe_ticks)}
+
+        self._keyframe_ticks = [game.current_frame]
+        self._keyframes = [capture_keyframe(game, game.players)]
+        while game.current_frame < self.last_tick:
+            self._step()
+            tick = game.current_frame
+            if tick % self.keyframe_interval == 0 or tick in file_keyframes:
+                kf = capture_keyframe(game, game.players)
+                if tick in file_keyframes and not np.array_equal(kf, self.replay.keyframes[file_keyframes[tick]]):
+                    logger.warning(f"Fast-forwarded state deviates from keyframe in replay file at tick {tick}")
+                self._keyframe_ticks.append(tick)
+                self._keyframes.append(kf)
+
+        # the trails at the end of the replay contain the trails for any earlier tick as prefixes
+        self._full_trails = {p.idx: p.trail for p in game.players}
+        self._keyframe_ticks = np.asarray(self._keyframe_ticks)
+        self._restore_keyframe(0)
+
+    def _step(self):
+        """ Advance the game by one tick, based on the recorded actions and deaths (no collision checks)"""
+        game = self.game
+        game.current_frame += 1
+        for p in list(game.active_players):
+            p.apply_steering(None)
+            p.move()
+            death_tick, reason = self._deaths[p.idx]
+            if death_tick == game.current_frame:
+                game.disable_player(p, reason)
+
+        if len(game.active_players) == 1:
+            game.winner = game.active_players[0]
+
+    def _restore_keyframe(self, k):
+        game = self.game
+        kf = self._keyframes[k]
+        game.current_frame = int(self._keyframe_ticks[k])
+        game.active_players = []
+        for n, p in enumerate(game.players):
+            state = dict(zip(KEYFRAME_FIELDS, kf[n]))
+            p.pos = np.array([state['x'], state['y']])
+            p.angle = state['angle']
+            p.dist_travelled = state['dist_travelled']
+            p.total_reward = state['total_reward']
+            p.dist_to_next_hole = state['dist_to_next_hole']
+            trail_length = int(state['trail_length'])
+            full_trail = self._full_trails[p.idx]
+            # A copy of the trail in the format of the game (slices of the other formats are plain arrays)
+            p.trail = full_trail[:trail_length] if isinstance(full_trail, list) else full_trail.truncated(trail_length)
+            p.action_idx = trail_length - 1
+            # Restore the state of the hole generator by skipping the draws that were already made
+            p.num_hole_rolls = int(state['num_hole_rolls'])
+            p.rng = np.random.default_rng([game._rng_seed, p.idx])
+            p.rng.bit_generator.advance(p.num_hole_rolls)
+            game.scoreboard[p.idx] = int(state['score'])
+            if state['alive']:
+                game.active_players.append(p)
+                p.death_tick, p.reason_of_death = None, None
+            else:
+                p.death_tick, p.reason_of_death = self._deaths[p.idx]
+
+        if len(game.active_players) == 1:
+            game.winner = game.active_players[0]
+        elif len(game.active_players) == 0 and self.replay.header['winner'] is not None:
+            game.winner = game.players[self._player_order[self.replay.header['winner']]]
+        else:
+            game.winner = None
+
+    def seek(self, tick):
+        """ Move the game to the state after `tick` (-1: start positions). Returns the time it took in seconds"""
+        t0 = time.perf_counter()
+        tick = int(np.clip(tick, -1, self.last_tick))
+        if tick < self.tick or tick - self.tick > self.keyframe_interval:
+            k = np.searchsorted(self._keyframe_ticks, tick, side='right') - 1
+            self._restore_keyframe(k)
+
+        while self.tick < tick:
+            self._step()
+
+        return time.perf_counter() - t0
+
+    # Rendering ------------------------------
+    def render(self):
+        """ Draw the state of the current tick to the screen"""
+        game = self.game
+        surface = game.trail_surface
+        surface.fill(game.bg_color)
+        for p in game.players:
+            trail = np.asarray(p.trail)
+            trail = trail[~np.isnan(trail[:, 0])] - p.radius
+            surface.blits([(p.surf, xy) for xy in trail.tolist()], doreturn=False)
+
+        screen = game.screen
+        screen.blit(surface, (0, 0))
+        game._prev_head_positions = {}
+        game.draw_heads(screen)
+
+        if self.show_debug_trails:
+            for idx, trails in self.replay.debug_trails_at(self.tick).items():
+                p = game.players[self._player_order[idx]]
+                if p not in game.active_players:
+                    continue
+                for trail in trails:
+                    if trail.shape[0] >= 2:
+                        pygame.draw.aalines(screen, pygame.Color('dodgerblue'), False, trail.tolist())
+
+        self._draw_timeline(screen)
+        pygame.display.flip()
+
+    def _draw_timeline(self, screen):
+        game = self.game
+        w, h = game.screen_width, game.screen_height
+        bar = pygame.Rect(0, h - self.timeline_height, w, self.timeline_height)
+        pygame.draw.rect(screen, pygame.Color(60, 60, 60), bar)
+        progress = (self.tick + 1) / max(self.replay.num_ticks, 1)
+        pygame.draw.rect(screen, pygame.Color('gray70'), pygame.Rect(0, bar.top, int(progress * w), bar.height))
+        for t in self._keyframe_ticks:
+            x = int((t + 1) / max(self.replay.num_ticks, 1) * w)
+            pygame.draw.line(screen, pygame.Color('gray40'), (x, bar.top), (x, bar.top + 3))
+
+        state = "playing" if self.playing else "paused"
+        text = f"tick {self.tick:6d} / {self.last_tick}  |  {state}  x{self.playback_direction * self.playback_speed:g}"
+        game.font.render_to(screen, (8, 8), text=text, fgcolor=pygame.Color('white'), size=14)
+
+    # Interaction ------------------------------
+    def _timeline_tick(self, x):
+        return int(round(x / self.game.screen_width * self.replay.num_ticks)) - 1
+
+    def _handle_event(self, event):
+        if event.type == pygame.QUIT:
+            return False
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+                return False
+            elif event.key == pygame.K_SPACE:
+                self.playing = not self.playing
+            elif event.key == pygame.K_RIGHT:
+                self.seek(self.tick + 1)
+            elif event.key == pygame.K_LEFT:
+                self.seek(self.tick - 1)
+            elif event.key == pygame.K_UP:
+                self.seek(self.tick + self.keyframe_interval)
+            elif event.key == pygame.K_DOWN:
+                self.seek(self.tick - self.keyframe_interval)
+            elif event.key == pygame.K_HOME:
+                self.seek(-1)
+            elif event.key == pygame.K_END:
+                self.seek(self.last_tick)
+            elif event.key in (pygame.K_PLUS, pygame.K_KP_PLUS):
+                self.playback_speed *= 2.
+            elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                self.playback_speed /= 2.
+            elif event.key == pygame.K_r:
+                self.playback_direction *= -1
+            elif event.key == pygame.K_d:
+                self.show_debug_trails = not self.show_debug_trails
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.pos[1] >= self.game.screen_height - self.timeline_height:
+            self._scrubbing = True
+            self.seek(self._timeline_tick(event.pos[0]))
+        elif event.type == pygame.MOUSEMOTION and self._scrubbing:
+            self.seek(self._timeline_tick(event.pos[0]))
+        elif event.type == pygame.MOUSEBUTTONUP:
+            self._scrubbing = False
+        return True
+
+    def run(self):
+        """ Show the replay until the window is closed"""
+        accumulator = 0.0
+        t_last = time.perf_counter()
+        viewing = True
+        while viewing:
+            for event in pygame.event.get():
+                viewing = self._handle_event(event) and viewing
+
+            t_now = time.perf_counter()
+            if self.playing:
+                accumulator += (t_now - t_last) * self.playback_speed * self.game.tick_rate
+                num_ticks = int(accumulator)
+                accumulator -= num_ticks
+                if num_ticks > 0:
+                    self.seek(self.tick + self.playback_direction * num_ticks)
+                if self.tick in (-1, self.last_tick):
+                    self.playing = False
+            else:
+                accumulator = 0.0
+            t_last = t_now
+
+            self.render()
+            self.game.clock.tick(self.game.target_fps)
+
+        self.game.quit()
@@ -0,0 +1,3 @@
+from storage.episode_archive import EpisodeArchive, EpisodeArchiveWriter, EpisodeRecorder
+from storage.results_store import ResultsStore, ResultsWriter, config_hash
+from storage.result_cache import ResultCache
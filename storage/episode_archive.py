@@ -0,0 +1,219 @@
+"""Chunked, append-only on-disk archive of (state, action, reward) trajectories
+
+Layout of an archive directory:
+
+    <root>/
+        shard-<host>-<pid>-<id>/     one shard per writer, so that parallel workers never share files
+            meta.json                column dtypes and shapes
+            <column>.bin             raw little endian column data, one row per player and tick
+            episodes.bin             episode index (structured array, see EPISODE_DTYPE)
+
+Rows are appended first, the episode index entry last. Rows that are not covered by the index (e.g. after a crash)
+are ignored by readers. All column files can be read with np.memmap without loading them.
+"""
+import json
+import logging
+import os
+import socket
+import uuid
+
+import numpy as np
+
+from replay.replay_format import infer_actions
+
+logger = logging.getLogger(__name__)
+
+# name -> (dtype, per-row shape)
+COLUMNS = {
+    'tick': ('<i4', ()),
+    'player': ('u1', ()),
+    'position': ('<f4', (2,)),
+    'angle': ('<f4', ()),
+    'action': ('i1', ()),
+    'alive': ('u1', ()),
+    'reward': ('<f4', ()),
+}
+
+EPISODE_DTYPE = np.dtype([('start', '<i8'), ('num_rows', '<i8'), ('num_ticks', '<i4'), ('num_players', 'u1'),
+                          ('winner', 'i1'), ('seed', '<i8')])
+
+
+class EpisodeArchiveWriter:
+    """ Appends episodes to its own shard of an episode archive. Use one writer per process."""
+
+    def __init__(self, root_dir, chunk_size=8192):
+        """
+
+        Args:
+            root_dir (str): archive directory (created if it does not exist)
+            chunk_size (int): number of rows that are buffered in memory before they are appended to the column files
+        """
+        self.shard_dir = os.path.join(root_dir, f"shard-{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(self.shard_dir)
+        with open(os.path.join(self.shard_dir, "meta.json"), "w") as f:
+            json.dump({name: {'dtype': dt, 'shape': list(shape)} for name, (dt, shape) in COLUMNS.items()}, f)
+
+        self.chunk_size = chunk_size
+        self._chunks = {name: [] for name in COLUMNS}
+        self._num_buffered = 0
+        self._num_rows_written = 0
+        self._episode_start = 0
+
+    def append_rows(self, **columns):
+        """ Append rows to the current episode. All columns of COLUMNS have to be given (equal number of rows)"""
+        num_rows = None
+        for name, (dtype, shape) in COLUMNS.items():
+            values = np.asarray(columns[name], dtype=dtype).reshape((-1,) + shape)
+            if num_rows is not None and values.shape[0] != num_rows:
+                raise ValueError(f"Column '{name}' has {values.shape[0]} rows, expected {num_rows}")
+            num_rows = values.shape[0]
+            self._chunks[name].append(values)
+
+        self._num_buffered += num_rows
+        if self._num_buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """ Append buffered rows to the column files"""
+        if self._num_buffered == 0:
+            return
+        for name, chunks in self._chunks.items():
+            with open(os.path.join(self.shard_dir, f"{name}.bin"), "ab") as f:
+                f.write(np.concatenate(chunks).tobytes())
+            chunks.clear()
+        self._num_rows_written += self._num_buffered
+        self._num_buffered = 0
+
+    def end_episode(self, num_ticks, num_players, winner=None, seed=-1):
+        """ Commit all rows appended since the last call as one episode"""
+        self.flush()
+        entry = np.array([(self._episode_start, self._num_rows_written - self._episode_start, num_ticks, num_players,
+                           -1 if winner is None else winner, -1 if seed is None else seed)], dtype=EPISODE_DTYPE)
+        with open(os.path.join(self.shard_dir, "episodes.bin"), "ab") as f:
+            f.write(entry.tobytes())
+        self._episode_start = self._num_rows_written
+
+
+class EpisodeRecorder:
+    """ Tick observer that writes one row per active player and tick of a game to an EpisodeArchiveWriter.
+
+    Usage:
+        recorder = game.add_tick_observer(EpisodeRecorder(writer))
+        game.run_game_loop()
+        recorder.end_episode(game)
+    """
+
+    def __init__(self, writer:EpisodeArchiveWriter):
+        self.writer = writer
+        self._players = None
+        self._last_angles = None
+        self._last_rewards = None
+
+    def on_tick(self, game):
+        if self._players is None:
+            self._players = list(game.players)
+            self._last_angles = np.array([p.angle_history[0] for p in self._players])
+            self._last_rewards = np.zeros(len(self._players))
+
+        actions, self._last_angles = infer_actions(self._players, self._last_angles)
+        rewards = np.array([p.total_reward for p in self._players])
+        # players that were active in this tick (including the ones that died in it)
+        rows = [k for k, p in enumerate(self._players) if p.death_tick is None or p.death_tick == game.current_frame]
+
+        self.writer.append_rows(tick=np.full(len(rows), game.current_frame),
+                                player=[self._players[k].idx for k in rows],
+                                position=[self._players[k].pos for k in rows],
+                                angle=[self._players[k].angle for k in rows],
+                                action=actions[rows],
+                                alive=[self._players[k] in game.active_players for k in rows],
+                                reward=(rewards - self._last_rewards)[rows])
+        self._last_rewards = rewards
+
+    def end_episode(self, game):
+        self.writer.end_episode(num_ticks=game.current_frame + 1, num_players=len(game.players),
+                                winner=None if game.winner is None else game.winner.idx, seed=game._rng_seed)
+        self._players = None
+
+
+class EpisodeArchive:
+    """ Read-only view of all shards of an episode archive. Column data is memory-mapped, never loaded as a whole."""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.refresh()
+
+    def refresh(self):
+        """ (Re-)scan the archive, picks up shards and episodes that were committed since the last scan"""
+        self.shards = []
+        episodes = []
+        for shard_name in sorted(os.listdir(self.root_dir)):
+            shard_dir = os.path.join(self.root_dir, shard_name)
+            index_fp = os.path.join(shard_dir, "episodes.bin")
+            if not os.path.isfile(index_fp):
+                continue
+            index = np.fromfile(index_fp, dtype=EPISODE_DTYPE)
+            if index.size == 0:
+                continue
+            num_rows = int(index['start'][-1] + index['num_rows'][-1])
+            with open(os.path.join(shard_dir, "meta.json")) as f:
+                meta = json.load(f)
+            columns = {name: np.memmap(os.path.join(shard_dir, f"{name}.bin"), dtype=m['dtype'], mode='r',
+                                       shape=(num_rows,) + tuple(m['shape']))
+                       for name, m in meta.items()}
+            shard_idx = len(self.shards)
+            self.shards.append(columns)
+            episodes.append((np.full(index.size, shard_idx), index))
+
+        if len(episodes) > 0:
+            self._episode_shard = np.concatenate([e[0] for e in episodes])
+            self.episodes = np.concatenate([e[1] for e in episodes])
+        else:
+            self._episode_shard = np.zeros(0, dtype=int)
+            self.episodes = np.zeros(0, dtype=EPISODE_DTYPE)
+
+        self._shard_sizes = np.array([s['tick'].shape[0] for s in self.shards], dtype=np.int64)
+        self._shard_offsets = np.concatenate([[0], np.cumsum(self._shard_sizes)])
+
+    @property
+    def num_episodes(self):
+        return self.episodes.size
+
+    @property
+    def num_rows(self):
+        return int(self._shard_offsets[-1])
+
+    def episode(self, k, columns=None):
+        """ Columns of episode `k` as dict of memory-mapped views"""
+        shard = self.shards[self._episode_shard[k]]
+        start, num_rows = int(self.episodes['start'][k]), int(self.episodes['num_rows'][k])
+        columns = COLUMNS.keys() if columns is None else columns
+        return {name: shard[name][start:start + num_rows] for name in columns}
+
+    def get_rows(self, row_indices, columns=None):
+        """ Gather rows by global row index (over all shards). Only the pages containing these rows are read."""
+        row_indices = np.asarray(row_indices)
+        columns = list(COLUMNS.keys()) if columns is None else columns
+        shard_ids = np.searchsorted(self._shard_offsets, row_indices, side='right') - 1
+        batch = {name: np.empty((row_indices.size,) + COLUMNS[name][1], dtype=COLUMNS[name][0]) for name in columns}
+        for s in np.unique(shard_ids):
+            in_shard = shard_ids == s
+            local = row_indices[in_shard] - self._shard_offsets[s]
+            for name in columns:
+                batch[name][in_shard] = self.shards[s][name][local]
+        return batch
+
+    def sample_minibatch(self, batch_size, rng=None, columns=None):
+        """ Uniformly sample `batch_size` rows from the archive"""
+        if self.num_rows == 0:
+            raise RuntimeError(f"Episode archive '{self.root_dir}' is empty")
+        rng = np.random.default_rng() if rng is None else rng
+        # sorted indices read the memory maps front to back
+        return self.get_rows(np.sort(rng.integers(0, self.num_rows, size=batch_size)), columns=columns)
+
+    def iter_minibatches(self, batch_size, num_batches=None, rng=None, columns=None):
+        """ Generator that streams random minibatches directly from disk"""
+        rng = np.random.default_rng() if rng is None else rng
+        n = 0
+        while num_batches is None or n < num_batches:
+            yield self.sample_minibatch(batch_size, rng=rng, columns=columns)
+            n += 1
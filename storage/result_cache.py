@@ -0,0 +1,147 @@
+"""Content-addressed cache of finished-game result records
+
+A seeded game is fully determined by its settings, the players and the code of the engine. The cache key is a hash of
+the game settings (including the seed), agent types and kwargs of all players and a code version tag, so a cached
+record can be used instead of playing the game again. Jobs with settings that can't be hashed reliably (anything but
+JSON types, classes and numpy arrays) are not cached.
+
+Entries are kept in a SQLite database, which can be shared by several processes. When the cache holds more than
+`max_entries` records, the least recently used ones are evicted.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Source files that determine the outcome of a game: the engine, the players and the modules they import
+_GAME_SOURCES = ["game.py", "players/**/*.py", "observations/**/*.py", "debugging_helpers.py",
+                 "evaluation/tournament.py"]
+
+_code_version = None
+
+
+def code_version():
+    """ Hash of the source code of engine, players and observations. Changes whenever one of these files is edited."""
+    global _code_version
+    if _code_version is None:
+        h = hashlib.sha1()
+        for pattern in _GAME_SOURCES:
+            for fp in sorted(glob.glob(os.path.join(_PACKAGE_ROOT, pattern), recursive=True)):
+                h.update(os.path.relpath(fp, _PACKAGE_ROOT).encode())
+                with open(fp, 'rb') as f:
+                    h.update(f.read())
+        _code_version = h.hexdigest()[:16]
+    return _code_version
+
+
+def _to_key_jsonable(obj):
+    """ JSON representation of the settings that aren't JSON types. Unlike a repr, it identifies the value exactly."""
+    if isinstance(obj, type):
+        return f"{obj.__module__}.{obj.__qualname__}"
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray) and obj.dtype != object:
+        return dict(dtype=obj.dtype.str, shape=obj.shape,
+                    sha1=hashlib.sha1(np.ascontiguousarray(obj).tobytes()).hexdigest())
+    raise TypeError(f"Object of type {type(obj).__name__} can't be part of a cache key")
+
+
+def job_key(job:dict, version=None):
+    """ Cache key of a job or None, if the job has no fixed seed (and is therefore not reproducible) or settings that
+    can't be hashed reliably (e.g. policy objects, whose repr may be abbreviated or contain a memory address)"""
+    if job['game_settings'].get('rng_seed') is None:
+        return None
+    content = dict(game_settings=job['game_settings'], agent_ut_info=job['agent_ut_info'],
+                   opponent_settings=job['opponent_settings'], version=code_version() if version is None else version)
+    try:
+        content = json.dumps(content, sort_keys=True, default=_to_key_jsonable)
+    except (TypeError, ValueError) as e:
+        logger.debug(f"Job {job.get('job_id')} is not cached: {e}")
+        return None
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+class ResultCache:
+    """ LRU cache of result records (see evaluation.tournament.summarize_game), keyed by job_key()"""
+
+    def __init__(self, path, max_entries=1_000_000, version=None):
+        """
+
+        Args:
+            path (str): SQLite database file (created if it does not exist)
+            max_entries (int): size limit, least recently used entries are evicted beyond it
+            version (str): code version tag, defaults to code_version(). Entries of other versions are never hit.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.version = code_version() if version is None else version
+        self.num_hits = 0
+        self.num_misses = 0
+
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=60.)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS results "
+                         "(key TEXT PRIMARY KEY, record TEXT NOT NULL, last_used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._db.commit()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def key(self, job):
+        return job_key(job, self.version)
+
+    def get(self, job):
+        """ Cached result record of `job` (with the job_id of `job`) or None"""
+        key = self.key(job)
+        row = None if key is None else self._db.execute("SELECT record FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.num_misses += 1
+            return None
+
+        self.num_hits += 1
+        with self._db:
+            self._db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        record = json.loads(row[0])
+        record['job_id'] = job.get('job_id')
+        record['cached'] = True
+        return record
+
+    def put(self, job, record):
+        """ Store the result record of `job`. Records of failed or unseeded jobs are ignored."""
+        key = self.key(job)
+        if key is None or 'error' in record:
+            return
+        record = {k: v for k, v in record.items() if k not in ('job_id', 'cached', 'worker_pid')}
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, json.dumps(record), time.time()))
+            num_evict = len(self) - self.max_entries
+            if num_evict > 0:
+                self._db.execute("DELETE FROM results WHERE key IN "
+                                 "(SELECT key FROM results ORDER BY last_used LIMIT ?)", (num_evict,))
+                logger.debug(f"Evicted {num_evict} entries from result cache {self.path}")
+
+    @property
+    def hit_rate(self):
+        n = self.num_hits + self.num_misses
+        return self.num_hits / n if n > 0 else float('nan')
@@ -0,0 +1,234 @@
+"""Append-only columnar store for evaluation results
+
+One row per (game, player). Rows are buffered by a ResultsWriter and written as compressed .npz batches:
+
+    <root>/
+        batch-<host>-<pid>-<id>-<n>.npz     one array per column, written to a temporary file and then renamed
+
+Each writer only creates its own batch files, so any number of processes can append at the same time, and readers
+never see partially written batches. Since the columns of a batch are stored as separate arrays, readers only
+decompress the columns they need.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import socket
+import uuid
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# name -> dtype (string columns are stored as fixed-width unicode)
+RESULT_COLUMNS = {
+    'game_id': '<i8',
+    'config_hash': 'U',
+    'seed': '<i8',
+    'num_ticks': '<i4',
+    'winner': 'i1',
+    'player': 'u1',
+    'is_agent_ut': '?',
+    'agent_type': 'U',
+    'agent_kwargs': 'U',
+    'score': '<i4',
+    'total_reward': '<f4',
+    'dist_travelled': '<f4',
+    'ticks_survived': '<i4',
+    'reason_of_death': 'U',
+}
+
+
+def _to_jsonable(obj):
+    if isinstance(obj, type):
+        return obj.__name__
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return repr(obj)
+
+
+def settings_to_json(settings):
+    """ Canonical JSON representation of (nested) settings. Player classes are replaced by their names."""
+    return json.dumps(settings, sort_keys=True, default=_to_jsonable)
+
+
+def config_hash(game_settings:dict, agent_ut_info:dict, opponent_settings:list):
+    """ Short hash of a game configuration. The seed is not part of the configuration."""
+    game_settings = {k: v for k, v in game_settings.items() if k != 'rng_seed'}
+    config = dict(game_settings=game_settings, agent_ut_info=agent_ut_info, opponent_settings=opponent_settings)
+    return hashlib.sha1(settings_to_json(config).encode()).hexdigest()[:16]
+
+
+class ResultsWriter:
+    """ Buffers result rows and appends them to a results store in compressed batches. Use one writer per process."""
+
+    def __init__(self, root_dir, batch_size=50000):
+        """
+
+        Args:
+            root_dir (str): store directory (created if it does not exist)
+            batch_size (int): number of rows per batch file
+        """
+        os.makedirs(root_dir, exist_ok=True)
+        self.root_dir = root_dir
+        self.batch_size = batch_size
+        self._writer_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        # game ids are unique per store: random 32-bit writer prefix + running game counter
+        self._game_id_base = int(uuid.uuid4().int & 0x7fffffff) << 32
+        self._num_games = 0
+        self._num_batches = 0
+        self._rows = {name: [] for name in RESULT_COLUMNS}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def num_buffered(self):
+        return len(self._rows['game_id'])
+
+    def append(self, result:dict, job:dict):
+        """ Append the rows of a finished game.
+
+        Args:
+            result (dict): result record of the game (see evaluation.tournament.summarize_game)
+            job (dict): job the game was played for, provides the agent types and kwargs of the players
+
+        Returns:
+            number of rows appended (0 for error records of failed jobs)
+        """
+        if 'error' in result:
+            return 0
+
+        agents = {1: job['agent_ut_info']}
+        agents.update({k + 2: info for k, info in enumerate(job['opponent_settings'])})
+        cfg_hash = config_hash(job['game_settings'], job['agent_ut_info'], job['opponent_settings'])
+        game_id = self._game_id_base + self._num_games
+        self._num_games += 1
+
+        for p in result['players']:
+            agent = agents[p['idx']]
+            row = dict(game_id=game_id, config_hash=cfg_hash, seed=-1 if result['seed'] is None else result['seed'],
+                       num_ticks=result['num_ticks'], winner=-1 if result['winner'] is None else result['winner'],
+                       player=p['idx'], is_agent_ut=p['idx'] == 1, agent_type=agent['type'].__name__,
+                       agent_kwargs=settings_to_json(agent['kwargs']), score=p['score'],
+                       total_reward=p['total_reward'], dist_travelled=p['dist_travelled'],
+                       ticks_survived=p['ticks_survived'], reason_of_death=p['reason_of_death'] or "")
+            for name, value in row.items():
+                self._rows[name].append(value)
+
+        if self.num_buffered >= self.batch_size:
+            self.flush()
+        return len(result['players'])
+
+    def flush(self):
+        """ Write the buffered rows as a new batch file"""
+        if self.num_buffered == 0:
+            return
+        columns = {name: np.asarray(values) if dtype == 'U' else np.asarray(values, dtype=dtype)
+                   for (name, dtype), values in zip(RESULT_COLUMNS.items(), self._rows.values())}
+        fp = os.path.join(self.root_dir, f"batch-{self._writer_id}-{self._num_batches:06d}.npz")
+        tmp_fp = fp + ".tmp"
+        with open(tmp_fp, "wb") as f:
+            np.savez_compressed(f, **columns)
+        os.replace(tmp_fp, fp)
+        logger.debug(f"Wrote {self.num_buffered} result rows to {fp}")
+
+        self._num_batches += 1
+        self._rows = {name: [] for name in RESULT_COLUMNS}
+
+    def close(self):
+        self.flush()
+
+
+class ResultsStore:
+    """ Read-only view of a results store. Batches are read one at a time, only the requested columns."""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.refresh()
+
+    def refresh(self):
+        """ (Re-)scan the store for batch files"""
+        self.batch_files = sorted(glob.glob(os.path.join(self.root_dir, "batch-*.npz")))
+
+    @property
+    def num_batches(self):
+        return len(self.batch_files)
+
+    def iter_batches(self, columns=None, query=None):
+        """ Generator that yields one DataFrame per batch file.
+
+        Args:
+            columns (list): columns to read, defaults to all columns
+            query (str): optional filter expression for DataFrame.query(), e.g. "agent_type == 'NStepPlanPlayer'"
+        """
+        columns = list(RESULT_COLUMNS) if columns is None else list(columns)
+        # columns that are only needed to evaluate the query
+        query_columns = [] if query is None else [c for c in RESULT_COLUMNS
+                                                  if c not in columns and re.search(rf"\b{c}\b", query)]
+        for fp in self.batch_files:
+            with np.load(fp) as batch:
+                df = pd.DataFrame({name: batch[name] for name in columns + query_columns})
+            if query is not None:
+                df = df.query(query)[columns]
+            yield df
+
+    def load(self, columns=None, query=None):
+        """ Rows of all batches (filtered by `query`) as one DataFrame"""
+        batches = list(self.iter_batches(columns=columns, query=query))
+        if len(batches) == 0:
+            return pd.DataFrame(columns=RESULT_COLUMNS.keys() if columns is None else columns)
+        return pd.concat(batches, ignore_index=True)
+
+    def _aggregate(self, by, value_columns, query):
+        """ Per-batch partial sums (count, sum, sum of squares) that are combined over all batches"""
+        by = [by] if isinstance(by, str) else list(by)
+        partials = []
+        for df in self.iter_batches(columns=by + list(value_columns), query=query):
+            values = df[list(value_columns)].astype(np.float64)
+            sums = values.groupby([df[c] for c in by]).agg(['count', 'sum'])
+            squares = (values ** 2).groupby([df[c] for c in by]).sum()
+            squares.columns = pd.MultiIndex.from_product([squares.columns, ['sum_sq']])
+            partials.append(pd.concat([sums, squares], axis=1))
+        if len(partials) == 0:
+            return None
+        return pd.concat(partials).groupby(level=list(range(len(by)))).sum()
+
+    def win_rates(self, by=('config_hash', 'agent_type'), query="is_agent_ut"):
+        """ Number of games, wins and win rate per group (by default of the agents under test)"""
+        by = [by] if isinstance(by, str) else list(by)
+        partials = []
+        for df in self.iter_batches(columns=by + ['winner', 'player'], query=query):
+            won = (df['winner'] == df['player']).astype(np.float64)
+            partials.append(won.groupby([df[c] for c in by]).agg(['count', 'sum']))
+        if len(partials) == 0:
+            return pd.DataFrame(columns=['games', 'wins', 'win_rate'])
+
+        totals = pd.concat(partials).groupby(level=list(range(len(by)))).sum()
+        totals.columns = ['games', 'wins']
+        totals['win_rate'] = totals['wins'] / totals['games']
+        return totals
+
+    def reward_summary(self, by=('config_hash', 'agent_type'), columns=('total_reward', 'score', 'ticks_survived'),
+                       query=None):
+        """ Count, mean and standard deviation of `columns` per group"""
+        columns = list(columns)
+        totals = self._aggregate(by, columns, query)
+        if totals is None:
+            return pd.DataFrame()
+
+        summary = {}
+        for c in columns:
+            n, s, sq = totals[(c, 'count')], totals[(c, 'sum')], totals[(c, 'sum_sq')]
+            mean = s / n
+            summary[f'{c}_mean'] = mean
+            summary[f'{c}_std'] = np.sqrt(np.maximum(sq / n - mean ** 2, 0.) * n / np.maximum(n - 1, 1))
+        summary = pd.DataFrame(summary)
+        summary.insert(0, 'count', totals[(columns[0], 'count')].astype(np.int64))
+        return summary
@@ -0,0 +1,45 @@
+import os
+import log
+
+from game import AchtungDieKurveGame
+from players.aiplayers import RandomSteeringAIPlayer, NStepPlanPlayer
+from replay import Replay
+
+log.setup_colored_logs('info', do_basic_setup=True)
+
+game = AchtungDieKurveGame(mode="headless", target_fps=30, rng_seed=1234)
+
+game.spawn_player(1, player_type=NStepPlanPlayer, num_steps=2, dist_per_step=40.0, plan_update_period=0.15)
+for k in range(2,7):
+    game.spawn_player(k, player_type=RandomSteeringAIPlayer)
+
+game.record_replay(keyframe_interval=100)
+game.run_game_loop(close_when_finished=True)
+game.print_scoreboard()
+
+replay_fp = "replay_test.adkr"
+num_bytes = game.save_replay(replay_fp)
+print(f"Replay of {game.current_frame + 1} ticks saved to '{replay_fp}' ({num_bytes} bytes)")
+
+# Re-simulate the recorded game with the gui (raises RuntimeError if it diverges from the recording)
+replay = Replay.load(replay_fp)
+replayed_game = replay.resimulate(mode="gui", verify=True)
+replayed_game.print_scoreboard()
+
+os.remove(replay_fp)
+
+# Round-trip of a game with compact trails: the trail points are float32, the spawn positions must be recorded exactly
+game = AchtungDieKurveGame(mode="headless", target_fps=30, rng_seed=1234, trail_format='compact')
+
+game.spawn_player(1, player_type=NStepPlanPlayer, num_steps=2, dist_per_step=40.0, plan_update_period=0.15)
+for k in range(2,7):
+    game.spawn_player(k, player_type=RandomSteeringAIPlayer)
+
+game.record_replay(keyframe_interval=100)
+game.run_game_loop(close_when_finished=True)
+game.save_replay(replay_fp)
+
+replayed_game = Replay.load(replay_fp).resimulate(mode="headless", verify=True)
+print(f"Compact trail replay re-simulated {replayed_game.current_frame + 1} ticks without divergence")
+
+os.remove(replay_fp)
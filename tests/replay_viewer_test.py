@@ -0,0 +1,39 @@
+import log
+import numpy as np
+
+from game import AchtungDieKurveGame
+from players.aiplayers import RandomSteeringAIPlayer, NStepPlanPlayer
+from replay import ReplayViewer
+
+log.setup_colored_logs('info', do_basic_setup=True)
+
+game = AchtungDieKurveGame(mode="headless", target_fps=30, rng_seed=4321)
+
+game.spawn_player(1, player_type=NStepPlanPlayer, num_steps=2, dist_per_step=40.0, plan_update_period=0.15)
+for k in range(2,5):
+    game.spawn_player(k, player_type=RandomSteeringAIPlayer)
+
+game.record_replay(keyframe_interval=500, record_debug_trails=True)
+game.run_game_loop(close_when_finished=True)
+game.print_scoreboard()
+
+viewer = ReplayViewer(game.replay_recorder.to_replay(), keyframe_interval=100)
+print(f"Seek to last tick took {viewer.seek(viewer.last_tick) * 1000:.2f} ms")
+
+# Seeking in replays of the other trail formats: restored trails keep their format and can be extended
+for trail_format in ['compact', 'segments']:
+    fmt_game = AchtungDieKurveGame(mode="headless", target_fps=30, rng_seed=4321, trail_format=trail_format)
+    fmt_game.spawn_player(1, player_type=NStepPlanPlayer, num_steps=2, dist_per_step=40.0, plan_update_period=0.15)
+    for k in range(2,5):
+        fmt_game.spawn_player(k, player_type=RandomSteeringAIPlayer)
+    fmt_game.record_replay(keyframe_interval=500)
+    fmt_game.run_game_loop(close_when_finished=True)
+
+    fmt_viewer = ReplayViewer(fmt_game.replay_recorder.to_replay(), keyframe_interval=100, mode='headless')
+    for tick in [fmt_viewer.last_tick, fmt_viewer.last_tick // 2, fmt_viewer.last_tick]:
+        fmt_viewer.seek(tick)
+    for p, q in zip(fmt_viewer.game.players, fmt_game.players):
+        assert type(p.trail) is type(q.trail)
+        assert np.array_equal(np.asarray(p.trail), np.asarray(q.trail), equal_nan=True)
+    print(f"Seeking in '{trail_format}' replay reproduced the trails of the recorded game")
+viewer.run()
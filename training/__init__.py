@@ -0,0 +1,2 @@
+from training.vector_env import VectorEnv
+from training.self_play import PolicyPool, SelfPlayLeague
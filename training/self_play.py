@@ -0,0 +1,388 @@
+"""Self-play league: parallel actor processes, a versioned opponent pool and a learner
+
+    league = SelfPlayLeague(num_actors=None)    # one actor per core
+    with league:
+        history = league.run(num_updates=100)
+    weights = league.weights
+
+Actors are long-lived processes with a warm game engine (see evaluation.tournament.get_warm_game). Each game, an
+actor
+
+    1. picks up the current weights of the learner if they have changed (without restarting),
+    2. samples its opponents from the pool: past snapshots of the learner's weights and the built-in AI players,
+    3. plays a headless game with the learner's policy (LinearRaycastPolicy, sampling actions) as player 1 and sends
+       the trajectory of player 1 (observations, actions, per-tick rewards) and the result record to the learner.
+
+Weights are shared through a PolicyPool in shared memory, trajectories through a bounded multiprocessing queue (actors
+wait if the learner falls behind). The learner runs in the main process and updates the weights with REINFORCE
+(policy gradient with discounted returns and normalized advantages); trajectories that were played with weights more
+than `max_staleness` versions old are dropped.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from players.player_base import PlayerAction
+from players.aiplayers import BatchPolicy, LinearRaycastPolicy, NStepPlanPlayer, PolicyPlayer, \
+    RandomSteeringAIPlayer, WallAvoidingAIPlayer
+from remote.shared_state import _attach
+
+logger = logging.getLogger(__name__)
+
+_HEADER_SIZE = 8
+_SEQ, _VERSION, _NUM_SNAPSHOTS, _POOL_SIZE, _NUM_WEIGHTS = range(5)
+
+
+class PolicyPool:
+    """ Versioned policy weights in shared memory: the current weights of the learner and a ring of past snapshots.
+
+    The learner publishes, actors in other processes read. Reads are consistent (seqlock, see remote.shared_state).
+
+    Layout:
+        header      int64[8]                            seq, version, num_snapshots, pool_size, num_weights
+        versions    int64[pool_size]                    version of each snapshot slot
+        current     float32[num_weights]
+        snapshots   float32[pool_size, num_weights]
+    """
+
+    def __init__(self, shape=None, pool_size=8, name=None):
+        """ Creates a pool for weights of shape `shape`, or attaches to the existing pool `name` if no shape is given"""
+        if shape is None:
+            self.shm = _attach(name)
+            header = np.ndarray((_HEADER_SIZE,), dtype=np.int64, buffer=self.shm.buf)
+            pool_size, num_weights = int(header[_POOL_SIZE]), int(header[_NUM_WEIGHTS])
+            self.owner = False
+        else:
+            num_weights = int(np.prod(shape))
+            size = 8 * (_HEADER_SIZE + pool_size) + 4 * num_weights * (pool_size + 1)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.owner = True
+
+        offset = 0
+        arrays = []
+        for dtype, array_shape in [(np.int64, (_HEADER_SIZE,)), (np.int64, (pool_size,)),
+                                   (np.float32, (num_weights,)), (np.float32, (pool_size, num_weights))]:
+            arrays.append(np.ndarray(array_shape, dtype=dtype, buffer=self.shm.buf, offset=offset))
+            offset += arrays[-1].nbytes
+        self.header, self.versions, self.current, self.snapshots = arrays
+        self.pool_size = pool_size
+        if self.owner:
+            self.header[:] = 0
+            self.header[_POOL_SIZE], self.header[_NUM_WEIGHTS] = pool_size, num_weights
+            self.versions[:] = -1
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def version(self):
+        return int(self.header[_VERSION])
+
+    def close(self):
+        self.header = self.versions = self.current = self.snapshots = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def publish(self, weights, snapshot=False):
+        """ Make `weights` the current weights (new version) and optionally add them to the snapshots. Returns the
+        new version."""
+        header = self.header
+        header[_SEQ] += 1
+        version = int(header[_VERSION]) + 1
+        self.current[:] = np.ravel(weights)
+        header[_VERSION] = version
+        if snapshot:
+            slot = int(header[_NUM_SNAPSHOTS]) % self.pool_size
+            self.snapshots[slot] = self.current
+            self.versions[slot] = version
+            header[_NUM_SNAPSHOTS] += 1
+        header[_SEQ] += 1
+        return version
+
+    def _read(self, read):
+        while True:
+            seq = self.header[_SEQ]
+            if seq % 2 == 0:
+                result = read()
+                if self.header[_SEQ] == seq:
+                    return result
+            time.sleep(0)
+
+    def latest(self):
+        """ Version and copy of the current weights (flat)"""
+        return self._read(lambda: (int(self.header[_VERSION]), self.current.copy()))
+
+    def snapshot_versions(self):
+        return [int(v) for v in self._read(self.versions.copy) if v >= 0]
+
+    def snapshot(self, version):
+        """ Copy of the weights of snapshot `version` (flat), None if it is no longer in the pool"""
+        def read():
+            slots = np.flatnonzero(self.versions == version)
+            return self.snapshots[slots[0]].copy() if len(slots) > 0 else None
+        return self._read(read)
+
+
+class _TrajectoryRecorder(BatchPolicy):
+    """ Wraps the learner's policy in an actor and records observations, actions and rewards of its player. Also a
+    tick observer: the reward of a tick is the change of the player's total reward."""
+
+    def __init__(self, policy, player_idx=1):
+        super().__init__(num_rays=policy.num_rays, fov=policy.fov, max_range=policy.max_range)
+        self.policy = policy
+        self.player_idx = player_idx
+        self._observations, self._actions, self._rewards = [], [], []
+        self._total_reward = 0.
+
+    def __str__(self):
+        return str(self.policy)
+
+    def observe(self, game, players):
+        return self.policy.observe(game, players)
+
+    def act(self, observations):
+        actions = self.policy.act(observations)
+        self._observations.append(observations)
+        self._actions.append(actions)
+        return actions
+
+    def on_tick(self, game):
+        if len(self._rewards) < len(self._actions):
+            p = [p for p in game.players if p.idx == self.player_idx][0]
+            self._rewards.append(p.total_reward - self._total_reward)
+            self._total_reward = p.total_reward
+
+    def trajectory(self):
+        num_rays = self.policy.num_rays
+        return dict(observations=np.concatenate(self._observations) if self._observations
+                    else np.empty((0, num_rays), dtype=np.float32),
+                    actions=np.concatenate(self._actions).astype(np.int8) if self._actions else np.empty(0, np.int8),
+                    rewards=np.asarray(self._rewards, dtype=np.float32))
+
+
+def _sample_opponents(rng, pool, config):
+    """ Opponent settings (see evaluation.tournament.spawn_players) and their names"""
+    snapshots = pool.snapshot_versions()
+    opponents, names = [], []
+    for _ in range(config['num_opponents']):
+        weights = None
+        if len(snapshots) > 0 and rng.random() >= config['builtin_prob']:
+            version = snapshots[rng.integers(len(snapshots))]
+            weights = pool.snapshot(version)
+        if weights is not None:
+            policy = LinearRaycastPolicy(weights=weights.reshape(3, -1), num_rays=config['num_rays'])
+            opponents.append(dict(type=PolicyPlayer, kwargs=dict(policy=policy, name=f"v{version}")))
+            names.append(f"v{version}")
+        else:
+            player_type = config['builtin_opponents'][rng.integers(len(config['builtin_opponents']))]
+            opponents.append(dict(type=player_type, kwargs={}))
+            names.append(player_type.__name__)
+    return opponents, names
+
+
+def _actor_main(actor_id, pool_name, trajectories, stop, config, log_level):
+    from evaluation.tournament import _init_worker, get_warm_game, spawn_players, summarize_game
+
+    _init_worker(log_level)
+    pool = PolicyPool(name=pool_name)
+    rng = np.random.default_rng([config['seed'], actor_id])
+    policy = LinearRaycastPolicy(weights=np.zeros((3, config['num_rays'])), num_rays=config['num_rays'],
+                                 temperature=config['temperature'], rng=rng)
+    version = None
+    num_games = 0
+    try:
+        while not stop.is_set():
+            latest, weights = pool.latest()
+            if latest != version:
+                policy.weights = weights.reshape(policy.weights.shape)
+                version = latest
+
+            opponents, names = _sample_opponents(rng, pool, config)
+            seed = int(rng.integers(2**31))
+            t0 = time.perf_counter()
+            game = get_warm_game(dict(config['game_settings'], rng_seed=seed))
+            recorder = _TrajectoryRecorder(policy)
+            spawn_players(game, dict(type=PolicyPlayer, kwargs=dict(policy=recorder)), opponents)
+            game.add_tick_observer(recorder)
+            game.run_game_loop(close_when_finished=False)
+
+            item = dict(recorder.trajectory(), version=version, actor_id=actor_id, opponents=names,
+                        result=summarize_game(game, wall_time=time.perf_counter() - t0))
+            # Wait for the learner, but do not block shutdown
+            while not stop.is_set():
+                try:
+                    trajectories.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            num_games += 1
+    finally:
+        pool.close()
+        logger.debug(f"Actor {actor_id} stopped after {num_games} games")
+
+
+class SelfPlayLeague:
+    """ Trains a LinearRaycastPolicy by self-play: actor processes generate games, the learner updates the weights"""
+
+    def __init__(self, num_actors=None, num_opponents=2, builtin_opponents=(RandomSteeringAIPlayer,
+                 WallAvoidingAIPlayer, NStepPlanPlayer), builtin_prob=0.25, pool_size=8, snapshot_interval=5,
+                 games_per_update=16, learning_rate=0.05, discount=0.99, temperature=1., num_rays=16,
+                 max_staleness=2, game_settings=None, seed=0, log_level=logging.WARNING, start_method=None):
+        """
+
+        Args:
+            num_actors (int): number of actor processes, defaults to the number of cores
+            num_opponents (int): opponents per game (at most 5)
+            builtin_opponents: AI player types that can be sampled as opponents
+            builtin_prob (float): probability that an opponent is a built-in player instead of a snapshot
+            pool_size (int): number of past snapshots kept in the pool
+            snapshot_interval (int): every `snapshot_interval` updates, the weights are added to the pool
+            games_per_update (int): number of trajectories per learner update
+            learning_rate (float): step size of the policy gradient update
+            discount (float): discount factor of the returns
+            temperature (float): sampling temperature of the learner's policy in the actors
+            num_rays (int): ray-cast observations of the policy
+            max_staleness (int): trajectories of older weights versions are dropped
+            game_settings (dict): settings of the games (AchtungDieKurveGame kwargs, without the seed)
+            seed (int): seed of the initial weights and of the actors
+            log_level: log level inside the actors
+            start_method (str): multiprocessing start method, defaults to the platform default
+        """
+        self.num_actors = os.cpu_count() if num_actors is None else num_actors
+        self.games_per_update = games_per_update
+        self.learning_rate = learning_rate
+        self.discount = discount
+        self.snapshot_interval = snapshot_interval
+        self.max_staleness = max_staleness
+        self.policy = LinearRaycastPolicy(num_rays=num_rays, temperature=temperature, rng=np.random.default_rng(seed))
+        self.policy.weights *= 0.1
+
+        self.pool = PolicyPool(shape=self.policy.weights.shape, pool_size=pool_size)
+        self.pool.publish(self.policy.weights, snapshot=True)
+        self.num_updates = 0
+        self.num_dropped = 0
+        self.history = []
+
+        config = dict(num_opponents=num_opponents, builtin_opponents=tuple(builtin_opponents),
+                      builtin_prob=builtin_prob, num_rays=num_rays, temperature=temperature, seed=seed,
+                      game_settings=dict(game_settings or {}))
+        ctx = multiprocessing.get_context(start_method)
+        self.trajectories = ctx.Queue(maxsize=2 * self.num_actors)
+        self._stop = ctx.Event()
+        self.actors = [ctx.Process(target=_actor_main, args=(k, self.pool.name, self.trajectories, self._stop, config,
+                                                             log_level), daemon=True)
+                       for k in range(self.num_actors)]
+        for actor in self.actors:
+            actor.start()
+
+    @property
+    def weights(self):
+        return self.policy.weights
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self, timeout=10.):
+        """ Stop the actors after their current game and release the pool"""
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for actor in self.actors:
+            # Drain the queue, actors can not finish while their last put is pending
+            while actor.is_alive() and time.monotonic() < deadline:
+                self._drain()
+                actor.join(timeout=0.1)
+            if actor.is_alive():
+                actor.kill()
+                actor.join()
+        self._drain()
+        self.actors = []
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def terminate(self):
+        """ Kill the actors immediately"""
+        for actor in self.actors:
+            actor.kill()
+            actor.join()
+        self.actors = []
+        self.close()
+
+    def _drain(self):
+        try:
+            while True:
+                self.trajectories.get_nowait()
+        except queue.Empty:
+            pass
+
+    def collect(self, num_games, timeout=None):
+        """ Wait for `num_games` trajectories that were played with recent weights (see max_staleness)"""
+        batch = []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(batch) < num_games:
+            if not any(actor.is_alive() for actor in self.actors):
+                raise RuntimeError("All actors have stopped")
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Received {len(batch)} of {num_games} trajectories within {timeout} s")
+            try:
+                item = self.trajectories.get(timeout=1.)
+            except queue.Empty:
+                continue
+            if item['version'] < self.pool.version - self.max_staleness:
+                self.num_dropped += 1
+                continue
+            batch.append(item)
+        return batch
+
+    def update(self, batch):
+        """ REINFORCE update of the weights with the trajectories of `batch`. Publishes the new weights."""
+        observations, actions, returns = [], [], []
+        for item in batch:
+            rewards = item['rewards'][:len(item['actions'])]
+            g = np.zeros(len(rewards), dtype=np.float32)
+            running = 0.
+            for t in range(len(rewards) - 1, -1, -1):
+                running = rewards[t] + self.discount * running
+                g[t] = running
+            observations.append(item['observations'][:len(g)])
+            actions.append(item['actions'][:len(g)])
+            returns.append(g)
+        observations, actions, returns = np.concatenate(observations), np.concatenate(actions), np.concatenate(returns)
+
+        if len(returns) > 0:
+            advantages = (returns - returns.mean()) / (returns.std() + 1e-8)
+            # Gradient of log softmax(scores / T) w.r.t. the weights
+            one_hot = np.eye(3, dtype=np.float32)[actions.astype(np.intp) - PlayerAction.SteerLeft]
+            delta = (one_hot - self.policy.probabilities(observations)) / self.policy.temperature
+            grad = (advantages[:, np.newaxis] * delta).T @ observations / len(returns)
+            self.policy.weights = self.policy.weights + self.learning_rate * grad.astype(np.float32)
+
+        self.num_updates += 1
+        version = self.pool.publish(self.policy.weights, snapshot=self.num_updates % self.snapshot_interval == 0)
+        agents = [[p for p in item['result']['players'] if p['idx'] == 1][0] for item in batch]
+        stats = dict(version=version, num_games=len(batch), num_steps=len(returns),
+                     mean_return=float(np.mean([item['rewards'].sum() for item in batch])),
+                     win_rate=float(np.mean([item['result']['winner'] == 1 for item in batch])),
+                     mean_ticks_survived=float(np.mean([p['ticks_survived'] for p in agents])),
+                     num_dropped=self.num_dropped)
+        self.history.append(stats)
+        return stats
+
+    def run(self, num_updates, timeout=None):
+        """ Collect trajectories and update the weights `num_updates` times. Returns the statistics of the updates."""
+        for _ in range(num_updates):
+            stats = self.update(self.collect(self.games_per_update, timeout=timeout))
+            logger.info(f"Update {self.num_updates}: version {stats['version']}, mean return "
+                        f"{stats['mean_return']:.1f}, win rate {stats['win_rate']:.2f}, "
+                        f"{stats['mean_ticks_survived']:.0f} ticks survived")
+        return self.history[-num_updates:]
@@ -0,0 +1,87 @@
+"""Vectorized environment: several games that are advanced in lockstep
+
+Every tick, each BatchPolicy is queried once with the stacked observations of its PolicyPlayers in all running games
+(instead of once per game, see AchtungDieKurveGame.apply_ai_actions). The actions are split up again and passed to
+the games, other AI players are queried by their games as usual. Note that players which use numpy's global RNG (e.g.
+RandomSteeringAIPlayer) draw in a different order than in games that run one after another.
+
+Usage:
+    policy = LinearRaycastPolicy()
+
+    def make_game(seed):
+        game = AchtungDieKurveGame(mode="headless", rng_seed=seed)
+        for idx in range(1, 4):
+            game.spawn_player(idx, player_type=PolicyPlayer, policy=policy)
+        return game
+
+    games = VectorEnv(make_game, seeds=range(16)).run()
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class VectorEnv:
+    """ Advances several games in lockstep and batches the policy queries across games"""
+
+    def __init__(self, make_game, seeds):
+        """
+
+        Args:
+            make_game: function(seed) -> AchtungDieKurveGame with spawned players
+            seeds: one seed per game
+        """
+        self.make_game = make_game
+        self.seeds = list(seeds)
+        self.games = []
+        self.num_ticks = 0
+        self.num_policy_calls = 0
+        self.reset()
+
+    def reset(self, seeds=None):
+        """ Create new games (for `seeds`, by default the previous seeds). Returns the games."""
+        if seeds is not None:
+            self.seeds = list(seeds)
+        self.games = [self.make_game(seed) for seed in self.seeds]
+        for game in self.games:
+            game.running = True
+        self.num_ticks = 0
+        return self.games
+
+    @property
+    def running_games(self):
+        return [game for game in self.games if game.running]
+
+    def policy_actions(self, games):
+        """ Query every policy once for its players in all `games`. Returns one dict (idx -> action) per game."""
+        groups = {}     # policy -> [(game index, players)]
+        for k, game in enumerate(games):
+            for policy, players in game.policy_groups().items():
+                groups.setdefault(policy, []).append((k, players))
+
+        actions = [{} for _ in games]
+        for policy, entries in groups.items():
+            observations = np.concatenate([policy.observe(games[k], players) for k, players in entries])
+            policy_actions = iter(policy.act(observations))
+            self.num_policy_calls += 1
+            for k, players in entries:
+                for p in players:
+                    actions[k][p.idx] = next(policy_actions)
+        return actions
+
+    def step(self):
+        """ Advance all running games by one tick. Returns the number of games that are still running."""
+        games = self.running_games
+        for game, actions in zip(games, self.policy_actions(games)):
+            game._timed_tick(actions)
+        self.num_ticks += 1
+        return len(self.running_games)
+
+    def run(self, max_ticks=None):
+        """ Step until all games are finished (or for at most `max_ticks` ticks). Returns the games."""
+        while len(self.running_games) > 0 and (max_ticks is None or self.num_ticks < max_ticks):
+            self.step()
+        logger.info(f"{len(self.games)} games after {self.num_ticks} ticks, {self.num_policy_calls} policy calls")
+        return self.games